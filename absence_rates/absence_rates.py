@@ -1,5 +1,6 @@
 import pandas as pd
 import logging
+from aggregation import sum_by_groups
 
 logger = logging.getLogger(__name__)
 
@@ -68,8 +69,7 @@ def agg_all_england(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the all England aggregation")
 
-    df_agg = (df.groupby('ENGLAND_WALES', as_index=False)
-            .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df, 'ENGLAND_WALES', cols_to_aggregate)
             .rename({'ENGLAND_WALES': 'BREAKDOWN_VALUE_1'}, axis=1))
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
@@ -97,8 +97,7 @@ def agg_regions(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the regional aggregation")
 
-    df_agg = (df.groupby(['NHSE_REGION_CODE', 'NHSE_REGION_NAME'], as_index=False)
-            .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df, ['NHSE_REGION_CODE', 'NHSE_REGION_NAME'], cols_to_aggregate)
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
     df_agg['BREAKDOWN_VALUE'] = df_agg['NHSE_REGION_NAME']
@@ -122,8 +121,7 @@ def agg_major_staff_groups(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the major staff group aggregation")
 
-    df_agg = (df.groupby('MAIN_STAFF_GROUP_NAME', as_index=False)
-            .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df, 'MAIN_STAFF_GROUP_NAME', cols_to_aggregate)
             .rename({'MAIN_STAFF_GROUP_NAME': 'BREAKDOWN_VALUE'}, axis=1))
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
@@ -149,8 +147,7 @@ def agg_minor_staff_groups(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the minor staff group aggregation")
 
-    df_agg = (df.groupby('STAFF_GROUP_1_NAME', as_index=False)
-            .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df, 'STAFF_GROUP_1_NAME', cols_to_aggregate)
             .rename({'STAFF_GROUP_1_NAME': 'BREAKDOWN_VALUE'}, axis=1))
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
@@ -176,8 +173,7 @@ def agg_medical_staff_grades(df, cols_to_aggregate, cols_order):
      """
     logger.info("Producing the staff grade aggregation")
 
-    df_agg = (df.groupby(['STAFF_GROUP_1_NAME', 'GRADE'], as_index=False)
-            .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df, ['STAFF_GROUP_1_NAME', 'GRADE'], cols_to_aggregate)
             .rename({'GRADE': 'BREAKDOWN_VALUE'}, axis=1))
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
@@ -205,8 +201,7 @@ def agg_cluster_groups(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the cluster group aggregation")
 
-    df_agg = (df.groupby(['CLUSTER_GROUP'], as_index=False)
-                .agg(cols_to_aggregate)\
+    df_agg = (sum_by_groups(df, ['CLUSTER_GROUP'], cols_to_aggregate)
                 .rename({'CLUSTER_GROUP': 'BREAKDOWN_VALUE'}, axis=1))
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
@@ -235,8 +230,7 @@ def agg_reporting_orgs(df, cols_to_aggregate, month_date):
     cols_order = ['DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME',  'ORG_CODE', 'ORG_NAME', 'CLUSTER_GROUP',
                    'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE', 'SICKNESS_ABSENCE_RATE_PERCENT']
 
-    df_agg = (df.groupby(['NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'ORG_NAME', 'CLUSTER_GROUP'], as_index=False)
-                .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df, ['NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'ORG_NAME', 'CLUSTER_GROUP'], cols_to_aggregate)
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
     df_agg['DATE'] = month_date
@@ -0,0 +1,61 @@
+"""
+Aggregation shared by the breakdown modules.
+
+Every breakdown in the publication is a sum of FTE_DAYS_LOST, FTE_DAYS_AVAILABLE and
+(for COVID) FTE_DAYS_LOST_COVID over a set of group keys. sum_by_groups is the one
+groupby they all call, with the options the categorical group keys need (see
+reference_data.encode_categoricals).
+"""
+
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Category standing in for missing categorical keys while they are grouped with dropna=False
+MISSING_CATEGORY = '__MISSING__'
+
+
+def sum_by_groups(df, group_cols, cols_to_aggregate, dropna=True):
+    """
+    Creates a function to sum columns over group keys
+
+    Only the observed key combinations are kept and the groups are sorted by the keys. Rows
+    with a missing key are dropped and missing values are summed as zero, as groupby does.
+
+    dropna=False keeps missing keys as their own group, sorted last, which is needed when the
+    result is added to other sums (see rolling_rates.sum_rolling_frames). pandas 1.5 drops
+    missing categorical keys even with dropna=False, so they are grouped as a category of
+    their own and set back to missing afterwards.
+
+    Inputs:
+        df: dataframe derived from the SQL Server query
+        group_cols: column name, or list of column names, to group by
+        cols_to_aggregate: dict of column name to aggregation, e.g. {'FTE_DAYS_LOST': 'sum'}
+        dropna: whether to drop groups with a missing key, as in DataFrame.groupby
+
+    Output:
+        A dataframe with one row per observed group, sorted by the group keys, containing
+        the group columns followed by the aggregated columns
+    """
+    if isinstance(group_cols, str):
+        group_cols = [group_cols]
+
+    missing_categories = []
+    if not dropna:
+        missing_categories = [col for col in group_cols
+                              if isinstance(df[col].dtype, pd.CategoricalDtype) and df[col].isna().any()]
+    if missing_categories:
+        df = df[group_cols + list(cols_to_aggregate)].assign(**{
+            col: df[col].cat.add_categories(MISSING_CATEGORY).fillna(MISSING_CATEGORY) for col in missing_categories})
+
+    grouped = df.groupby(group_cols, as_index=False, observed=True, dropna=dropna, sort=True)
+    if all(func == 'sum' for func in cols_to_aggregate.values()):
+        df_agg = grouped[list(cols_to_aggregate)].sum()
+    else:
+        df_agg = grouped.agg(cols_to_aggregate)
+
+    for col in missing_categories:
+        df_agg[col] = df_agg[col].cat.remove_categories(MISSING_CATEGORY)
+
+    return df_agg
@@ -1,5 +1,7 @@
 import pandas as pd
 import logging
+from aggregation import sum_by_groups
+from reference_data import add_latest_org_details, classify_occupation_codes
 
 logger = logging.getLogger(__name__)
 
@@ -90,8 +92,7 @@ def all_staff_agg(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the all staff benchmarking orgs aggregation")
 
-    df_agg = (df.groupby('ORG_CODE', as_index=False)
-    .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df, 'ORG_CODE', cols_to_aggregate)
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
     df_agg['NHSE_REGION_CODE'] = pd.NA
@@ -119,8 +120,7 @@ def medical_agg(df, cols_to_aggregate, cols_order):
 
     df_filtered = df[(df['STAFF_GROUP_1_NAME'].isin(['HCHS Doctors']))]
 
-    df_agg = (df_filtered.groupby('ORG_CODE', as_index=False)
-            .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df_filtered, 'ORG_CODE', cols_to_aggregate)
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
     df_agg['NHSE_REGION_CODE'] = pd.NA
@@ -135,7 +135,8 @@ def non_med_agg(df, cols_to_aggregate, cols_order):
     Creates a function to produce a dataframe of absence days available/ lost/ rates a non medical staff group level for each organisation    
     
     Inputs:
-        df: dataframe derived from the SQL Server query
+        df: dataframe derived from the SQL Server query. Uses the OCCUPATION_CLASS column added by agg_benchmarking_orgs
+        if it is there, otherwise the occupation codes are classified here.
         cols_to_aggregate: contains the sum of WTE_DAYS_SICK_THIS_MONTH and the sum of WTE_DAYS_AVAILABLE.
         cols_order: Defined in the function create_benchmarking_tool as 'DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'ORG_NAME', 
         'CLUSTER_GROUP', 'BENCHMARK_GROUP','STAFF_GROUP', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE', 'SICKNESS_ABSENCE_RATE_PERCENT']
@@ -146,10 +147,12 @@ def non_med_agg(df, cols_to_aggregate, cols_order):
     """
     logger.info("Producing the non medical staff benchmarking orgs aggregation")
 
-    df_filtered = df[df['OCCUPATION_CODE'].str.contains('[A-Z]')]
+    if 'OCCUPATION_CLASS' not in df.columns:
+        df = df.assign(OCCUPATION_CLASS=classify_occupation_codes(df['OCCUPATION_CODE']))
+
+    df_filtered = df[df['OCCUPATION_CLASS'] == 'NON_MEDICAL']
 
-    df_agg = (df_filtered.groupby(['ORG_CODE', 'STAFF_GROUP_1_NAME'], as_index=False)
-            .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df_filtered, ['ORG_CODE', 'STAFF_GROUP_1_NAME'], cols_to_aggregate)
             .rename({'STAFF_GROUP_1_NAME': 'STAFF_GROUP'}, axis=1))
 
     df_agg['SICKNESS_ABSENCE_RATE_PERCENT'] = round(df_agg['FTE_DAYS_LOST'] / df_agg['FTE_DAYS_AVAILABLE'] * 100, 2)
@@ -176,6 +179,10 @@ def agg_benchmarking_orgs(df):
 
     cols_order = ['ORG_CODE', 'STAFF_GROUP', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE', 'SICKNESS_ABSENCE_RATE_PERCENT']
 
+    # classify each distinct occupation code once, rather than running a regex over every row.
+    # assign works on a copy, so the caller's dataframe is not changed
+    df = df.assign(OCCUPATION_CLASS=classify_occupation_codes(df['OCCUPATION_CODE']))
+
     all_staff_groups = all_staff_agg(df, cols_to_aggregate, cols_order)
     medical_groups = medical_agg(df, cols_to_aggregate, cols_order)
     non_medical_groups = non_med_agg(df, cols_to_aggregate, cols_order)
@@ -186,13 +193,13 @@ def agg_benchmarking_orgs(df):
 
     return df
 
-def create_benchmarking_tool(df, df_query, month_date):
+def create_benchmarking_tool(df, org_lookup, month_date):
     """
     Creates a function that produces the final dataframe for the benchmarking tool csv output
     
     Inputs:
         df: dataframe derived from the SQL Server query
-        df_query: a table containing the latest org names produced as a result of the sql_latest_org_name function
+        org_lookup: the latest org details from the sql_latest_org_name query, as returned by reference_data.build_latest_org_lookup
         month_date: month_date as defined in config.toml file
         
     Outputs: 
@@ -205,8 +212,9 @@ def create_benchmarking_tool(df, df_query, month_date):
     'CLUSTER_GROUP', 'BENCHMARK_GROUP','STAFF_GROUP', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE', 'SICKNESS_ABSENCE_RATE_PERCENT']
     
     df['DATE'] = month_date
-    # join the two dfs
-    benchmarking_csv_outputs = df.merge(df_query, how='inner', on='ORG_CODE')
+    # join to the latest org details
+    benchmarking_csv_outputs = add_latest_org_details(df, org_lookup, ['NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_NAME',
+                                                                        'CLUSTER_GROUP', 'BENCHMARK_GROUP'])
     benchmarking_csv_outputs = benchmarking_csv_outputs[cols_order]
     # suppress the data
     benchmarking_csv_outputs.loc[(benchmarking_csv_outputs["FTE_DAYS_AVAILABLE"] <= 330), "SICKNESS_ABSENCE_RATE_PERCENT"] = ''
@@ -214,3 +222,51 @@ def create_benchmarking_tool(df, df_query, month_date):
     benchmarking_csv_outputs.loc[(benchmarking_csv_outputs["FTE_DAYS_AVAILABLE"] <= 330), "FTE_DAYS_AVAILABLE"] = ''
 
     return benchmarking_csv_outputs
+
+def create_benchmark_group_comparators(df):
+    """
+    Creates a function that produces each organisation's position within its benchmark group
+
+    For every BENCHMARK_GROUP and STAFF_GROUP the percentile bands of the sickness absence rate
+    are calculated with one grouped quantile, and each organisation is ranked within its group
+    with one grouped rank, rather than looping over the organisations. Rank 1 is the lowest
+    absence rate. Suppressed rates, and organisations without a benchmark group, are left out
+    of the bands and the ranks. If no rates are left an empty dataframe is returned.
+
+    Inputs:
+        df: the final benchmarking tool dataframe, as returned by create_benchmarking_tool
+
+    Outputs:
+        Produces a dataframe with one row per organisation and staff group, containing the
+        rate, its rank and percentile within the group and the group's percentile bands
+    """
+    logger.info("Calculating the benchmark group comparators")
+
+    group_cols = ['BENCHMARK_GROUP', 'STAFF_GROUP']
+    bands = {'GROUP_P10': 0.1, 'GROUP_P25': 0.25, 'GROUP_MEDIAN': 0.5, 'GROUP_P75': 0.75, 'GROUP_P90': 0.9}
+    cols_order = ['DATE', 'BENCHMARK_GROUP', 'STAFF_GROUP', 'ORG_CODE', 'ORG_NAME', 'SICKNESS_ABSENCE_RATE_PERCENT',
+                'GROUP_RANK', 'GROUP_ORGS', 'GROUP_PERCENTILE'] + list(bands)
+
+    df = df[['DATE', 'BENCHMARK_GROUP', 'STAFF_GROUP', 'ORG_CODE', 'ORG_NAME', 'SICKNESS_ABSENCE_RATE_PERCENT']].copy()
+    # suppressed rates are blank strings in the benchmarking tool output
+    df['SICKNESS_ABSENCE_RATE_PERCENT'] = pd.to_numeric(df['SICKNESS_ABSENCE_RATE_PERCENT'], errors='coerce')
+    df = df.dropna(subset=group_cols + ['SICKNESS_ABSENCE_RATE_PERCENT'])
+    if df.empty:
+        logger.warning("No unsuppressed rates with a benchmark group, the benchmark group comparators are empty")
+        return pd.DataFrame(columns=cols_order)
+
+    rates = df.groupby(group_cols)['SICKNESS_ABSENCE_RATE_PERCENT']
+    df['GROUP_RANK'] = rates.rank(method='min').astype(int)
+    df['GROUP_ORGS'] = rates.transform('size')
+    # the percentage of orgs in the group with the same or a lower rate
+    df['GROUP_PERCENTILE'] = round(rates.rank(method='max', pct=True) * 100, 1)
+
+    df_bands = rates.quantile(list(bands.values())).unstack()
+    df_bands.columns = list(bands)
+    df_bands = round(df_bands, 2).reset_index()
+
+    df = (df.merge(df_bands, how='left', on=group_cols)
+            .sort_values(group_cols + ['GROUP_RANK', 'ORG_CODE'])
+            .reset_index(drop=True))
+
+    return df[cols_order]
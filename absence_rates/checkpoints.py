@@ -0,0 +1,81 @@
+"""
+Checkpoints of the extraction queries, so a failed run can be resumed without repeating them.
+
+If checkpoint_dir is set in config.toml, the result of each query is saved as soon as it
+has been extracted, to <checkpoint_dir>/<start_date>/<name>_<query hash>.arrow (an Arrow
+IPC file, see intermediates.py). When the run is started again with --resume, the queries
+that already have a checkpoint are read back from it and only the rest are sent to the
+database. The hash of the query text is in the file name, so a checkpoint is never reused
+for a query that has changed (e.g. after correcting a table name in config.toml).
+"""
+
+import hashlib
+import logging
+from pathlib import Path
+from intermediates import get_intermediate_path, write_intermediate, read_intermediate
+
+logger = logging.getLogger(__name__)
+
+
+def get_checkpoint_dir(config):
+    """
+    Creates a function to find the checkpoint folder for the month in config.toml
+
+    Output:
+        The path of the checkpoint folder, or None if checkpoint_dir is not set in config.toml
+    """
+    if not config.get('checkpoint_dir'):
+        return None
+
+    return Path(config['checkpoint_dir']) / config['start_date']
+
+
+def get_checkpoint_name(name, query):
+    """
+    Creates a function to name the checkpoint of a query
+
+    Inputs:
+        name: name of the extract, e.g. 'base_absence_data'
+        query: string containing the SQL Server query
+
+    Output:
+        The name followed by the first 16 characters of the query's SHA-256 hash
+    """
+    return f"{name}_{hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]}"
+
+
+def with_checkpoints(run_query, checkpoint_dir, resume=False):
+    """
+    Wraps a function like get_df_from_sql so the result of each query is saved to a checkpoint
+
+    Inputs:
+        run_query: function called as run_query(database, query)
+        checkpoint_dir: the month's checkpoint folder, from get_checkpoint_dir. None to not save checkpoints.
+        resume: read the queries that have a checkpoint from it rather than running them again
+
+    Output:
+        function called as run_query(database, query, name), where name names the checkpoint
+        file ('query' if it is left out)
+    """
+    if resume and checkpoint_dir is None:
+        raise ValueError("Set checkpoint_dir in config.toml to resume a run")
+
+    def run_checkpointed_query(database, query, name='query'):
+        if checkpoint_dir is None:
+            return run_query(database, query)
+
+        checkpoint_name = get_checkpoint_name(name, query)
+        if resume and get_intermediate_path(checkpoint_dir, checkpoint_name).exists():
+            logger.info(f"Resuming {name} from its checkpoint")
+            return read_intermediate(checkpoint_dir, checkpoint_name)
+
+        df = run_query(database, query)
+        try:
+            write_intermediate(df, checkpoint_dir, checkpoint_name)
+        except Exception as ex:
+            # the run carries on without this checkpoint, a resumed run would extract it again
+            logger.warning(f"Could not save the checkpoint of {name}: {ex}")
+
+        return df
+
+    return run_checkpointed_query
@@ -1,28 +1,71 @@
-import sqlalchemy as sa
+import re
+import time
 import pandas as pd
 import logging
+import xml.etree.ElementTree as ET
 
 
 logger = logging.getLogger(__name__)
 
-def get_df_from_sql(database, query) -> pd.DataFrame:
+SHOWPLAN_NAMESPACE = {'sp': 'http://schemas.microsoft.com/sqlserver/2004/07/showplan'}
+
+# ODBC SQLSTATEs of errors that can go away if the query is sent again: lost or refused
+# connections, timeouts and the query being chosen as a deadlock victim
+TRANSIENT_SQLSTATES = ['08S01', '08001', '08004', '08007', 'HYT00', 'HYT01', '40001']
+
+def get_df_from_sql(database, query, statistics=False) -> pd.DataFrame:
     """
     Uses sqlalchemy to connect to the NHSD server and database with the help
     of mssql and pyodbc packages
 
+    The time to execute the query, fetch its rows and convert them to a dataframe, and the
+    size of the dataframe, are added to the run's extraction report (see extraction_report.py).
+
     Inputs:
         server: server name
         database: database name
         query: string containing a sql query
+        statistics: also record SQL Server's SET STATISTICS IO, TIME output for the query
 
     Output:
         pandas Dataframe
     """
-    conn = sa.create_engine(f"xxx", fast_executemany=True)
-    conn.execution_options(autocommit=True)
+    import sqlalchemy as sa
+    from extraction_report import parse_statistics_messages, record_query
+
+    conn = sa.create_engine(f"xxx", fast_executemany=True).raw_connection()
     logger.info(f"Getting dataframe from SQL database {database}")
-    logger.info(f"Running query:\n\n {query}")
-    df = pd.read_sql_query(query, conn)
+    logger.debug("Running query:\n\n %s", query)
+    try:
+        cursor = conn.cursor()
+        if statistics:
+            cursor.execute("SET STATISTICS IO, TIME ON")
+
+        start_time = time.perf_counter()
+        cursor.execute(query)
+        execute_time = time.perf_counter()
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+        fetch_time = time.perf_counter()
+
+        # SQL Server sends the statistics as messages with the rows and after them
+        messages = []
+        while statistics:
+            messages += [message for _, message in cursor.messages]
+            if not cursor.nextset():
+                break
+    finally:
+        conn.close()
+
+    # as pd.read_sql_query converts the rows
+    convert_start_time = time.perf_counter()
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    convert_time = time.perf_counter() - convert_start_time
+
+    if statistics:
+        logger.debug("Query statistics:\n\n %s", '\n'.join(messages))
+    record_query('sql', database, query, df, execute_time - start_time, fetch_time - execute_time, convert_time,
+                 parse_statistics_messages(messages) if statistics else None)
     return df
 
 def execute_sql(database, query) -> None:
@@ -36,5 +79,102 @@ def execute_sql(database, query) -> None:
     Output:
         Runs a SQL Server query
     """
+    import sqlalchemy as sa
+
     conn = sa.create_engine(f"xxx", fast_executemany=True)
-    conn.execute(query)
\ No newline at end of file
+    conn.execute(query)
+
+def get_estimated_plan(database, query) -> dict:
+    """
+    Asks SQL Server for the estimated plan of a query, without running it
+
+    Inputs:
+        database: database name
+        query: string containing a sql query
+
+    Output:
+        dict of the estimated ROWS and COLUMNS and the estimated BYTES returned, from the plan's
+        row count and average row size, and the optimiser's estimated COST
+    """
+    import sqlalchemy as sa
+
+    conn = sa.create_engine(f"xxx", fast_executemany=True).raw_connection()
+    logger.debug("Getting the estimated plan of:\n\n %s", query)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET SHOWPLAN_XML ON")
+        cursor.execute(query)
+        plan = ET.fromstring(cursor.fetchone()[0])
+        cursor.execute("SET SHOWPLAN_XML OFF")
+    finally:
+        conn.close()
+
+    statement = plan.find('.//sp:StmtSimple', SHOWPLAN_NAMESPACE)
+    root_operator = statement.find('.//sp:RelOp', SHOWPLAN_NAMESPACE)
+    rows = float(statement.get('StatementEstRows', 0))
+    columns = root_operator.findall('./sp:OutputList/sp:ColumnReference', SHOWPLAN_NAMESPACE)
+
+    return {'ROWS': int(rows), 'COLUMNS': len(columns),
+            'BYTES': int(rows * float(root_operator.get('AvgRowSize', 0))),
+            'COST': float(statement.get('StatementSubTreeCost', 0))}
+
+def find_missing_sql_tables(database, tables) -> list:
+    """
+    Finds which tables are not in the SQL Server database
+
+    Inputs:
+        database: database name
+        tables: list of table names
+
+    Output:
+        list of the tables that do not exist
+    """
+    names = ', '.join("'" + table.replace("'", "''") + "'" for table in tables)
+    df = get_df_from_sql(database, f"select [name] from [{database}].sys.tables where [name] in ({names})")
+    return [table for table in tables if table not in set(df['name'])]
+
+def is_transient_error(ex) -> bool:
+    """
+    Checks whether a database error is worth retrying
+
+    Inputs:
+        ex: exception raised by sqlalchemy or pyodbc
+
+    Output:
+        True if the ODBC SQLSTATE is one of TRANSIENT_SQLSTATES or sqlalchemy found the connection was lost
+    """
+    if getattr(ex, 'connection_invalidated', False):
+        return True
+
+    # sqlalchemy keeps the pyodbc error in orig, whose first arg is the SQLSTATE
+    args = getattr(getattr(ex, 'orig', ex), 'args', ())
+    return bool(args) and isinstance(args[0], str) and args[0] in TRANSIENT_SQLSTATES
+
+def with_retries(run_query, retries=3, backoff_seconds=30):
+    """
+    Wraps a function like get_df_from_sql so queries that fail with a transient error are sent again
+
+    The wait doubles after each failed attempt (backoff_seconds, 2 * backoff_seconds, ...).
+    Any other error, or the last transient one, is raised.
+
+    Inputs:
+        run_query: function called as run_query(database, query)
+        retries: number of times a query is sent again
+        backoff_seconds: wait before the first retry
+
+    Output:
+        function called as run_query(database, query)
+    """
+    def run_query_with_retries(database, query):
+        for attempt in range(retries + 1):
+            try:
+                return run_query(database, query)
+            except Exception as ex:
+                if attempt == retries or not is_transient_error(ex):
+                    raise
+                wait = backoff_seconds * 2 ** attempt
+                logger.warning(f"Query failed with a transient error, retrying in {wait} seconds "
+                               f"(retry {attempt + 1} of {retries}): {ex}")
+                time.sleep(wait)
+
+    return run_query_with_retries
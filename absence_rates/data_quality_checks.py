@@ -6,38 +6,51 @@ to make to those invalid codes.
 The process for updating the invalid codes happens in a different part of the code. This
 step is just involved in identifying the invalid codes.
 """
+import sys
 import timeit
+import numpy as np
+import pandas as pd
 from data_connections import get_df_from_sql
-from helpers import get_config
+from preprocessing import read_occ_code_update_mappings
+from helpers import get_config, get_profile_args, profile_stage
+from snapshot import get_query_runner
+from checkpoints import get_checkpoint_dir, with_checkpoints
+from extraction_report import write_extraction_report
 from pathlib import Path
 
 
-def query_occ_codes_from_absence_data(database, staff_table_raw):
+def query_occ_codes_from_absence_data(database, staff_table_raw, run_query=None):
     """
     Function to extract OCCUPATION CODE from the raw absence data file to determine invalid codes to update
 
     Inputs:
         database: database name as defined in config file
         staff_table_raw: raw absence file name as defined in config file
+        run_query: function to run the query, from snapshot.get_query_runner. Defaults to get_df_from_sql
         
     Output:
-        Produces a dataframe containing every OCCUPATION CODE and TM YEAR MONTH from the raw file
+        Produces a dataframe containing every OCCUPATION CODE and TM YEAR MONTH from the raw file, with the
+        number of rows and the FTE days lost and available for each
     """
     query = f"""
         select
-             [Tm Year Month]     as [TM_YEAR_MONTH]
-            ,[OCCUPATION CODE]  as [OCCUPATION_CODE]
+             [Tm Year Month]                    as [TM_YEAR_MONTH]
+            ,[OCCUPATION CODE]                  as [OCCUPATION_CODE]
+            ,count(*)                           as [ROW_COUNT]
+            ,sum([Wte Days Sick This Month])    as [FTE_DAYS_LOST]
+            ,sum([Wte Days Available])          as [FTE_DAYS_AVAILABLE]
         from [{database}].[dbo].[{staff_table_raw}]
         group by [Tm Year Month], [Occupation Code]"""
 
-    return get_df_from_sql(database, query)
+    return (run_query or get_df_from_sql)(database, query)
 
 def query_occ_codes_from_ref_data(database,
                                 staff_table_raw,
                                 ref_table,
                                 org_master,
                                 start_date,
-                                end_date):
+                                end_date,
+                                run_query=None):
                                 
     """
     Function to extract OCCUPAION CODES which will be included in the publication table based on link to ref data
@@ -49,6 +62,7 @@ def query_occ_codes_from_ref_data(database,
         org_master: Organisation ref table as defined in config file
         start_date: Start date of data as defined in config file
         end_date: End date of data as defined in config file
+        run_query: function to run the query, from snapshot.get_query_runner. Defaults to get_df_from_sql
         
     Output:
         A Dataframe containing OCCUPATION CODE and TM YEAR MONTH from the raw file which will be included in the publication
@@ -73,8 +87,227 @@ def query_occ_codes_from_ref_data(database,
         group by [Tm Year Month], [Occupation Code], [MAIN_STAFF_GROUP_NAME], [STAFF_GROUP_1_NAME]
     """
 
-    return get_df_from_sql(database, query)
+    return (run_query or get_df_from_sql)(database, query)
   
+def query_unexpected_occ_codes(database,
+                            staff_table_raw,
+                            ref_table,
+                            org_master,
+                            start_date,
+                            end_date,
+                            run_query=None):
+    """
+    Function to find the unexpected OCCUPATION CODES in the raw absence data with a single query
+
+    This gives the same codes as query_occ_codes_from_absence_data, query_occ_codes_from_ref_data
+    and get_unexpected_occ_codes, but the raw table is only scanned once and only the unexpected
+    codes are returned. A code is expected if it is in the occupation code ref table for the
+    publication and appears on at least one row for an organisation in the publication, as in
+    query_occ_codes_from_ref_data. The EXISTS checks are used rather than joins so that rows are
+    not counted more than once.
+
+    Inputs:
+        database: database name as defined in config file
+        staff_table_raw: raw absence file name as defined in config file
+        ref_table: Occupation code ref table as defined in config file
+        org_master: Organisation ref table as defined in config file
+        start_date: Start date of data as defined in config file
+        end_date: End date of data as defined in config file
+        run_query: function to run the query, from snapshot.get_query_runner. Defaults to get_df_from_sql
+
+    Output:
+        A Dataframe of the unexpected OCCUPATION CODES for each TM YEAR MONTH, with the number of
+        rows and the FTE days lost and available for each, to show the impact of each code
+    """
+    query = f"""
+        select
+             [TM_YEAR_MONTH]
+            ,[OCCUPATION_CODE]
+            ,[ROW_COUNT]
+            ,[FTE_DAYS_LOST]
+            ,[FTE_DAYS_AVAILABLE]
+        from (
+            select
+                 r.[TM_YEAR_MONTH]
+                ,r.[OCCUPATION_CODE]
+                ,count(*)                             as [ROW_COUNT]
+                ,sum(r.[FTE_DAYS_LOST])               as [FTE_DAYS_LOST]
+                ,sum(r.[FTE_DAYS_AVAILABLE])          as [FTE_DAYS_AVAILABLE]
+                ,max(max(r.[IS_EXPECTED_ROW])) over (partition by r.[OCCUPATION_CODE]) as [IS_EXPECTED]
+            from (
+                -- the flag is worked out for each row first, as SQL Server cannot aggregate a subquery
+                select
+                     a.[Tm Year Month]                as [TM_YEAR_MONTH]
+                    ,a.[Occupation Code]              as [OCCUPATION_CODE]
+                    ,a.[Wte Days Sick This Month]     as [FTE_DAYS_LOST]
+                    ,a.[Wte Days Available]           as [FTE_DAYS_AVAILABLE]
+                    ,case when exists (
+                            select 1
+                            from [{database}].[dbo].[{ref_table}] b
+                            where b.[occ_code] = a.[Occupation Code]
+                            and (b.[END_DATE_PUBLICATION] >= '{end_date}' or b.[END_DATE_PUBLICATION] is null)
+                            and b.[START_DATE_PUBLICATION] < '{start_date}')
+                        and exists (
+                            select 1
+                            from [{database}].[dbo].[{org_master}] c
+                            where c.[Current Org code] = a.[ODS code]
+                            and (c.[End Date] >= '{end_date}' or c.[End Date] is null)
+                            and c.[Start Date] < '{start_date}'
+                            and c.[EnglandWales] = 'E'
+                            and c.[Reporting Org code] not in ('8HK67','8J318','X25','8J149','NL1')
+                            and c.[Reporting Org code] not like '[5Q]%')
+                    then 1 else 0 end                 as [IS_EXPECTED_ROW]
+                from [{database}].[dbo].[{staff_table_raw}] a
+            ) r
+            group by r.[TM_YEAR_MONTH], r.[OCCUPATION_CODE]
+        ) codes
+        where [IS_EXPECTED] = 0
+        order by [TM_YEAR_MONTH], [OCCUPATION_CODE]
+    """
+
+    return (run_query or get_df_from_sql)(database, query)
+
+def query_occ_code_totals(database,
+                        staff_table_raw,
+                        ref_table,
+                        org_master,
+                        start_date,
+                        end_date,
+                        run_query=None):
+    """
+    Function to total the FTE days for each OCCUPATION CODE at the organisations in the publication
+
+    The staff groups are those the code has in the occupation code ref table for the publication,
+    and are blank if the code is not in it (so its rows are left out of the publication). This is
+    a single grouped pass over the raw table, used by simulate_occ_code_updates.
+
+    Inputs:
+        database: database name as defined in config file
+        staff_table_raw: raw absence file name as defined in config file
+        ref_table: Occupation code ref table as defined in config file
+        org_master: Organisation ref table as defined in config file
+        start_date: Start date of data as defined in config file
+        end_date: End date of data as defined in config file
+        run_query: function to run the query, from snapshot.get_query_runner. Defaults to get_df_from_sql
+
+    Output:
+        A Dataframe with one row per OCCUPATION CODE and staff group, with the number of rows and
+        the FTE days lost and available
+    """
+    query = f"""
+        select
+             a.[Occupation Code]                  as [OCCUPATION_CODE]
+            ,b.[MAIN_STAFF_GROUP_NAME]
+            ,b.[STAFF_GROUP_1_NAME]
+            ,count(*)                             as [ROW_COUNT]
+            ,sum(a.[Wte Days Sick This Month])    as [FTE_DAYS_LOST]
+            ,sum(a.[Wte Days Available])          as [FTE_DAYS_AVAILABLE]
+        from [{database}].[dbo].[{staff_table_raw}] a
+        left join [{database}].[dbo].[{ref_table}] b
+            on a.[Occupation Code] = b.[occ_code]
+            and (b.[END_DATE_PUBLICATION] >= '{end_date}' or b.[END_DATE_PUBLICATION] is null)
+            and b.[START_DATE_PUBLICATION] < '{start_date}'
+        inner join [{database}].[dbo].[{org_master}] c
+            on a.[ODS code] = c.[Current Org code]
+        where (c.[End Date] >= '{end_date}' or c.[End Date] is null)
+        and c.[Start Date] < '{start_date}'
+        and c.[EnglandWales] = 'E'
+        and c.[Reporting Org code] not in ('8HK67','8J318','8J149','NL1')
+        and c.[Reporting Org code] not like '[5Q]%'
+        group by a.[Occupation Code], b.[MAIN_STAFF_GROUP_NAME], b.[STAFF_GROUP_1_NAME]
+    """
+
+    return (run_query or get_df_from_sql)(database, query)
+
+def query_valid_occ_codes(database, ref_table, start_date, end_date, run_query=None):
+    """
+    Function to extract the staff groups of every OCCUPATION CODE in the occupation code ref table for the publication
+
+    Inputs:
+        database: database name as defined in config file
+        ref_table: Occupation code ref table as defined in config file
+        start_date: Start date of data as defined in config file
+        end_date: End date of data as defined in config file
+        run_query: function to run the query, from snapshot.get_query_runner. Defaults to get_df_from_sql
+
+    Output:
+        A Dataframe of OCCUPATION_CODE, MAIN_STAFF_GROUP_NAME and STAFF_GROUP_1_NAME
+    """
+    query = f"""
+        select distinct
+             [occ_code]     as [OCCUPATION_CODE]
+            ,[MAIN_STAFF_GROUP_NAME]
+            ,[STAFF_GROUP_1_NAME]
+        from [{database}].[dbo].[{ref_table}]
+        where ([END_DATE_PUBLICATION] >= '{end_date}' or [END_DATE_PUBLICATION] is null)
+        and [START_DATE_PUBLICATION] < '{start_date}'
+    """
+
+    return (run_query or get_df_from_sql)(database, query)
+
+def simulate_occ_code_updates(occ_code_totals, valid_occ_codes, occ_codes_to_update):
+    """
+    Function to work out how much each occupation code update would change the England and staff group rates
+
+    Each update is simulated on its own, as if it were the only one applied. The rows of the
+    OLD_VALUE code leave the staff group they are in now (if the code is in the ref table) and
+    join the staff group of the NEW_VALUE code (if that is in the ref table), so updating an
+    invalid code to a valid one adds its FTE days to England and to the new staff group. All of
+    the updates are worked out at once from the per code totals, without re-running the
+    publication.
+
+    Inputs:
+        occ_code_totals: dataframe from query_occ_code_totals
+        valid_occ_codes: dataframe from query_valid_occ_codes
+        occ_codes_to_update: dict of OLD_VALUE to NEW_VALUE, from preprocessing.read_occ_code_update_mappings
+
+    Output:
+        A Dataframe with one row per update, with the FTE days moved and the England, old staff group
+        and new staff group (STAFF_GROUP_1_NAME) sickness absence rates before and after the update,
+        sorted by the size of the larger change in a staff group rate
+    """
+    cols_to_aggregate = ['ROW_COUNT', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']
+
+    # only the first staff group of a code is used, as a code should only be in one
+    valid_occ_codes = valid_occ_codes.drop_duplicates(subset=['OCCUPATION_CODE'])
+    code_totals = occ_code_totals.groupby('OCCUPATION_CODE', dropna=False)[cols_to_aggregate].sum()
+    in_publication = occ_code_totals.dropna(subset=['STAFF_GROUP_1_NAME'])
+    staff_group_totals = in_publication.groupby('STAFF_GROUP_1_NAME')[['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']].sum()
+    england_lost = in_publication['FTE_DAYS_LOST'].sum()
+    england_available = in_publication['FTE_DAYS_AVAILABLE'].sum()
+
+    updates = pd.DataFrame(list(occ_codes_to_update.items()), columns=['OLD_VALUE', 'NEW_VALUE'])
+    updates = updates.join(code_totals, on='OLD_VALUE')
+    updates[cols_to_aggregate] = updates[cols_to_aggregate].fillna(0)
+    staff_group_of_code = valid_occ_codes.set_index('OCCUPATION_CODE')['STAFF_GROUP_1_NAME']
+    updates['OLD_STAFF_GROUP_1_NAME'] = updates['OLD_VALUE'].map(staff_group_of_code)
+    updates['NEW_STAFF_GROUP_1_NAME'] = updates['NEW_VALUE'].map(staff_group_of_code)
+
+    old_in_publication = updates['OLD_STAFF_GROUP_1_NAME'].notna()
+    new_in_publication = updates['NEW_STAFF_GROUP_1_NAME'].notna()
+
+    # England gains the rows if the new code is valid and loses them if the old code was
+    england_change = new_in_publication.astype(int) - old_in_publication.astype(int)
+    updates['ENGLAND_RATE_BEFORE'] = round(england_lost / england_available * 100, 2)
+    updates['ENGLAND_RATE_AFTER'] = round((england_lost + england_change * updates['FTE_DAYS_LOST'])
+                                        / (england_available + england_change * updates['FTE_DAYS_AVAILABLE']) * 100, 2)
+    updates['ENGLAND_RATE_CHANGE'] = round(updates['ENGLAND_RATE_AFTER'] - updates['ENGLAND_RATE_BEFORE'], 2)
+
+    # the staff group of the old code loses the rows and the new staff group gains them, unless the code stays in the same group
+    moves_group = updates['OLD_STAFF_GROUP_1_NAME'] != updates['NEW_STAFF_GROUP_1_NAME']
+    for group, in_publication, sign in [('OLD', old_in_publication, -1), ('NEW', new_in_publication, 1)]:
+        group_lost = updates[f'{group}_STAFF_GROUP_1_NAME'].map(staff_group_totals['FTE_DAYS_LOST']).fillna(0)
+        group_available = updates[f'{group}_STAFF_GROUP_1_NAME'].map(staff_group_totals['FTE_DAYS_AVAILABLE']).fillna(0)
+        group_change = sign * (in_publication & moves_group)
+        updates[f'{group}_STAFF_GROUP_RATE_BEFORE'] = round(group_lost / group_available.replace(0, np.nan) * 100, 2)
+        updates[f'{group}_STAFF_GROUP_RATE_AFTER'] = round((group_lost + group_change * updates['FTE_DAYS_LOST'])
+                                                        / (group_available + group_change * updates['FTE_DAYS_AVAILABLE']).replace(0, np.nan) * 100, 2)
+        updates[f'{group}_STAFF_GROUP_RATE_CHANGE'] = round(updates[f'{group}_STAFF_GROUP_RATE_AFTER']
+                                                          - updates[f'{group}_STAFF_GROUP_RATE_BEFORE'], 2)
+
+    largest_change = updates[['OLD_STAFF_GROUP_RATE_CHANGE', 'NEW_STAFF_GROUP_RATE_CHANGE']].abs().max(axis=1)
+    return updates.loc[largest_change.sort_values(ascending=False, na_position='last', kind='stable').index].reset_index(drop=True)
+
 def get_unexpected_occ_codes(absence_codes, ref_codes):
     """
     Function to look for cases where the values of OCCUPATION_CODE in the absence_codes table are not present in the ref_codes table
@@ -110,35 +343,134 @@ def export_unexpected_occ_codes(unexpected_occ_codes, occ_codes_path):
     """
     unexpected_occ_codes.to_csv(occ_codes_path, index=False)
 
-def main():
+PROFILE_STAGES = ['extract', 'checks']
+
+# The config.toml keys the data quality checks read
+REQUIRED_CONFIG = ['database', 'staff_table_raw', 'ref_table', 'org_master', 'start_date', 'end_date',
+                   'output_dir', 'log_dir']
+
+
+def get_data_quality_queries(config):
+    """
+    Function to build every SQL query the data quality checks run, for the month in config.toml
+
+    The query functions are given a run_query that keeps each query instead of running it.
+
+    Output:
+        dict of the name of each query function to its SQL Server query
+    """
+    database = config['database']
+    staff_table_raw = config['staff_table_raw']
+    ref_table = config['ref_table']
+    org_master = config['org_master']
+    start_date = config['start_date']
+    end_date = config['end_date']
+
+    queries = {}
+    def record_query(name):
+        return lambda database, query: queries.setdefault(name, query)
+
+    if config.get('unexpected_occ_codes_engine', 'pandas') == 'sql':
+        query_unexpected_occ_codes(database, staff_table_raw, ref_table, org_master, start_date, end_date,
+                                   record_query('unexpected_occ_codes'))
+    else:
+        query_occ_codes_from_absence_data(database, staff_table_raw, record_query('occ_codes_from_absence_data'))
+        query_occ_codes_from_ref_data(database, staff_table_raw, ref_table, org_master, start_date, end_date,
+                                      record_query('occ_codes_from_ref_data'))
+
+    occ_codes_update_path = config.get('occ_codes_update_path')
+    if occ_codes_update_path and Path(occ_codes_update_path).exists():
+        query_occ_code_totals(database, staff_table_raw, ref_table, org_master, start_date, end_date,
+                              record_query('occ_code_totals'))
+        query_valid_occ_codes(database, ref_table, start_date, end_date, record_query('valid_occ_codes'))
+
+    return queries
+
+
+def main(profiler=None, stage_to_profile='main', dry_run=False, resume=False):
     """
     Function to set up and run the code which exports the unexpected_occ_codes csv to the specified filepath
+
+    Inputs:
+        profiler: None, 'cprofile' or 'pyinstrument'. Set from the --profile command line option.
+        stage_to_profile: one of PROFILE_STAGES to profile just that stage, 'main' profiles the whole run
+        dry_run: only check config.toml and the queries (see dry_run.py). Set from the --dry-run command line option.
+        resume: read the queries that were saved to checkpoint_dir rather than running them again (see checkpoints.py).
+            Set from the --resume command line option.
+
+    Output:
+        With dry_run, True if the checks passed
     """
     config = get_config()
+
+    if dry_run:
+        from dry_run import configure_dry_run_logging, run_dry_run
+        configure_dry_run_logging(config)
+        return run_dry_run(config, REQUIRED_CONFIG, get_data_quality_queries)
+
     database = config['database']
     ref_table = config['ref_table']
     org_master = config['org_master']
     start_date = config['start_date']
     end_date = config['end_date']
     output_dir = Path(config['output_dir'])
+    log_dir = Path(config['log_dir'])
     staff_table_raw = config['staff_table_raw']
+    unexpected_occ_codes_engine = config.get('unexpected_occ_codes_engine', 'pandas')
+    # this month's snapshot if snapshot.py has been run, otherwise SQL Server, saving each query's result to checkpoint_dir
+    run_query = with_checkpoints(get_query_runner(config), get_checkpoint_dir(config), resume)
+
+    with profile_stage('extract', log_dir, profiler, stage_to_profile):
+        if unexpected_occ_codes_engine == 'sql':
+            unexpected_occ_codes = query_unexpected_occ_codes(database,
+                                                            staff_table_raw,
+                                                            ref_table,
+                                                            org_master,
+                                                            start_date,
+                                                            end_date,
+                                                            run_query)
+        else:
+            occ_codes_absence = query_occ_codes_from_absence_data(database, staff_table_raw, run_query)
+
+            occ_codes_ref = query_occ_codes_from_ref_data(database,
+                                                            staff_table_raw,
+                                                            ref_table,
+                                                            org_master,
+                                                            start_date,
+                                                            end_date,
+                                                            run_query)
+
+        # the impact of this month's occupation code updates, once they have been filled in
+        occ_codes_update_path = config.get('occ_codes_update_path')
+        simulate_updates = bool(occ_codes_update_path) and Path(occ_codes_update_path).exists()
+        if simulate_updates:
+            occ_code_totals = query_occ_code_totals(database, staff_table_raw, ref_table, org_master,
+                                                    start_date, end_date, run_query)
+            valid_occ_codes = query_valid_occ_codes(database, ref_table, start_date, end_date, run_query)
 
-    occ_codes_absence = query_occ_codes_from_absence_data(database, staff_table_raw)
+    # the time and size of each query, to tell a slow warehouse from a slow network or pandas
+    write_extraction_report(log_dir)
 
-    occ_codes_ref = query_occ_codes_from_ref_data(database,
-                                                    staff_table_raw,
-                                                    ref_table,
-                                                    org_master,
-                                                    start_date,
-                                                    end_date)
+    with profile_stage('checks', log_dir, profiler, stage_to_profile):
+        if unexpected_occ_codes_engine != 'sql':
+            unexpected_occ_codes = get_unexpected_occ_codes(occ_codes_absence, occ_codes_ref)
+        # the codes affecting the most FTE days first
+        unexpected_occ_codes = unexpected_occ_codes.sort_values('FTE_DAYS_AVAILABLE', ascending=False, kind='stable')
+        occ_codes_out_path = output_dir / f'unexpected_occ_codes_{start_date}.csv'
+        export_unexpected_occ_codes(unexpected_occ_codes, occ_codes_out_path)
 
-    unexpected_occ_codes = get_unexpected_occ_codes(occ_codes_absence, occ_codes_ref)
-    occ_codes_out_path = output_dir / f'unexpected_occ_codes_{start_date}.csv'
-    export_unexpected_occ_codes(unexpected_occ_codes, occ_codes_out_path)
+        if simulate_updates:
+            occ_codes_to_update = read_occ_code_update_mappings(occ_codes_update_path)
+            update_impact = simulate_occ_code_updates(occ_code_totals, valid_occ_codes, occ_codes_to_update)
+            update_impact.to_csv(output_dir / f'occ_code_update_impact_{start_date}.csv', index=False)
 
 if __name__ == '__main__':
+    args = get_profile_args("Find invalid occupation codes in the raw absence data", PROFILE_STAGES)
+    if args.dry_run:
+        sys.exit(0 if main(dry_run=True) else 1)
     print(f"Running checks to find bad occupation codes")
     start_time = timeit.default_timer()
-    main()
+    with profile_stage('main', Path(get_config()['log_dir']), args.profile, args.profile_stage):
+        main(args.profile, args.profile_stage, resume=args.resume)
     total_time = timeit.default_timer() - start_time
     print(f"Running time: {int(total_time / 60)} minutes and {round(total_time%60)} seconds.")
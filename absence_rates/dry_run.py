@@ -0,0 +1,247 @@
+"""
+Checks a month's config.toml and queries before the real run, without extracting any data.
+
+Run data_quality_checks.py or make_publication.py with --dry-run to:
+    - validate config.toml (placeholder values, dates, table names, settings and folders)
+    - build every SQL query the run would send
+    - check that every table is in this month's snapshot, or in SQL Server if the stage of the snapshot
+      the run reads has not been taken
+    - ask for the estimated rows and size of each extract, from SQL Server's estimated plan
+      (SET SHOWPLAN_XML, the query is not run) or from counting the rows in the snapshot
+
+A mistake in config.toml, such as a table name still containing yyyy-mm, then fails in
+seconds rather than after the first queries have run on the warehouse.
+"""
+
+import re
+import sys
+import logging
+from pathlib import Path
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Parts of the config.toml template that are replaced each month
+PLACEHOLDERS = ['xxx', 'yyyy', 'mm-dd', 'dd/mm', 'yyyymm']
+
+# The config.toml keys of the tables, whose names include the month they hold
+TABLE_KEYS = ['staff_table_raw', 'staff_table', 'mds_table', 'staff_in_post',
+              'org_master', 'ref_table', 'ref_payscale', 'latest_org_name']
+
+# The settings with a fixed set of values and the values they can take. log_level is not case
+# sensitive (see helpers.configure_logging), the others have to match exactly
+CONFIG_CHOICES = {'unexpected_occ_codes_engine': ['pandas', 'sql'],
+                  'log_level': ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']}
+
+
+def find_placeholders(config, keys):
+    """
+    Creates a function to find the settings that still hold a placeholder from the config.toml template
+
+    Output:
+        list of problems, one per setting
+    """
+    problems = []
+    for key in keys:
+        value = config.get(key)
+        if isinstance(value, str) and any(placeholder in value.lower() for placeholder in PLACEHOLDERS):
+            problems.append(f"{key} = '{value}' has not been filled in")
+
+    return problems
+
+
+def check_dates(config):
+    """
+    Creates a function to check start_date, end_date and month_date describe the same month end
+
+    Output:
+        list of problems
+    """
+    try:
+        start_date = datetime.strptime(config['start_date'], '%Y-%m-%d')
+    except ValueError:
+        return [f"start_date = '{config['start_date']}' is not a yyyy-mm-dd date"]
+
+    problems = []
+    if (start_date + timedelta(days=1)).month == start_date.month:
+        problems.append(f"start_date = '{config['start_date']}' is not the last day of the month")
+    if config.get('end_date') != config['start_date']:
+        problems.append(f"end_date = '{config.get('end_date')}' is not the same as start_date")
+    if 'month_date' in config and config['month_date'] != start_date.strftime('%d/%m/%Y'):
+        problems.append(f"month_date = '{config['month_date']}' is not start_date as dd/mm/yyyy")
+
+    return problems
+
+
+def check_table_months(config):
+    """
+    Creates a function to check the tables named after a month are this month's tables
+
+    The ESR tables end in yyyy-mm and the MDS, staff in post and latest organisation name
+    tables in yyyymm.
+
+    Output:
+        list of problems, one per table from another month
+    """
+    month = config['start_date'][:7]
+    problems = []
+    for key in TABLE_KEYS:
+        table = config.get(key, '')
+        for table_month in re.findall(r'(?<!\d)(\d{4})-?(\d{2})(?!\d)', table):
+            if '-'.join(table_month) != month:
+                problems.append(f"{key} = '{table}' is not the table for {month}")
+
+    return problems
+
+
+def check_settings(config):
+    """
+    Creates a function to check the settings with a fixed set of values
+
+    Output:
+        list of problems
+    """
+    from output_writer import get_output_formats, get_csv_writer
+    from covid_table import get_aggregation_engine
+
+    problems = []
+    for key, choices in CONFIG_CHOICES.items():
+        value = config.get(key)
+        if key == 'log_level' and isinstance(value, str):
+            value = value.upper()
+        if key in config and value not in choices:
+            problems.append(f"{key} = '{config[key]}' is not one of {choices}")
+
+    for get_setting in [get_output_formats, get_csv_writer, get_aggregation_engine]:
+        try:
+            get_setting(config)
+        except ValueError as ex:
+            problems.append(str(ex))
+
+    for key in ['output_dir', 'log_dir']:
+        if key in config and not Path(config[key]).is_dir():
+            problems.append(f"{key} = '{config[key]}' is not a folder")
+
+    return problems
+
+
+def validate_config(config, required_keys):
+    """
+    Creates a function to check config.toml has been filled in for the month
+
+    Inputs:
+        config: the dict from config.toml
+        required_keys: the config.toml keys the run reads
+
+    Output:
+        list of problems, empty if config.toml is ready for the run
+    """
+    missing_keys = [key for key in required_keys if key not in config]
+    if missing_keys:
+        return [f"{key} is missing from config.toml" for key in missing_keys]
+
+    # the optional folders are only checked when they are set
+    optional_keys = [key for key in ['snapshot_dir', 'history_dir', 'intermediate_dir', 'checkpoint_dir', 'occ_codes_update_path'] if key in config]
+    problems = find_placeholders(config, list(required_keys) + optional_keys)
+    if any(key in problem for problem in problems for key in ['start_date', 'end_date', 'month_date']):
+        return problems
+
+    return problems + check_dates(config) + check_table_months(config) + check_settings(config)
+
+
+def get_query_tables(config, queries):
+    """
+    Creates a function to find the config.toml tables that the queries read
+
+    Output:
+        list of table names
+    """
+    tables = [config[key] for key in TABLE_KEYS if key in config]
+
+    return [table for table in dict.fromkeys(tables)
+            if any(f"[{table}]" in query for query in queries.values())]
+
+
+def estimate_queries(config, queries, snapshot_stage='data_quality'):
+    """
+    Creates a function to estimate the size of each extract, without running the queries
+
+    Inputs:
+        config: the dict from config.toml
+        queries: dict of the name of each extract to its SQL Server query
+        snapshot_stage: the snapshot stage the run reads, 'data_quality' or 'publication'
+
+    Output:
+        list of problems, and a dataframe of the estimated rows, columns and MB of each extract
+    """
+    import pandas as pd
+    from snapshot import get_query_estimator
+
+    estimate_query = get_query_estimator(config, snapshot_stage)
+    problems = []
+    estimates = []
+    for name, query in queries.items():
+        try:
+            estimate = estimate_query(config['database'], query)
+        except Exception as ex:
+            problems.append(f"{name} query failed: {ex}")
+            continue
+        estimates.append({'QUERY': name, 'ROWS': estimate['ROWS'], 'COLUMNS': estimate['COLUMNS'],
+                          'ESTIMATED_MB': round(estimate['BYTES'] / 2**20, 1)})
+
+    return problems, pd.DataFrame(estimates, columns=['QUERY', 'ROWS', 'COLUMNS', 'ESTIMATED_MB'])
+
+
+def configure_dry_run_logging(config):
+    """
+    Creates a function to set up logging for the dry run
+
+    The log is saved in log_dir as usual, unless log_dir is one of the problems being
+    checked for, in which case it is only printed.
+    """
+    from helpers import configure_logging
+
+    log_dir = config.get('log_dir')
+    if log_dir and Path(log_dir).is_dir():
+        configure_logging(Path(log_dir), config.get('log_level', 'INFO'))
+    else:
+        logging.basicConfig(level='INFO', format='%(levelname)s -- %(message)s', stream=sys.stdout)
+
+
+def run_dry_run(config, required_keys, get_queries, snapshot_stage='data_quality'):
+    """
+    Creates a function to check config.toml and the queries of a run without extracting any data
+
+    Inputs:
+        config: the dict from config.toml
+        required_keys: the config.toml keys the run reads
+        get_queries: function taking config and returning a dict of the name of each extract to its SQL Server query
+        snapshot_stage: the snapshot stage the run reads, 'data_quality' or 'publication'
+
+    Output:
+        True if the run is ready to go, False if any problems were found (they are logged)
+    """
+    from snapshot import find_missing_tables
+
+    problems = validate_config(config, required_keys)
+    if not problems:
+        queries = get_queries(config)
+        for name, query in queries.items():
+            logger.debug("%s query:\n\n %s", name, query)
+
+        missing_tables = find_missing_tables(config, get_query_tables(config, queries), snapshot_stage)
+        problems = [f"{table} does not exist" for table in missing_tables]
+
+    if not problems:
+        problems, estimates = estimate_queries(config, queries, snapshot_stage)
+        logger.info(f"Estimated size of each extract:\n\n{estimates.to_string(index=False)}\n")
+        logger.info(f"Estimated total: {estimates['ROWS'].sum()} rows, {estimates['ESTIMATED_MB'].sum():.1f} MB")
+
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        logger.error(f"Dry run found {len(problems)} problem(s), fix them before running")
+    else:
+        logger.info("Dry run passed")
+
+    return not problems
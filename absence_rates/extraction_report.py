@@ -0,0 +1,141 @@
+"""
+Times and sizes of the queries run during a run, to see where the extraction time goes.
+
+get_df_from_sql and get_df_from_snapshot record each query they run: the time taken to
+execute it, to fetch the rows and to convert them to a dataframe, the number of rows and
+columns and the dataframe's estimated size. With query_statistics = true in config.toml,
+SQL Server's SET STATISTICS IO, TIME output is added (the pages read and the CPU and
+elapsed time on the server).
+
+A long EXECUTE_SECONDS or SERVER_ELAPSED_MS points at the warehouse, a long FETCH_SECONDS
+for the size of the extract at the network, and a long CONVERT_SECONDS at pandas.
+make_publication.py and data_quality_checks.py write the report to log_dir after extracting.
+"""
+
+import re
+import time
+import logging
+import pandas as pd
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = ['SOURCE', 'TABLES', 'EXECUTE_SECONDS', 'FETCH_SECONDS', 'CONVERT_SECONDS',
+                  'ROWS', 'COLUMNS', 'ESTIMATED_MB', 'LOGICAL_READS', 'PHYSICAL_READS',
+                  'READ_AHEAD_READS', 'SERVER_CPU_MS', 'SERVER_ELAPSED_MS']
+
+# Rows measured by estimate_bytes, the size of the rest is scaled from them
+SAMPLE_ROWS = 10_000
+
+# The queries recorded since the start of the run
+_query_statistics = []
+
+
+def estimate_bytes(df, sample_rows=SAMPLE_ROWS):
+    """
+    Creates a function to estimate the memory used by a dataframe
+
+    The strings in object columns are only measured on the first sample_rows rows, as
+    measuring every one takes seconds on the larger extracts.
+
+    Output:
+        The estimated number of bytes
+    """
+    if len(df) <= sample_rows:
+        return int(df.memory_usage(index=False, deep=True).sum())
+
+    return int(df.iloc[:sample_rows].memory_usage(index=False, deep=True).sum() * len(df) / sample_rows)
+
+
+def parse_statistics_messages(messages):
+    """
+    Creates a function to total the SET STATISTICS IO, TIME messages of a query
+
+    Inputs:
+        messages: list of the message texts SQL Server sent with the query's results
+
+    Output:
+        dict of the logical, physical and read-ahead reads of every table and the CPU and
+        elapsed milliseconds of the query's execution (compile time is left out)
+    """
+    text = '\n'.join(messages)
+
+    def total(pattern):
+        return sum(int(value) for value in re.findall(pattern, text))
+
+    return {'LOGICAL_READS': total(r'(?<!lob )logical reads (\d+)'),
+            'PHYSICAL_READS': total(r'(?<!lob )physical reads (\d+)'),
+            'READ_AHEAD_READS': total(r'(?<!lob )(?<!server )read-ahead reads (\d+)'),
+            'SERVER_CPU_MS': total(r'Execution Times:\s*CPU time = (\d+) ms'),
+            'SERVER_ELAPSED_MS': total(r'Execution Times:\s*CPU time = \d+ ms,\s*elapsed time = (\d+) ms')}
+
+
+def get_query_tables(query, database):
+    """
+    Creates a function to list the tables a query reads, to name it in the report
+
+    Output:
+        The table names, comma separated
+    """
+    tables = re.findall(rf"\[{re.escape(database)}\]\.\[dbo\]\.\[([^\]]+)\]", query)
+
+    return ', '.join(dict.fromkeys(tables))
+
+
+def record_query(source, database, query, df, execute_seconds, fetch_seconds, convert_seconds=None, statistics=None):
+    """
+    Creates a function to add a query to the run's extraction report
+
+    Inputs:
+        source: where the query was run, 'sql' or 'snapshot'
+        database: database name as defined in config.toml file
+        query: string containing the SQL Server query
+        df: the dataframe the query returned
+        execute_seconds: time until the first results were ready
+        fetch_seconds: time to fetch the rows
+        convert_seconds: time to convert the rows to a dataframe, None if it is part of the fetch
+        statistics: dict from parse_statistics_messages, None if they were not collected
+    """
+    query_statistics = {'SOURCE': source, 'TABLES': get_query_tables(query, database),
+                        'EXECUTE_SECONDS': round(execute_seconds, 3), 'FETCH_SECONDS': round(fetch_seconds, 3),
+                        'CONVERT_SECONDS': None if convert_seconds is None else round(convert_seconds, 3),
+                        'ROWS': len(df), 'COLUMNS': len(df.columns),
+                        'ESTIMATED_MB': round(estimate_bytes(df) / 2**20, 1)}
+    query_statistics.update(statistics or {})
+    _query_statistics.append(query_statistics)
+
+    logger.info(f"Extracted {len(df)} rows ({query_statistics['ESTIMATED_MB']} MB) from {query_statistics['TABLES'] or source}: "
+                f"{execute_seconds:.1f}s executing, {fetch_seconds:.1f}s fetching"
+                + ('' if convert_seconds is None else f", {convert_seconds:.1f}s converting"))
+
+
+def get_extraction_report():
+    """
+    Creates a function to build the extraction report of the queries run so far
+
+    Output:
+        Dataframe with a row for each query, in the order they were run
+    """
+    return pd.DataFrame(_query_statistics, columns=REPORT_COLUMNS)
+
+
+def write_extraction_report(log_dir):
+    """
+    Creates a function to save the extraction report to log_dir and log its totals
+
+    Output:
+        The path of the report CSV, or None if no queries have been run
+    """
+    report = get_extraction_report()
+    if report.empty:
+        return None
+
+    path = Path(log_dir) / f"extraction_report_{time.strftime('%Y-%m-%d_%H-%M-%S')}.csv"
+    report.to_csv(path, index=False)
+
+    totals = report[['EXECUTE_SECONDS', 'FETCH_SECONDS', 'CONVERT_SECONDS', 'ROWS', 'ESTIMATED_MB']].sum()
+    logger.info(f"Extracted {int(totals['ROWS'])} rows ({totals['ESTIMATED_MB']:.1f} MB) in {len(report)} queries: "
+                f"{totals['EXECUTE_SECONDS']:.1f}s executing, {totals['FETCH_SECONDS']:.1f}s fetching, "
+                f"{totals['CONVERT_SECONDS']:.1f}s converting. Report saved to {path}")
+
+    return path
@@ -2,6 +2,10 @@ import os
 import sys
 import toml
 import time
+import argparse
+import cProfile
+import pstats
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict
 import logging
@@ -39,16 +43,93 @@ def get_config() -> Dict:
     return toml.load(root_path / "config.toml")
 
 
-def configure_logging(log_dir) -> None:
+def configure_logging(log_dir, log_level='INFO') -> None:
     """Set up logging format and location to store logs
     Should move path to config
+
+    log_level is read from config.toml. DataFrame previews and SQL query text are only
+    logged at DEBUG, so they are not rendered at all when running at INFO.
     """
     log_folder = log_dir
     logging.basicConfig(
-        level=logging.INFO,
+        level=log_level.upper(),
         format='%(asctime)s - %(levelname)s -- %(filename)s:\
                 %(funcName)5s():%(lineno)s -- %(message)s',
         handlers=[
             logging.FileHandler(log_folder / f"{time.strftime('%Y-%m-%d_%H-%M-%S')}.log"),
             logging.StreamHandler(sys.stdout)]  # Add second handler to print log message to screen
     )
+
+
+def get_profile_args(description, stages):
+    """Parses the profiling options shared by the publication entry points
+
+    Inputs:
+        description: the description shown by --help
+        stages: the names of the stages which can be profiled on their own
+
+    Returns:
+        argparse.Namespace: contains profile (None, 'cprofile' or 'pyinstrument'), profile_stage, dry_run and resume
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--profile', nargs='?', const='cprofile', default=None,
+                        choices=['cprofile', 'pyinstrument'],
+                        help="profile the run and save the output into log_dir (default profiler: cprofile)")
+    parser.add_argument('--profile-stage', default='main', choices=['main'] + list(stages),
+                        help="only profile the named stage (default: the whole run)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="check config.toml, the tables and the estimated size of each query, without extracting any data")
+    parser.add_argument('--resume', action='store_true',
+                        help="read the queries saved to checkpoint_dir by the last run rather than running them again")
+    return parser.parse_args()
+
+
+@contextmanager
+def profile_stage(stage, log_dir, profiler=None, stage_to_profile='main'):
+    """Profiles the code run inside the with block when that stage has been asked for
+
+    cProfile output is saved as a .prof file (open with snakeviz or pstats), pyinstrument
+    output is saved as an HTML report. Both are written to log_dir.
+
+    Inputs:
+        stage: name of the stage being run, e.g. 'extract'
+        log_dir: folder to save the profiler output in
+        profiler: None to switch profiling off, 'cprofile' or 'pyinstrument'
+        stage_to_profile: the stage that was requested with --profile-stage
+
+    Example:
+        with profile_stage('extract', log_dir, args.profile, args.profile_stage):
+            base_absence_data = get_df_from_sql(database, base_data_query)
+    """
+    if profiler is None or stage != stage_to_profile:
+        yield
+        return
+
+    out_stem = Path(log_dir) / f"profile_{stage}_{time.strftime('%Y-%m-%d_%H-%M-%S')}"
+
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError as ex:
+            raise ImportError("pyinstrument is not installed, use --profile cprofile or install it") from ex
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            out_path = out_stem.with_suffix('.html')
+            out_path.write_text(prof.output_html())
+            print(f"Saved pyinstrument profile of stage '{stage}' to:\n{out_path}")
+    else:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            out_path = out_stem.with_suffix('.prof')
+            prof.dump_stats(out_path)
+            print(f"Saved cProfile profile of stage '{stage}' to:\n{out_path}")
+            stats = pstats.Stats(prof).sort_stats('cumulative')
+            stats.print_stats(20)
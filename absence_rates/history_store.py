@@ -0,0 +1,139 @@
+"""
+Monthly history store of the publication aggregates.
+
+Every run appends its breakdowns to a Parquet dataset per output, partitioned by month
+(<history_dir>/<output_name>/MONTH=yyyy-mm-dd/). Time series are then read back with
+read_history, which only opens the partitions and columns that are asked for rather
+than globbing and concatenating the monthly CSVs.
+"""
+
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMN = 'MONTH'
+
+
+def prepare_for_parquet(df):
+    """
+    Creates a function to give each column of an output a type that Parquet can store
+
+    The CSV outputs mark suppressed values with blank strings in otherwise numeric columns.
+    These are stored as nulls. Categorical columns are stored as strings so the schema is the
+    same in every month, whatever the categories were in that run.
+
+    Inputs:
+        df: one of the publication output dataframes
+
+    Output:
+        A copy of the dataframe with numeric and string columns only
+    """
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('string')
+        elif df[col].dtype == object:
+            try:
+                df[col] = pd.to_numeric(df[col].replace('', np.nan))
+            except (ValueError, TypeError):
+                df[col] = df[col].astype('string')
+
+    return df
+
+
+def write_to_history_store(df, history_dir, output_name, month):
+    """
+    Creates a function to add one month of an output to the history store
+
+    The store is append only: each run writes the partition for its own month and never
+    touches the other months. Re-running a month replaces that month's partition, so the
+    store always holds the latest run for each month.
+
+    Inputs:
+        df: one of the publication output dataframes
+        history_dir: history_dir as defined in config.toml file
+        output_name: name of the output, e.g. 'benchmarking_csv'
+        month: start_date as defined in config.toml file, used as the partition value
+
+    Output:
+        The path of the partition that was written
+    """
+    partition_dir = Path(history_dir) / output_name / f"{PARTITION_COLUMN}={month}"
+    tmp_dir = partition_dir.with_name(f".{partition_dir.name}.tmp")
+    old_dir = partition_dir.with_name(f".{partition_dir.name}.old")
+    if old_dir.exists() and not partition_dir.exists():
+        # a run stopped between the renames below, put the old partition back first
+        old_dir.rename(partition_dir)
+    if partition_dir.exists():
+        logger.warning(f"Replacing the {month} partition of {output_name} in the history store")
+
+    # write next to the partition and swap it in, so a failed write leaves the old month in place.
+    # The old partition is renamed aside before the new one is renamed in and only deleted after,
+    # so one of them is always on disk. Dot-prefixed directories are not read by read_history
+    for leftover_dir in [tmp_dir, old_dir]:
+        if leftover_dir.exists():
+            shutil.rmtree(leftover_dir)
+    tmp_dir.mkdir(parents=True)
+    prepare_for_parquet(df).to_parquet(tmp_dir / 'part-0.parquet', index=False)
+
+    if partition_dir.exists():
+        partition_dir.rename(old_dir)
+    tmp_dir.rename(partition_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    logger.info(f"Written {len(df)} rows of {output_name} to {partition_dir}")
+
+    return partition_dir
+
+
+def read_history(history_dir, output_name, columns=None, filters=None, start_month=None, end_month=None):
+    """
+    Creates a function to read a breakdown across months from the history store
+
+    The month range and filters are pushed down to pyarrow, so only the matching partitions
+    and row groups are read.
+
+    Inputs:
+        history_dir: history_dir as defined in config.toml file
+        output_name: name of the output, e.g. 'benchmarking_csv'
+        columns: list of columns to read, all columns if None. MONTH is always included.
+        filters: dict of column name to a value, or a list of values, to keep
+            e.g. {'ORG_CODE': ['RXX', 'RYY'], 'STAFF_GROUP': 'All staff groups'}
+        start_month: first month to read (inclusive), in the same yyyy-mm-dd format as start_date
+        end_month: last month to read (inclusive)
+
+    Output:
+        A dataframe of the breakdown with a MONTH column, sorted by month
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(Path(history_dir) / output_name, format='parquet',
+                        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor='hive'),
+                        exclude_invalid_files=True)
+
+    expression = None
+    conditions = []
+    if start_month is not None:
+        conditions.append(ds.field(PARTITION_COLUMN) >= start_month)
+    if end_month is not None:
+        conditions.append(ds.field(PARTITION_COLUMN) <= end_month)
+    for col, values in (filters or {}).items():
+        if isinstance(values, (list, tuple, set)):
+            conditions.append(ds.field(col).isin(list(values)))
+        else:
+            conditions.append(ds.field(col) == values)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    if columns is not None:
+        columns = [PARTITION_COLUMN] + [col for col in columns if col != PARTITION_COLUMN]
+
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    logger.info(f"Read {len(df)} rows of {output_name} from the history store")
+
+    return df.sort_values(PARTITION_COLUMN, kind='stable').reset_index(drop=True)
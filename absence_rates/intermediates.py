@@ -0,0 +1,91 @@
+"""
+Intermediate dataframes passed between the stages of the publication, saved as Arrow IPC files.
+
+If intermediate_dir is set in config.toml, make_publication.py writes the dataframes that
+one stage hands to the next (e.g. benchmarking_inter_data) to
+<intermediate_dir>/<start_date>/<name>.arrow. The files are uncompressed Arrow IPC
+(Feather v2), so another process can memory-map one with read_intermediate and use its
+columns without copying them into its own memory or unpickling them.
+"""
+
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+INTERMEDIATE_SUFFIX = '.arrow'
+
+
+def get_intermediate_path(intermediate_dir, name):
+    """
+    Creates a function to find the file of an intermediate dataframe
+
+    Inputs:
+        intermediate_dir: the month's folder of intermediate files
+        name: name of the intermediate dataframe, e.g. 'benchmarking_inter_data'
+
+    Output:
+        The path of the Arrow IPC file
+    """
+    return Path(intermediate_dir) / f"{name}{INTERMEDIATE_SUFFIX}"
+
+
+def write_intermediate(df, intermediate_dir, name):
+    """
+    Creates a function to save an intermediate dataframe as an Arrow IPC file
+
+    The file is written next to its final path and then renamed, so another process never
+    maps a half written file. Categorical columns are stored dictionary encoded and come back
+    as the same categoricals.
+
+    Inputs:
+        df: the dataframe passed from one stage to the next
+        intermediate_dir: the month's folder of intermediate files
+        name: name of the intermediate dataframe, e.g. 'benchmarking_inter_data'
+
+    Output:
+        The path of the Arrow IPC file
+    """
+    import pyarrow as pa
+
+    path = get_intermediate_path(intermediate_dir, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    tmp_path.replace(path)
+    logger.info(f"Written {len(df)} rows of {name} to {path}")
+
+    return path
+
+
+def read_intermediate(intermediate_dir, name, as_table=False):
+    """
+    Creates a function to memory-map an intermediate dataframe written by write_intermediate
+
+    The Arrow table's columns point straight into the mapped file, so reading one costs no
+    memory until the data is used. Converting to pandas copies only the columns that pandas
+    can't use in place, such as strings and columns with missing values.
+
+    Inputs:
+        intermediate_dir: the month's folder of intermediate files
+        name: name of the intermediate dataframe, e.g. 'benchmarking_inter_data'
+        as_table: return the pyarrow Table rather than a pandas dataframe
+
+    Output:
+        The intermediate dataframe (or pyarrow Table)
+    """
+    import pyarrow as pa
+
+    path = get_intermediate_path(intermediate_dir, name)
+    with pa.memory_map(str(path), 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    logger.info(f"Mapped {table.num_rows} rows of {name} from {path}")
+
+    if as_table:
+        return table
+
+    return table.to_pandas(split_blocks=True)
@@ -1,29 +1,38 @@
+import sys
 import timeit
 import logging
-import pandas as pd
 from pathlib import Path
 from datetime import datetime
-import write_excel
-import write_reason_absence_excel
-from data_connections import get_df_from_sql
-from preprocessing import prepare_base_data, read_occ_code_update_mappings
-from reason_and_staff import sql_query_reason_staff, create_reason_absence_breakdowns
 from helpers import (get_config, get_excel_template_dir, 
-                    configure_logging)
-from absence_rates import (query_base_data, create_absence_rates_breakdowns, 
-                        create_org_absence_breakdowns)
-from benchmarking_tool import (sql_query_benchmark_data, sql_latest_org_name, 
-                            agg_benchmarking_orgs, create_benchmarking_tool)
-from covid_table import (sql_query_covid_data, create_covid_breakdowns, 
-                    create_covid_orgs_breakdowns, covid_joined_table, covid_final_table)
+                    configure_logging, get_profile_args, profile_stage)
 
+# pandas, openpyxl, pyarrow and the publication modules are imported in main, in the stage that
+# first needs them, so that importing this module (e.g. for --help) is quick
 
-def main():
+
+PROFILE_STAGES = ['extract', 'breakdowns', 'excel']
+
+# The config.toml keys the publication reads
+REQUIRED_CONFIG = ['database', 'staff_table', 'ref_table', 'mds_table', 'ref_payscale', 'org_master',
+                   'latest_org_name', 'staff_in_post', 'month_date', 'start_date', 'end_date',
+                   'output_dir', 'log_dir']
+
+
+def get_publication_queries(config):
     """
-    Creates a function which pulls in all the fields needed to make the publication as well as defining where the outputs should be saved.
-    Allows a series of dataframes to be created from this which populate the NHS Sickness Absence publication tables.
+    Creates a function to build every SQL query the publication runs, for the month in config.toml
+
+    Inputs:
+        config: the dict from config.toml
+
+    Output:
+        dict of the name of each extract to its SQL Server query
     """
-    config = get_config()
+    from absence_rates import query_base_data
+    from reason_and_staff import sql_query_reason_staff
+    from benchmarking_tool import sql_query_benchmark_data, sql_latest_org_name
+    from covid_table import sql_query_covid_data
+    from reference_data import sql_query_category_values
 
     database = config['database']
     staff_table = config['staff_table']
@@ -32,224 +41,351 @@ def main():
     ref_payscale = config['ref_payscale']
     org_master = config['org_master']
     latest_org_name = config['latest_org_name']
-    month_date = config['month_date']
     start_date = config['start_date']
     end_date = config['end_date']
     staff_in_post = config['staff_in_post']
 
+    return {
+        'base_absence_data': query_base_data(database, staff_table, org_master, ref_payscale, ref_table, start_date, end_date),
+        'base_reason_staff_data': sql_query_reason_staff(database, mds_table, staff_in_post, org_master, ref_table, start_date, end_date),
+        'base_benchmarking_data': sql_query_benchmark_data(database, staff_table, org_master, ref_table, start_date, end_date),
+        'base_latest_orgs_data': sql_latest_org_name(database, latest_org_name),
+        'base_covid_data': sql_query_covid_data(database, mds_table, staff_in_post, org_master, ref_table, start_date, end_date),
+        'category_values': sql_query_category_values(database, org_master, ref_table, ref_payscale)
+    }
+
+
+def main(profiler=None, stage_to_profile='main', dry_run=False, resume=False):
+    """
+    Creates a function which pulls in all the fields needed to make the publication as well as defining where the outputs should be saved.
+    Allows a series of dataframes to be created from this which populate the NHS Sickness Absence publication tables.
+
+    Inputs:
+        profiler: None, 'cprofile' or 'pyinstrument'. Set from the --profile command line option.
+        stage_to_profile: one of PROFILE_STAGES to profile just that stage, 'main' profiles the whole run
+        dry_run: only check config.toml and the queries (see dry_run.py). Set from the --dry-run command line option.
+        resume: read the queries that were saved to checkpoint_dir rather than running them again (see checkpoints.py).
+            Set from the --resume command line option.
+
+    Output:
+        With dry_run, True if the checks passed
+    """
+    config = get_config()
+
+    if dry_run:
+        from dry_run import configure_dry_run_logging, run_dry_run
+        configure_dry_run_logging(config)
+        return run_dry_run(config, REQUIRED_CONFIG, get_publication_queries, 'publication')
+
+    database = config['database']
+    month_date = config['month_date']
+    start_date = config['start_date']
+    history_dir = config.get('history_dir')
+    intermediate_dir = Path(config['intermediate_dir']) / start_date if config.get('intermediate_dir') else None
+
     output_dir = Path(config['output_dir'])
     log_dir = Path(config['log_dir'])
     template_dir = get_excel_template_dir()
 
-    configure_logging(log_dir)
+    configure_logging(log_dir, config.get('log_level', 'INFO'))
     logger = logging.getLogger(__name__)
     logger.info(f"Logging the config settings:\n\n\t{config}\n")
     logger.info(f"Starting run at:\t{datetime.now().time()}")
     
-    # Sickness Absence data
-    base_data_query = query_base_data(database, staff_table, org_master, ref_payscale, ref_table, start_date, end_date)
-    base_absence_data = get_df_from_sql(database, base_data_query)
+    from snapshot import get_query_runner
+    from checkpoints import get_checkpoint_dir, with_checkpoints
+    from extraction_report import write_extraction_report
+    from output_writer import get_output_formats, get_csv_writer, write_output
+    from covid_table import get_aggregation_engine
+    output_formats = get_output_formats(config)
+    csv_writer = get_csv_writer(config)
+    aggregation_engine = get_aggregation_engine(config)
+
+    # this month's snapshot if snapshot.py --publication has been run, otherwise SQL Server, saving each query's result to checkpoint_dir
+    run_query = with_checkpoints(get_query_runner(config, 'publication'), get_checkpoint_dir(config), resume)
+
+    with profile_stage('extract', log_dir, profiler, stage_to_profile):
+        from reference_data import build_category_dictionary, encode_categoricals, build_latest_org_lookup
+        queries = get_publication_queries(config)
+
+        # Sickness Absence data
+        base_absence_data = run_query(database, queries['base_absence_data'], 'base_absence_data')
     
-    # Sickness Absence by reason and staff group data
-    reason_staff_query = sql_query_reason_staff(database, mds_table, staff_in_post, org_master, ref_table, start_date, end_date)
-    base_reason_staff_data = get_df_from_sql(database, reason_staff_query)
+        # Sickness Absence by reason and staff group data
+        base_reason_staff_data = run_query(database, queries['base_reason_staff_data'], 'base_reason_staff_data')
     
-    # Benchmarking sickness absence data
-    base_bench_data_query = sql_query_benchmark_data(database, staff_table, org_master, ref_table, start_date, end_date)
-    base_benchmarking_data = get_df_from_sql(database, base_bench_data_query)
-    base_last_orgs_data_query = sql_latest_org_name(database, latest_org_name)
-    base_latest_orgs_data = get_df_from_sql(database, base_last_orgs_data_query)
+        # Benchmarking sickness absence data
+        base_benchmarking_data = run_query(database, queries['base_benchmarking_data'], 'base_benchmarking_data')
+        base_latest_orgs_data = run_query(database, queries['base_latest_orgs_data'], 'base_latest_orgs_data')
+        latest_org_lookup = build_latest_org_lookup(base_latest_orgs_data)
     
-    # COVID-19 related sickness absence data
-    base_covid_data_query = sql_query_covid_data(database, mds_table, staff_in_post, org_master, ref_table, start_date, end_date)
-    base_covid_data = get_df_from_sql(database, base_covid_data_query)
+        # COVID-19 related sickness absence data
+        base_covid_data = run_query(database, queries['base_covid_data'], 'base_covid_data')
+
+        # Shared dictionary for the grouping columns, so every breakdown groups on integer codes
+        category_dictionary = build_category_dictionary(run_query(database, queries['category_values'], 'category_values'))
+        base_absence_data = encode_categoricals(base_absence_data, category_dictionary)
+        base_reason_staff_data = encode_categoricals(base_reason_staff_data, category_dictionary)
+        base_benchmarking_data = encode_categoricals(base_benchmarking_data, category_dictionary)
+        base_covid_data = encode_categoricals(base_covid_data, category_dictionary)
+
+    # the time and size of each query, to tell a slow warehouse from a slow network or pandas
+    write_extraction_report(log_dir)
     
     #### CSV and Excel production ####
+
+    with profile_stage('breakdowns', log_dir, profiler, stage_to_profile):
+        from absence_rates import create_absence_rates_breakdowns, create_org_absence_breakdowns, agg_reporting_orgs
+        from reason_and_staff import create_reason_absence_breakdowns, create_org_reason_cube
+        from benchmarking_tool import agg_benchmarking_orgs, create_benchmarking_tool, create_benchmark_group_comparators
+        from covid_table import (create_covid_breakdowns, create_covid_orgs_breakdowns, create_covid_breakdowns_duckdb,
+                                covid_joined_table, covid_final_table)
+        from history_store import write_to_history_store
+        from intermediates import write_intermediate
+        from rolling_rates import update_rolling_sums, create_rolling_absence_rates
+
+        # Sickness Absence CSVs
+        csv_1_path = output_dir / f"csv_absence_excel_production_{start_date}.csv" # used to create the Absence excel tables
+        csv_1_outputs = create_absence_rates_breakdowns(base_absence_data)
+        write_output(csv_1_outputs, csv_1_path, output_formats, csv_writer)
+
+        csv_2_path = output_dir / f"csv_absence_rates_{start_date}.csv"
+        csv_2_outputs = create_org_absence_breakdowns(base_absence_data, month_date)
+        write_output(csv_2_outputs, csv_2_path, output_formats, csv_writer)
     
-    # Sickness Absence CSVs
-    csv_1_path = output_dir / f"csv_absence_excel_production_{start_date}.csv" # used to create the Absence excel tables
-    csv_1_outputs = create_absence_rates_breakdowns(base_absence_data)
-    csv_1_outputs.to_csv(csv_1_path, index=False)
-
-    csv_2_path = output_dir / f"csv_absence_rates_{start_date}.csv"
-    csv_2_outputs = create_org_absence_breakdowns(base_absence_data, month_date)
-    csv_2_outputs.to_csv(csv_2_path, index=False)
-    
-    # Sickness Absence by reason and staff group CSV
-    reason_absence_path = output_dir / f"reason_absence_{start_date}.csv"
-    reason_absence_outputs = create_reason_absence_breakdowns(base_reason_staff_data, month_date)
-    reason_absence_outputs.to_csv(reason_absence_path, index=False)
+        # Sickness Absence by reason and staff group CSV
+        reason_absence_path = output_dir / f"reason_absence_{start_date}.csv"
+        reason_absence_outputs = create_reason_absence_breakdowns(base_reason_staff_data, month_date)
+        write_output(reason_absence_outputs, reason_absence_path, output_formats, csv_writer)
+
+        # Sickness Absence by organisation, staff group and reason CSV
+        org_reason_cube_path = output_dir / f"org_reason_cube_{start_date}.csv"
+        org_reason_cube_outputs = create_org_reason_cube(base_reason_staff_data, month_date)
+        write_output(org_reason_cube_outputs, org_reason_cube_path, output_formats, csv_writer)
     
-    # Benchmarking sickness absence CSV
-    benchmarking_csv_path = output_dir / f"benchmarking_csv_{start_date}.csv"
-    benchmarking_inter_data = agg_benchmarking_orgs(base_benchmarking_data)
-    benchmarking_csv_outputs = create_benchmarking_tool(benchmarking_inter_data, base_latest_orgs_data, month_date)
-    benchmarking_csv_outputs.to_csv(benchmarking_csv_path, index=False)
-
-    # COVID-19 related sickness absence CSV
-    covid_path = output_dir / f"covid_{start_date}.csv"
-    covid_inter_data = create_covid_breakdowns(base_covid_data)
-    covid_inter_org_data = create_covid_orgs_breakdowns(base_covid_data)
-    covid_joined_orgs = covid_joined_table(covid_inter_org_data, base_latest_orgs_data)
-    covid_outputs = covid_final_table(covid_inter_data, covid_joined_orgs, month_date)
-    covid_outputs.to_csv(covid_path, index=False)
+        # Benchmarking sickness absence CSV
+        benchmarking_csv_path = output_dir / f"benchmarking_csv_{start_date}.csv"
+        benchmarking_inter_data = agg_benchmarking_orgs(base_benchmarking_data)
+        benchmarking_csv_outputs = create_benchmarking_tool(benchmarking_inter_data, latest_org_lookup, month_date)
+        write_output(benchmarking_csv_outputs, benchmarking_csv_path, output_formats, csv_writer)
+
+        # Benchmark group percentile bands and ranks
+        benchmarking_comparators_path = output_dir / f"benchmarking_comparators_{start_date}.csv"
+        benchmarking_comparators_outputs = create_benchmark_group_comparators(benchmarking_csv_outputs)
+        write_output(benchmarking_comparators_outputs, benchmarking_comparators_path, output_formats, csv_writer)
+
+        # COVID-19 related sickness absence CSV
+        covid_path = output_dir / f"covid_{start_date}.csv"
+        if aggregation_engine == 'duckdb':
+            covid_inter_data, covid_inter_org_data = create_covid_breakdowns_duckdb(base_covid_data)
+        else:
+            covid_inter_data = create_covid_breakdowns(base_covid_data)
+            covid_inter_org_data = create_covid_orgs_breakdowns(base_covid_data)
+        covid_joined_orgs = covid_joined_table(covid_inter_org_data, latest_org_lookup)
+        covid_outputs = covid_final_table(covid_inter_data, covid_joined_orgs, month_date)
+        write_output(covid_outputs, covid_path, output_formats, csv_writer)
+
+        # Save the dataframes handed between stages as Arrow IPC files, which other processes can memory-map
+        if intermediate_dir:
+            intermediate_outputs = {
+                'benchmarking_inter_data': benchmarking_inter_data,
+                'covid_inter_data': covid_inter_data,
+                'covid_inter_org_data': covid_inter_org_data
+            }
+            for name, intermediate in intermediate_outputs.items():
+                write_intermediate(intermediate, intermediate_dir, name)
+
+        # Add this month's aggregates to the history store used for the time series
+        if history_dir:
+            history_outputs = {
+                'csv_absence_excel_production': csv_1_outputs,
+                'csv_absence_rates': csv_2_outputs,
+                'reason_absence': reason_absence_outputs,
+                'org_reason_cube': org_reason_cube_outputs,
+                'benchmarking_csv': benchmarking_csv_outputs,
+                'benchmarking_comparators': benchmarking_comparators_outputs,
+                'covid': covid_outputs
+            }
+            for output_name, outputs in history_outputs.items():
+                write_to_history_store(outputs, history_dir, output_name, start_date)
+
+            # Rolling 12 month rates, updated from last month's rolling sums in the history store
+            csv_1_rolling_path = output_dir / f"csv_absence_rolling_12_months_{start_date}.csv"
+            csv_1_rolling_sums = update_rolling_sums(csv_1_outputs, history_dir, 'csv_absence_excel_production', start_date)
+            write_output(create_rolling_absence_rates(csv_1_rolling_sums, month_date), csv_1_rolling_path, output_formats, csv_writer)
+
+            # the org sums before suppression, as suppressed months still count towards the rolling rates
+            csv_2_rolling_path = output_dir / f"csv_absence_rates_rolling_12_months_{start_date}.csv"
+            org_monthly_sums = agg_reporting_orgs(base_absence_data, {'FTE_DAYS_LOST': 'sum', 'FTE_DAYS_AVAILABLE': 'sum'}, month_date)
+            csv_2_rolling_sums = update_rolling_sums(org_monthly_sums, history_dir, 'csv_absence_rates', start_date)
+            write_output(create_rolling_absence_rates(csv_2_rolling_sums, month_date, suppress=True), csv_2_rolling_path, output_formats, csv_writer)
+        else:
+            logger.info("No history_dir in config.toml, not adding the outputs to the history store")
     
-    # To produce Sickness Absence Monthly Tables
-    excel_template = template_dir / 'sickness_absence_monthly_template.xlsx'
-    excel_output = output_dir / f"NHS_sickness_absence_rates_{start_date}.xlsx"
-    table_1_data = write_excel.prepare_table_1(csv_1_path)
-    table_2_data = write_excel.prepare_table_2(csv_1_path)
-    table_3_data = write_excel.prepare_table_3(csv_1_path)
-
-    # Sickness Absence Monthly Table 2 tag data groups
-    table_2_1_data = write_excel.prepare_table_2_1(table_2_data)
-    table_2_2_data = write_excel.prepare_table_2_2(table_2_data)
-    table_2_3_data = write_excel.prepare_table_2_3(table_2_data)
-    table_2_4_data = write_excel.prepare_table_2_4(table_2_data)
-    table_2_5_data = write_excel.prepare_table_2_5(table_2_data)
-    table_2_6_data = write_excel.prepare_table_2_6(table_2_data)
-    table_2_7_data = write_excel.prepare_table_2_7(table_2_data)
-
-    # Prepare the list of excel tables you want to write to
-    tables = [
-        {"sheet_name": "Table 1", "tag": "tag_table1", "data": table_1_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_1", "data": table_2_1_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_2", "data": table_2_2_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_3", "data": table_2_3_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_4", "data": table_2_4_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_5", "data": table_2_5_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_6", "data": table_2_6_data},
-        {"sheet_name": "Table 2", "tag": "tag_table2_7", "data": table_2_7_data},
-        {"sheet_name": "Table 3", "tag": "tag_table_3", "data": table_3_data}
-    ]
-    write_excel.write_tables_to_excel(tables, excel_template, excel_output)
+    with profile_stage('excel', log_dir, profiler, stage_to_profile):
+        import write_excel
+        import write_reason_absence_excel
+
+        # To produce Sickness Absence Monthly Tables
+        excel_template = template_dir / 'sickness_absence_monthly_template.xlsx'
+        excel_output = output_dir / f"NHS_sickness_absence_rates_{start_date}.xlsx"
+        table_1_data = write_excel.prepare_table_1(csv_1_path)
+        table_2_data = write_excel.prepare_table_2(csv_1_path)
+        table_3_data = write_excel.prepare_table_3(csv_1_path)
+
+        # Sickness Absence Monthly Table 2 tag data groups
+        table_2_1_data = write_excel.prepare_table_2_1(table_2_data)
+        table_2_2_data = write_excel.prepare_table_2_2(table_2_data)
+        table_2_3_data = write_excel.prepare_table_2_3(table_2_data)
+        table_2_4_data = write_excel.prepare_table_2_4(table_2_data)
+        table_2_5_data = write_excel.prepare_table_2_5(table_2_data)
+        table_2_6_data = write_excel.prepare_table_2_6(table_2_data)
+        table_2_7_data = write_excel.prepare_table_2_7(table_2_data)
+
+        # Prepare the list of excel tables you want to write to
+        tables = [
+            {"sheet_name": "Table 1", "tag": "tag_table1", "data": table_1_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_1", "data": table_2_1_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_2", "data": table_2_2_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_3", "data": table_2_3_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_4", "data": table_2_4_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_5", "data": table_2_5_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_6", "data": table_2_6_data},
+            {"sheet_name": "Table 2", "tag": "tag_table2_7", "data": table_2_7_data},
+            {"sheet_name": "Table 3", "tag": "tag_table_3", "data": table_3_data}
+        ]
+        write_excel.write_tables_to_excel(tables, excel_template, excel_output)
            
-    # To produce Sickness Absence by reason and staff Group tables
-    reason_excel_template = template_dir / 'NHS_Sickness_by_reason_and_staff_template.xlsx'
-    reason_excel_output = output_dir / f"NHS_Sickness_by_reason_and_staff_{start_date}.xlsx"
-    reason_table_1_data = write_reason_absence_excel.prepare_reason_table_1(reason_absence_path)
-    reason_table_2_data = write_reason_absence_excel.prepare_reason_table_2(reason_absence_path)
-
-    # Sickness Absence by reason and staff group Table 2 tag data groups
-    reason_table_1_1_data = write_reason_absence_excel.prepare_reason_table_1_1(reason_table_1_data)
-    reason_table_1_2_data = write_reason_absence_excel.prepare_reason_table_1_2(reason_table_1_data)
-    reason_table_1_3_a_data = write_reason_absence_excel.prepare_reason_table_1_3_a(reason_table_1_data)
-    reason_table_1_3_b_data = write_reason_absence_excel.prepare_reason_table_1_3_b(reason_table_1_data)
-    reason_table_1_3_c_data = write_reason_absence_excel.prepare_reason_table_1_3_c(reason_table_1_data)
-    reason_table_1_3_d_data = write_reason_absence_excel.prepare_reason_table_1_3_d(reason_table_1_data)
-    reason_table_1_3_e_data = write_reason_absence_excel.prepare_reason_table_1_3_e(reason_table_1_data)
-    reason_table_1_3_f_data = write_reason_absence_excel.prepare_reason_table_1_3_f(reason_table_1_data)
-    reason_table_1_3_g_data = write_reason_absence_excel.prepare_reason_table_1_3_g(reason_table_1_data)
-    reason_table_1_3_h_data = write_reason_absence_excel.prepare_reason_table_1_3_h(reason_table_1_data)
-    reason_table_1_3_i_data = write_reason_absence_excel.prepare_reason_table_1_3_i(reason_table_1_data)
-    reason_table_1_3_j_data = write_reason_absence_excel.prepare_reason_table_1_3_j(reason_table_1_data)
-    reason_table_1_3_k_data = write_reason_absence_excel.prepare_reason_table_1_3_k(reason_table_1_data)
-    reason_table_1_4_a_data = write_reason_absence_excel.prepare_reason_table_1_4_a(reason_table_1_data)
-    reason_table_1_4_b_data = write_reason_absence_excel.prepare_reason_table_1_4_b(reason_table_1_data)
-    reason_table_1_4_c_data = write_reason_absence_excel.prepare_reason_table_1_4_c(reason_table_1_data)
-    reason_table_1_4_d_data = write_reason_absence_excel.prepare_reason_table_1_4_d(reason_table_1_data)
-    reason_table_1_5_a_data = write_reason_absence_excel.prepare_reason_table_1_5_a(reason_table_1_data)
-    reason_table_1_5_b_data = write_reason_absence_excel.prepare_reason_table_1_5_b(reason_table_1_data)
-    reason_table_1_5_c_data = write_reason_absence_excel.prepare_reason_table_1_5_c(reason_table_1_data)
-    reason_table_1_5_d_data = write_reason_absence_excel.prepare_reason_table_1_5_d(reason_table_1_data)
-    reason_table_1_6_a_data = write_reason_absence_excel.prepare_reason_table_1_6_a(reason_table_1_data)
-    reason_table_1_6_b_data = write_reason_absence_excel.prepare_reason_table_1_6_b(reason_table_1_data)
-    reason_table_1_6_c_data = write_reason_absence_excel.prepare_reason_table_1_6_c(reason_table_1_data)
-    reason_table_1_6_d_data = write_reason_absence_excel.prepare_reason_table_1_6_d(reason_table_1_data)
-    reason_table_1_6_e_data = write_reason_absence_excel.prepare_reason_table_1_6_e(reason_table_1_data)
-    reason_table_1_7_data = write_reason_absence_excel.prepare_reason_table_1_7(reason_table_1_data)
-
-    reason_table_2_1_data = write_reason_absence_excel.prepare_reason_table_2_1(reason_table_2_data)
-    reason_table_2_2_data = write_reason_absence_excel.prepare_reason_table_2_2(reason_table_2_data)
-    reason_table_2_3_a_data = write_reason_absence_excel.prepare_reason_table_2_3_a(reason_table_2_data)
-    reason_table_2_3_b_data = write_reason_absence_excel.prepare_reason_table_2_3_b(reason_table_2_data)
-    reason_table_2_3_c_data = write_reason_absence_excel.prepare_reason_table_2_3_c(reason_table_2_data)
-    reason_table_2_3_d_data = write_reason_absence_excel.prepare_reason_table_2_3_d(reason_table_2_data)
-    reason_table_2_3_e_data = write_reason_absence_excel.prepare_reason_table_2_3_e(reason_table_2_data)
-    reason_table_2_3_f_data = write_reason_absence_excel.prepare_reason_table_2_3_f(reason_table_2_data)
-    reason_table_2_3_g_data = write_reason_absence_excel.prepare_reason_table_2_3_g(reason_table_2_data)
-    reason_table_2_3_h_data = write_reason_absence_excel.prepare_reason_table_2_3_h(reason_table_2_data)
-    reason_table_2_3_i_data = write_reason_absence_excel.prepare_reason_table_2_3_i(reason_table_2_data)
-    reason_table_2_3_j_data = write_reason_absence_excel.prepare_reason_table_2_3_j(reason_table_2_data)
-    reason_table_2_3_k_data = write_reason_absence_excel.prepare_reason_table_2_3_k(reason_table_2_data)
-    reason_table_2_4_a_data = write_reason_absence_excel.prepare_reason_table_2_4_a(reason_table_2_data)
-    reason_table_2_4_b_data = write_reason_absence_excel.prepare_reason_table_2_4_b(reason_table_2_data)
-    reason_table_2_4_c_data = write_reason_absence_excel.prepare_reason_table_2_4_c(reason_table_2_data)
-    reason_table_2_4_d_data = write_reason_absence_excel.prepare_reason_table_2_4_d(reason_table_2_data)
-    reason_table_2_5_a_data = write_reason_absence_excel.prepare_reason_table_2_5_a(reason_table_2_data)
-    reason_table_2_5_b_data = write_reason_absence_excel.prepare_reason_table_2_5_b(reason_table_2_data)
-    reason_table_2_5_c_data = write_reason_absence_excel.prepare_reason_table_2_5_c(reason_table_2_data)
-    reason_table_2_5_d_data = write_reason_absence_excel.prepare_reason_table_2_5_d(reason_table_2_data)
-    reason_table_2_6_a_data = write_reason_absence_excel.prepare_reason_table_2_6_a(reason_table_2_data)
-    reason_table_2_6_b_data = write_reason_absence_excel.prepare_reason_table_2_6_b(reason_table_2_data)
-    reason_table_2_6_c_data = write_reason_absence_excel.prepare_reason_table_2_6_c(reason_table_2_data)
-    reason_table_2_6_d_data = write_reason_absence_excel.prepare_reason_table_2_6_d(reason_table_2_data)
-    reason_table_2_6_e_data = write_reason_absence_excel.prepare_reason_table_2_6_e(reason_table_2_data)
-    reason_table_2_7_data = write_reason_absence_excel.prepare_reason_table_2_7(reason_table_2_data)
-
-    # Prepare the list of excel tables you want to write to
-    reason_tables = [
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_1", "data": reason_table_1_1_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_2", "data": reason_table_1_2_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_a", "data": reason_table_1_3_a_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_b", "data": reason_table_1_3_b_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_c", "data": reason_table_1_3_c_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_d", "data": reason_table_1_3_d_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_e", "data": reason_table_1_3_e_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_f", "data": reason_table_1_3_f_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_g", "data": reason_table_1_3_g_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_h", "data": reason_table_1_3_h_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_i", "data": reason_table_1_3_i_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_j", "data": reason_table_1_3_j_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_k", "data": reason_table_1_3_k_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_a", "data": reason_table_1_4_a_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_b", "data": reason_table_1_4_b_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_c", "data": reason_table_1_4_c_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_d", "data": reason_table_1_4_d_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_a", "data": reason_table_1_5_a_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_b", "data": reason_table_1_5_b_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_c", "data": reason_table_1_5_c_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_d", "data": reason_table_1_5_d_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_a", "data": reason_table_1_6_a_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_b", "data": reason_table_1_6_b_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_c", "data": reason_table_1_6_c_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_d", "data": reason_table_1_6_d_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_e", "data": reason_table_1_6_e_data},
-        {"sheet_name": "Table 1 (%)", "tag": "tag_table1_7", "data": reason_table_1_7_data},
-
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_1", "data": reason_table_2_1_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_2", "data": reason_table_2_2_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_a", "data": reason_table_2_3_a_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_b", "data": reason_table_2_3_b_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_c", "data": reason_table_2_3_c_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_d", "data": reason_table_2_3_d_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_e", "data": reason_table_2_3_e_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_f", "data": reason_table_2_3_f_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_g", "data": reason_table_2_3_g_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_h", "data": reason_table_2_3_h_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_i", "data": reason_table_2_3_i_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_j", "data": reason_table_2_3_j_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_k", "data": reason_table_2_3_k_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_a", "data": reason_table_2_4_a_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_b", "data": reason_table_2_4_b_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_c", "data": reason_table_2_4_c_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_d", "data": reason_table_2_4_d_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_a", "data": reason_table_2_5_a_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_b", "data": reason_table_2_5_b_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_c", "data": reason_table_2_5_c_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_d", "data": reason_table_2_5_d_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_a", "data": reason_table_2_6_a_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_b", "data": reason_table_2_6_b_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_c", "data": reason_table_2_6_c_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_d", "data": reason_table_2_6_d_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_e", "data": reason_table_2_6_e_data},
-        {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_7", "data": reason_table_2_7_data},
-    ]
-    write_excel.write_tables_to_excel(reason_tables, reason_excel_template, reason_excel_output)   
+        # To produce Sickness Absence by reason and staff Group tables
+        reason_excel_template = template_dir / 'NHS_Sickness_by_reason_and_staff_template.xlsx'
+        reason_excel_output = output_dir / f"NHS_Sickness_by_reason_and_staff_{start_date}.xlsx"
+        reason_table_1_data = write_reason_absence_excel.prepare_reason_table_1(reason_absence_path)
+        reason_table_2_data = write_reason_absence_excel.prepare_reason_table_2(reason_absence_path)
+
+        # Sickness Absence by reason and staff group Table 2 tag data groups
+        reason_table_1_1_data = write_reason_absence_excel.prepare_reason_table_1_1(reason_table_1_data)
+        reason_table_1_2_data = write_reason_absence_excel.prepare_reason_table_1_2(reason_table_1_data)
+        reason_table_1_3_a_data = write_reason_absence_excel.prepare_reason_table_1_3_a(reason_table_1_data)
+        reason_table_1_3_b_data = write_reason_absence_excel.prepare_reason_table_1_3_b(reason_table_1_data)
+        reason_table_1_3_c_data = write_reason_absence_excel.prepare_reason_table_1_3_c(reason_table_1_data)
+        reason_table_1_3_d_data = write_reason_absence_excel.prepare_reason_table_1_3_d(reason_table_1_data)
+        reason_table_1_3_e_data = write_reason_absence_excel.prepare_reason_table_1_3_e(reason_table_1_data)
+        reason_table_1_3_f_data = write_reason_absence_excel.prepare_reason_table_1_3_f(reason_table_1_data)
+        reason_table_1_3_g_data = write_reason_absence_excel.prepare_reason_table_1_3_g(reason_table_1_data)
+        reason_table_1_3_h_data = write_reason_absence_excel.prepare_reason_table_1_3_h(reason_table_1_data)
+        reason_table_1_3_i_data = write_reason_absence_excel.prepare_reason_table_1_3_i(reason_table_1_data)
+        reason_table_1_3_j_data = write_reason_absence_excel.prepare_reason_table_1_3_j(reason_table_1_data)
+        reason_table_1_3_k_data = write_reason_absence_excel.prepare_reason_table_1_3_k(reason_table_1_data)
+        reason_table_1_4_a_data = write_reason_absence_excel.prepare_reason_table_1_4_a(reason_table_1_data)
+        reason_table_1_4_b_data = write_reason_absence_excel.prepare_reason_table_1_4_b(reason_table_1_data)
+        reason_table_1_4_c_data = write_reason_absence_excel.prepare_reason_table_1_4_c(reason_table_1_data)
+        reason_table_1_4_d_data = write_reason_absence_excel.prepare_reason_table_1_4_d(reason_table_1_data)
+        reason_table_1_5_a_data = write_reason_absence_excel.prepare_reason_table_1_5_a(reason_table_1_data)
+        reason_table_1_5_b_data = write_reason_absence_excel.prepare_reason_table_1_5_b(reason_table_1_data)
+        reason_table_1_5_c_data = write_reason_absence_excel.prepare_reason_table_1_5_c(reason_table_1_data)
+        reason_table_1_5_d_data = write_reason_absence_excel.prepare_reason_table_1_5_d(reason_table_1_data)
+        reason_table_1_6_a_data = write_reason_absence_excel.prepare_reason_table_1_6_a(reason_table_1_data)
+        reason_table_1_6_b_data = write_reason_absence_excel.prepare_reason_table_1_6_b(reason_table_1_data)
+        reason_table_1_6_c_data = write_reason_absence_excel.prepare_reason_table_1_6_c(reason_table_1_data)
+        reason_table_1_6_d_data = write_reason_absence_excel.prepare_reason_table_1_6_d(reason_table_1_data)
+        reason_table_1_6_e_data = write_reason_absence_excel.prepare_reason_table_1_6_e(reason_table_1_data)
+        reason_table_1_7_data = write_reason_absence_excel.prepare_reason_table_1_7(reason_table_1_data)
+
+        reason_table_2_1_data = write_reason_absence_excel.prepare_reason_table_2_1(reason_table_2_data)
+        reason_table_2_2_data = write_reason_absence_excel.prepare_reason_table_2_2(reason_table_2_data)
+        reason_table_2_3_a_data = write_reason_absence_excel.prepare_reason_table_2_3_a(reason_table_2_data)
+        reason_table_2_3_b_data = write_reason_absence_excel.prepare_reason_table_2_3_b(reason_table_2_data)
+        reason_table_2_3_c_data = write_reason_absence_excel.prepare_reason_table_2_3_c(reason_table_2_data)
+        reason_table_2_3_d_data = write_reason_absence_excel.prepare_reason_table_2_3_d(reason_table_2_data)
+        reason_table_2_3_e_data = write_reason_absence_excel.prepare_reason_table_2_3_e(reason_table_2_data)
+        reason_table_2_3_f_data = write_reason_absence_excel.prepare_reason_table_2_3_f(reason_table_2_data)
+        reason_table_2_3_g_data = write_reason_absence_excel.prepare_reason_table_2_3_g(reason_table_2_data)
+        reason_table_2_3_h_data = write_reason_absence_excel.prepare_reason_table_2_3_h(reason_table_2_data)
+        reason_table_2_3_i_data = write_reason_absence_excel.prepare_reason_table_2_3_i(reason_table_2_data)
+        reason_table_2_3_j_data = write_reason_absence_excel.prepare_reason_table_2_3_j(reason_table_2_data)
+        reason_table_2_3_k_data = write_reason_absence_excel.prepare_reason_table_2_3_k(reason_table_2_data)
+        reason_table_2_4_a_data = write_reason_absence_excel.prepare_reason_table_2_4_a(reason_table_2_data)
+        reason_table_2_4_b_data = write_reason_absence_excel.prepare_reason_table_2_4_b(reason_table_2_data)
+        reason_table_2_4_c_data = write_reason_absence_excel.prepare_reason_table_2_4_c(reason_table_2_data)
+        reason_table_2_4_d_data = write_reason_absence_excel.prepare_reason_table_2_4_d(reason_table_2_data)
+        reason_table_2_5_a_data = write_reason_absence_excel.prepare_reason_table_2_5_a(reason_table_2_data)
+        reason_table_2_5_b_data = write_reason_absence_excel.prepare_reason_table_2_5_b(reason_table_2_data)
+        reason_table_2_5_c_data = write_reason_absence_excel.prepare_reason_table_2_5_c(reason_table_2_data)
+        reason_table_2_5_d_data = write_reason_absence_excel.prepare_reason_table_2_5_d(reason_table_2_data)
+        reason_table_2_6_a_data = write_reason_absence_excel.prepare_reason_table_2_6_a(reason_table_2_data)
+        reason_table_2_6_b_data = write_reason_absence_excel.prepare_reason_table_2_6_b(reason_table_2_data)
+        reason_table_2_6_c_data = write_reason_absence_excel.prepare_reason_table_2_6_c(reason_table_2_data)
+        reason_table_2_6_d_data = write_reason_absence_excel.prepare_reason_table_2_6_d(reason_table_2_data)
+        reason_table_2_6_e_data = write_reason_absence_excel.prepare_reason_table_2_6_e(reason_table_2_data)
+        reason_table_2_7_data = write_reason_absence_excel.prepare_reason_table_2_7(reason_table_2_data)
+
+        # Prepare the list of excel tables you want to write to
+        reason_tables = [
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_1", "data": reason_table_1_1_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_2", "data": reason_table_1_2_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_a", "data": reason_table_1_3_a_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_b", "data": reason_table_1_3_b_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_c", "data": reason_table_1_3_c_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_d", "data": reason_table_1_3_d_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_e", "data": reason_table_1_3_e_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_f", "data": reason_table_1_3_f_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_g", "data": reason_table_1_3_g_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_h", "data": reason_table_1_3_h_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_i", "data": reason_table_1_3_i_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_j", "data": reason_table_1_3_j_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_3_k", "data": reason_table_1_3_k_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_a", "data": reason_table_1_4_a_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_b", "data": reason_table_1_4_b_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_c", "data": reason_table_1_4_c_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_4_d", "data": reason_table_1_4_d_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_a", "data": reason_table_1_5_a_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_b", "data": reason_table_1_5_b_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_c", "data": reason_table_1_5_c_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_5_d", "data": reason_table_1_5_d_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_a", "data": reason_table_1_6_a_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_b", "data": reason_table_1_6_b_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_c", "data": reason_table_1_6_c_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_d", "data": reason_table_1_6_d_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_6_e", "data": reason_table_1_6_e_data},
+            {"sheet_name": "Table 1 (%)", "tag": "tag_table1_7", "data": reason_table_1_7_data},
+
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_1", "data": reason_table_2_1_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_2", "data": reason_table_2_2_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_a", "data": reason_table_2_3_a_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_b", "data": reason_table_2_3_b_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_c", "data": reason_table_2_3_c_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_d", "data": reason_table_2_3_d_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_e", "data": reason_table_2_3_e_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_f", "data": reason_table_2_3_f_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_g", "data": reason_table_2_3_g_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_h", "data": reason_table_2_3_h_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_i", "data": reason_table_2_3_i_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_j", "data": reason_table_2_3_j_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_3_k", "data": reason_table_2_3_k_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_a", "data": reason_table_2_4_a_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_b", "data": reason_table_2_4_b_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_c", "data": reason_table_2_4_c_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_4_d", "data": reason_table_2_4_d_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_a", "data": reason_table_2_5_a_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_b", "data": reason_table_2_5_b_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_c", "data": reason_table_2_5_c_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_5_d", "data": reason_table_2_5_d_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_a", "data": reason_table_2_6_a_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_b", "data": reason_table_2_6_b_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_c", "data": reason_table_2_6_c_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_d", "data": reason_table_2_6_d_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_6_e", "data": reason_table_2_6_e_data},
+            {"sheet_name": "Table 2 (Count)", "tag": "tag_table2_7", "data": reason_table_2_7_data},
+        ]
+        write_excel.write_tables_to_excel(reason_tables, reason_excel_template, reason_excel_output)   
 
 if __name__ == '__main__':
+    args = get_profile_args("Produce the NHS Sickness Absence publication", PROFILE_STAGES)
+    if args.dry_run:
+        sys.exit(0 if main(dry_run=True) else 1)
     print(f"Running publication")
     start_time = timeit.default_timer()
-    main()
+    with profile_stage('main', Path(get_config()['log_dir']), args.profile, args.profile_stage):
+        main(args.profile, args.profile_stage, resume=args.resume)
     total_time = timeit.default_timer() - start_time
     print(f"Running time of create_publication: {int(total_time / 60)} minutes and {round(total_time%60)} seconds.")
@@ -0,0 +1,338 @@
+"""
+Writes the publication outputs in the formats set in config.toml.
+
+The plain CSV is always written, as it is the public release and the Excel tables are
+made from it. Parquet (with dictionary encoded string columns) and gzip or zstd compressed
+CSVs can be written alongside it for the dashboards and archives that reload the outputs.
+The formats of an output are written at the same time, one thread each.
+
+The plain CSV can be written by pandas, or by write_csv_arrow, which formats the columns
+with numpy and joins them into lines with pyarrow. write_csv_arrow writes exactly the same
+bytes as DataFrame.to_csv(index=False), and falls back to it for anything it can't format.
+"""
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from history_store import prepare_for_parquet
+
+logger = logging.getLogger(__name__)
+
+# The output_formats that can be set in config.toml and the file extension of each
+OUTPUT_FORMATS = {'csv': '.csv',
+                  'csv.gz': '.csv.gz',
+                  'csv.zst': '.csv.zst',
+                  'parquet': '.parquet'}
+
+# mtime is fixed so the same output always gives the same gzip file
+CSV_COMPRESSION = {'csv': None,
+                   'csv.gz': {'method': 'gzip', 'mtime': 0},
+                   'csv.zst': {'method': 'zstd'}}
+
+# The csv_writer that can be set in config.toml
+CSV_WRITERS = ['pandas', 'arrow']
+
+# Rows formatted at a time by write_csv_arrow, each chunk on its own thread
+CSV_CHUNK_ROWS = 250_000
+
+# Values containing these characters are quoted, as csv.QUOTE_MINIMAL does
+CSV_SPECIAL_CHARACTERS = [',', '"', '\r', '\n']
+
+
+def get_output_formats(config):
+    """
+    Creates a function to read the output formats from config.toml
+
+    Output:
+        The list of formats to write, always starting with 'csv'
+    """
+    output_formats = config.get('output_formats', ['csv'])
+    unknown_formats = [output_format for output_format in output_formats if output_format not in OUTPUT_FORMATS]
+    if unknown_formats:
+        raise ValueError(f"Unknown output_formats {unknown_formats} in config.toml, use any of {list(OUTPUT_FORMATS)}")
+
+    return ['csv'] + [output_format for output_format in dict.fromkeys(output_formats) if output_format != 'csv']
+
+
+def get_csv_writer(config):
+    """
+    Creates a function to read the CSV writer from config.toml
+
+    Output:
+        'pandas' or 'arrow'
+    """
+    csv_writer = config.get('csv_writer', 'pandas')
+    if csv_writer not in CSV_WRITERS:
+        raise ValueError(f"Unknown csv_writer '{csv_writer}' in config.toml, use one of {CSV_WRITERS}")
+
+    return csv_writer
+
+
+def get_output_path(csv_path, output_format):
+    """
+    Creates a function to find the path of an output in one of the output formats
+
+    Inputs:
+        csv_path: path of the plain CSV, e.g. output_dir/covid_2021-11-30.csv
+        output_format: one of OUTPUT_FORMATS
+
+    Output:
+        The path with the extension of the format, e.g. output_dir/covid_2021-11-30.parquet
+    """
+    return Path(csv_path).with_suffix(OUTPUT_FORMATS[output_format])
+
+
+def prepare_for_dictionary_encoding(df):
+    """
+    Creates a function to give an output the column types it is stored with in Parquet
+
+    The suppressed blanks become nulls and the numeric columns keep their types (see
+    history_store.prepare_for_parquet). String columns are made categorical, so they are
+    stored dictionary encoded and read back as categoricals.
+    """
+    df = prepare_for_parquet(df)
+    string_cols = [col for col in df.columns if pd.api.types.is_string_dtype(df[col].dtype)]
+
+    return df.astype({col: 'category' for col in string_cols})
+
+
+def quote_csv_values(strings):
+    """
+    Creates a function to quote the strings that contain a delimiter, quote or line break
+
+    Output:
+        numpy array of the strings as they are written in the CSV
+    """
+    strings = pd.Series(strings, dtype=object)
+    needs_quotes = np.zeros(len(strings), dtype=bool)
+    for character in CSV_SPECIAL_CHARACTERS:
+        needs_quotes |= strings.str.contains(character, regex=False).to_numpy(dtype=bool)
+    if needs_quotes.any():
+        strings[needs_quotes] = '"' + strings[needs_quotes].str.replace('"', '""', regex=False) + '"'
+
+    return strings.to_numpy(dtype=object)
+
+
+def take_formatted_values(codes, strings):
+    """
+    Creates a function to build a formatted column from its formatted distinct values
+
+    Inputs:
+        codes: numpy array of the position of each row's value in strings, -1 for a blank
+        strings: the formatted distinct values, as a list, numpy array or pyarrow array
+
+    Output:
+        pyarrow large_string array of the formatted column
+    """
+    import pyarrow as pa
+
+    codes = np.where(codes < 0, len(strings), codes)
+    strings = pa.concat_arrays([pa.array(strings, type=pa.large_string()), pa.array([''], type=pa.large_string())])
+
+    return strings.take(pa.array(codes, type=pa.int64()))
+
+
+def format_numbers(values):
+    """
+    Creates a function to format numbers as numpy's astype(str) does, which is how pandas writes them
+
+    pyarrow formats the numbers, with the same shortest digits as Python's repr. Python writes
+    floats from 1e-4 up to 1e16 without an exponent and always with a decimal point, so '.0'
+    is added to pyarrow's whole numbers. numpy formats the floats outside that range, and
+    any that pyarrow writes with an exponent.
+
+    Output:
+        pyarrow large_string array of the formatted numbers
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    strings = pa.array(values).cast(pa.large_string())
+    if values.dtype != np.float64:
+        return strings if values.dtype.kind in 'iu' else pa.array(values.astype(str).astype(object), type=pa.large_string())
+
+    whole = pc.invert(pc.match_substring_regex(strings, '[.en]'))
+    strings = pc.if_else(whole, pc.binary_join_element_wise(strings, pa.scalar('.0', pa.large_string()), pa.scalar('', pa.large_string())), strings)
+
+    size = np.abs(values)
+    positional = (size == 0) | ((size >= 1e-4) & (size < 1e16))
+    numpy_formatted = np.asarray(pc.match_substring(strings, 'e')) | ~positional
+    if numpy_formatted.any():
+        strings = pc.replace_with_mask(strings, pa.array(numpy_formatted),
+                                       pa.array(values[numpy_formatted].astype(str).astype(object), type=pa.large_string()))
+
+    return strings
+
+
+def factorize_numbers(values):
+    """
+    Creates a function to find and format the distinct values of a numeric array
+
+    Floats are factorised on their bits, so -0.0 is kept apart from 0.0 as it is in to_csv.
+
+    Output:
+        codes (-1 for missing values) and the formatted distinct values
+    """
+    if values.dtype.kind == 'f':
+        missing = np.isnan(values)
+        codes, uniques = pd.factorize(values.view(f"i{values.dtype.itemsize}"))
+        codes[missing] = -1
+        return codes, format_numbers(uniques.view(values.dtype))
+
+    codes, uniques = pd.factorize(values)
+    return codes, format_numbers(uniques)
+
+
+def format_csv_column(series):
+    """
+    Creates a function to format a column as DataFrame.to_csv does
+
+    Only the distinct values are formatted. Numeric columns are formatted as numpy's
+    astype(str) does, as pandas uses it (see format_numbers). In object columns (e.g. rates suppressed with blanks) the
+    floats are formatted with repr and everything else with str, as the csv module does.
+    Strings with a delimiter, quote or line break are quoted. Missing values are blank.
+
+    Output:
+        pyarrow large_string array of the column's values as they are written in the CSV, or
+        None if the column has a type that is left to pandas (e.g. dates, extension dtypes
+        such as 'string', or object columns of np.float32 values)
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = format_csv_column(pd.Series(dtype.categories))
+        if categories is None:
+            return None
+        return take_formatted_values(series.cat.codes.to_numpy(), categories)
+    elif pd.api.types.is_extension_array_dtype(dtype):
+        # e.g. the 'string' and nullable integer dtypes, whose missing values are pd.NA
+        return None
+    elif dtype.kind in 'fiub':
+        return take_formatted_values(*factorize_numbers(series.to_numpy()))
+    elif not pd.api.types.is_string_dtype(dtype):
+        return None
+
+    values = series.to_numpy(dtype=object)
+    blank = pd.isna(values) | (values == '')
+    present = values[~blank]
+    codes = np.full(len(values), -1, dtype=np.int64)
+    value_type = pd.api.types.infer_dtype(present, skipna=False)
+    if value_type == 'string':
+        codes[~blank], uniques = pd.factorize(present)
+        strings = quote_csv_values(uniques)
+    elif value_type == 'floating' and not set(map(type, present)) <= {float, np.float64}:
+        # np.float32 and np.float16 are written with their own shortest digits, not as float64
+        return None
+    elif value_type in ['floating', 'integer']:
+        codes[~blank], strings = factorize_numbers(present.astype(float if value_type == 'floating' else np.int64))
+    else:
+        codes[~blank] = np.arange(len(present))
+        strings = quote_csv_values([repr(value) if isinstance(value, float) else str(value) for value in present])
+
+    return take_formatted_values(codes, strings)
+
+
+def format_csv_chunk(df, lineterminator):
+    """
+    Creates a function to format a chunk of rows into the bytes written to the CSV
+
+    Output:
+        A buffer of the chunk's lines, or None if one of the columns is left to pandas
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = []
+    for col in df.columns:
+        formatted = format_csv_column(df[col])
+        if formatted is None:
+            return None
+        columns.append(formatted)
+
+    lines = pc.binary_join_element_wise(*columns, pa.scalar(',', pa.large_string()))
+    lines = pc.binary_join_element_wise(lines, pa.scalar(lineterminator, pa.large_string()), pa.scalar('', pa.large_string()))
+    if len(lines) == 0:
+        return b''
+
+    # the lines are stored one after another, so the data buffer holds the chunk's CSV text
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int64)[lines.offset:lines.offset + len(lines) + 1]
+    return lines.buffers()[2][offsets[0]:offsets[-1]]
+
+
+def write_csv_arrow(df, path, lineterminator=os.linesep):
+    """
+    Creates a function to write a CSV with the same bytes as DataFrame.to_csv(path, index=False)
+
+    The rows are formatted in chunks of CSV_CHUNK_ROWS, on a thread each, and joined into lines
+    with pyarrow rather than by the csv module one value at a time. Outputs with a single
+    column or a column that can't be formatted (e.g. dates) are written by pandas.
+
+    Inputs:
+        df: one of the publication output dataframes
+        path: path of the CSV
+        lineterminator: line ending, os.linesep as in DataFrame.to_csv
+
+    Output:
+        The path that was written
+    """
+    if len(df.columns) < 2:
+        df.to_csv(path, index=False)
+        return path
+
+    chunks = [df.iloc[start:start + CSV_CHUNK_ROWS] for start in range(0, len(df), CSV_CHUNK_ROWS)]
+    with ThreadPoolExecutor() as executor:
+        formatted_chunks = list(executor.map(lambda chunk: format_csv_chunk(chunk, lineterminator), chunks))
+
+    if any(chunk is None for chunk in formatted_chunks):
+        logger.info(f"Writing {path} with pandas, as it has columns that are not formatted by the arrow CSV writer")
+        df.to_csv(path, index=False)
+        return path
+
+    header = ','.join(quote_csv_values([str(col) for col in df.columns])) + lineterminator
+    with open(path, 'wb') as f:
+        f.write(header.encode('utf-8'))
+        for chunk in formatted_chunks:
+            f.write(chunk)
+
+    return path
+
+
+def write_output_format(df, csv_path, output_format, csv_writer='pandas'):
+    """
+    Creates a function to write an output in one format
+
+    Output:
+        The path that was written
+    """
+    path = get_output_path(csv_path, output_format)
+    if output_format == 'parquet':
+        prepare_for_dictionary_encoding(df).to_parquet(path, index=False)
+    elif output_format == 'csv' and csv_writer == 'arrow':
+        write_csv_arrow(df, path)
+    else:
+        df.to_csv(path, index=False, compression=CSV_COMPRESSION[output_format])
+    logger.info(f"Written {len(df)} rows to {path}")
+
+    return path
+
+
+def write_output(df, csv_path, output_formats=('csv',), csv_writer='pandas'):
+    """
+    Creates a function to write one of the publication outputs in each of the output formats
+
+    Inputs:
+        df: one of the publication output dataframes
+        csv_path: path of the plain CSV. The other formats are written next to it.
+        output_formats: list returned by get_output_formats
+        csv_writer: 'pandas' or 'arrow', the writer of the plain CSV
+
+    Output:
+        dict of each output format to the path that was written
+    """
+    with ThreadPoolExecutor(max_workers=len(output_formats)) as executor:
+        futures = {output_format: executor.submit(write_output_format, df, csv_path, output_format, csv_writer)
+                   for output_format in output_formats}
+
+    return {output_format: future.result() for output_format, future in futures.items()}
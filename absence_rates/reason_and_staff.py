@@ -1,5 +1,6 @@
 import pandas as pd
 import logging
+from aggregation import sum_by_groups
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +32,10 @@ def sql_query_reason_staff(database, mds_table, staff_in_post, org_master, ref_t
                 ,[Staff Group]              AS [STAFF_GROUP]
                 ,[MAIN_STAFF_GROUP_NAME]
                 ,[STAFF_GROUP_1_NAME]
+                ,b.[Reporting Org code]     AS [ORG_CODE]
+                ,b.[Reporting Org name]     AS [ORG_NAME]
+                ,b.[NHSE_Region_Code]       AS [NHSE_REGION_CODE]
+                ,b.[NHSE_Region_Name]       AS [NHSE_REGION_NAME]
                 ,CASE WHEN [Absence Category] = 'Sickness' THEN [Wte Days Lost This Month] ELSE 0 END as [FTE_DAYS_LOST]
             from [{database}].[dbo].[{mds_table}] a
             inner join [{org_master}] b
@@ -73,6 +78,26 @@ ignored_staff_group = (
     'General payments', 'Unknown', 'Non-funded staff'
 )
 
+# The geographies of the organisation by staff group by reason cube, and the columns each is grouped by
+cube_geographies = {
+    'ENGLAND': [],
+    'REGION': ['NHSE_REGION_CODE', 'NHSE_REGION_NAME'],
+    'REPORTING_ORG': ['NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'ORG_NAME']
+}
+
+# The staff group breakdowns of the cube, and the column each is grouped by
+cube_staff_groups = {
+    'All staff groups': None,
+    'MAJOR STAFF GROUP': 'MAIN_STAFF_GROUP_NAME',
+    'MINOR STAFF GROUP': 'STAFF_GROUP_1_NAME',
+    'MINOR STAFF GRADES': 'GRADE'
+}
+
+# The staff group breakdowns of the cube that only include some of the staff, and the column and values they keep
+cube_staff_group_filters = {
+    'MINOR STAFF GRADES': ('BREED', ['Med'])
+}
+
 
 def agg_all_staff_all_reasons(df, cols_to_aggregate):
     """
@@ -87,8 +112,7 @@ def agg_all_staff_all_reasons(df, cols_to_aggregate):
     """
     logger.info("Producing the all staff, all reasons aggregation")
 
-    df_agg = (df.groupby('TM_END_DATE', as_index=False)
-            .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df, 'TM_END_DATE', cols_to_aggregate)
 
     df_agg['BREAKDOWN_TYPE'] = 'All staff groups'
     df_agg['STAFF_GROUP'] = 'All staff groups'
@@ -111,8 +135,7 @@ def agg_all_staff_reasons(df, cols_to_aggregate):
 
     df_filtered = df[(df['ATTENDANCE_REASON'].str.contains('|'.join(absence_reasons)))] 
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE', 'ATTENDANCE_REASON'], as_index=False)
-            .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df_filtered, ['TM_END_DATE', 'ATTENDANCE_REASON'], cols_to_aggregate)
             .rename({'ATTENDANCE_REASON':'REASON'}, axis=1))
 
     df_agg['BREAKDOWN_TYPE'] = 'All staff groups'
@@ -135,8 +158,7 @@ def agg_minor_groups_all_reasons(df, cols_to_aggregate):
 
     df_filtered = df[~df['STAFF_GROUP_1_NAME'].isin(ignored_staff_group)]
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE', 'STAFF_GROUP_1_NAME'], as_index=False)
-            .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df_filtered, ['TM_END_DATE', 'STAFF_GROUP_1_NAME'], cols_to_aggregate)
    
     df_agg['BREAKDOWN_TYPE'] = 'MINOR STAFF GROUP'
     df_agg['STAFF_GROUP'] = df_agg['STAFF_GROUP_1_NAME']
@@ -159,8 +181,7 @@ def agg_major_groups_all_reasons(df, cols_to_aggregate):
 
     df_filtered = df[~df['MAIN_STAFF_GROUP_NAME'].isin(ignored_staff_group)]
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE', 'MAIN_STAFF_GROUP_NAME'], as_index=False)
-            .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df_filtered, ['TM_END_DATE', 'MAIN_STAFF_GROUP_NAME'], cols_to_aggregate)
    
     df_agg['BREAKDOWN_TYPE'] = 'MAJOR STAFF GROUP'
     df_agg['STAFF_GROUP'] = df_agg['MAIN_STAFF_GROUP_NAME']
@@ -185,8 +206,7 @@ def agg_minor_grades_all_reasons(df, cols_to_aggregate):
 
     df_filtered = df[~df['GRADE'].isin(ignored_staff_group)]
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE', 'GRADE'], as_index=False)
-            .agg(cols_to_aggregate))
+    df_agg = sum_by_groups(df_filtered, ['TM_END_DATE', 'GRADE'], cols_to_aggregate)
    
     df_agg['BREAKDOWN_TYPE'] = 'MINOR STAFF GRADES'
     df_agg['STAFF_GROUP'] = df_agg['GRADE']
@@ -212,8 +232,7 @@ def agg_minor_staff_groups(df, cols_to_aggregate):
 
     df_filtered = df[~df['STAFF_GROUP_1_NAME'].isin(ignored_staff_group)]
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE','STAFF_GROUP_1_NAME', 'ATTENDANCE_REASON'], as_index=False)
-                .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df_filtered, ['TM_END_DATE','STAFF_GROUP_1_NAME', 'ATTENDANCE_REASON'], cols_to_aggregate)
                 .rename({'TM_END_DATE': 'DATE', 'ATTENDANCE_REASON': 'REASON', 'STAFF_GROUP_1_NAME':'STAFF_GROUP'}, axis=1))
 
     df_agg['BREAKDOWN_TYPE'] = 'MINOR STAFF GROUP'
@@ -237,8 +256,7 @@ def agg_major_staff_groups(df, cols_to_aggregate):
     df = df[(df['ATTENDANCE_REASON'].str.contains('|'.join(absence_reasons)))] 
     df_filtered = df[~df['MAIN_STAFF_GROUP_NAME'].isin(ignored_staff_group)]
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE','MAIN_STAFF_GROUP_NAME','ATTENDANCE_REASON'], as_index=False)
-                .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df_filtered, ['TM_END_DATE','MAIN_STAFF_GROUP_NAME','ATTENDANCE_REASON'], cols_to_aggregate)
                 .rename({'MAIN_STAFF_GROUP_NAME': 'STAFF_GROUP','ATTENDANCE_REASON': 'REASON'}, axis=1))
 
     df_agg['BREAKDOWN_TYPE'] = 'MAJOR STAFF GROUP'
@@ -263,8 +281,7 @@ def agg_minor_staff_grades(df, cols_to_aggregate):
     df = df[~df['GRADE'].isin(ignored_staff_group)]
     df_filtered = df[(df['ATTENDANCE_REASON'].str.contains('|'.join(absence_reasons)))] 
 
-    df_agg = (df_filtered.groupby(['TM_END_DATE','GRADE', 'ATTENDANCE_REASON'], as_index=False)
-                .agg(cols_to_aggregate)
+    df_agg = (sum_by_groups(df_filtered, ['TM_END_DATE','GRADE', 'ATTENDANCE_REASON'], cols_to_aggregate)
                 .rename({'GRADE': 'STAFF_GROUP','ATTENDANCE_REASON': 'REASON'}, axis=1))
 
     df_agg['BREAKDOWN_TYPE'] = 'MINOR STAFF GRADES'
@@ -308,3 +325,120 @@ def create_reason_absence_breakdowns(df, month_date):
     reason_staff_data = reason_staff_data[cols_order]
 
     return reason_staff_data
+
+
+def agg_org_staff_reasons(df, cols_to_aggregate):
+    """
+    Creates a function for use in creating the organisation by staff group by reason cube.
+
+    The data is summed once at the finest grain, every organisation, major and minor staff
+    group, grade, breed and attendance reason that has any absence. Only the combinations that occur are kept, so
+    this is much smaller than the full cross product. Missing values are kept as their own
+    groups, so that the roll ups add up to the same totals as the national breakdowns.
+
+    Inputs:
+        df: the data table, ESR-ABSENCE-YYYY-MM table from SQL.
+        cols_to_aggregate: the columns used in the calculation of the sickness absence rate, FTE_DAYS_LOST and FTE_DAYS_AVAILABLE
+
+    Output:
+        A dataframe that contains an aggregation of data by organisation, staff group and attendance reason.
+    """
+    logger.info("Producing the organisation, staff group and reason aggregation")
+
+    cube_keys = (['TM_END_DATE'] + cube_geographies['REPORTING_ORG']
+                + [col for col in cube_staff_groups.values() if col]
+                + [col for col, _ in cube_staff_group_filters.values()] + ['ATTENDANCE_REASON'])
+
+    return sum_by_groups(df, cube_keys, cols_to_aggregate, dropna=False)
+
+
+def roll_up_org_staff_reasons(df_cube, geography, staff_group_type, by_reason, cols_to_aggregate):
+    """
+    Creates a function to roll the organisation by staff group by reason aggregation up to one breakdown.
+
+    The filters are the same as the national breakdowns above, so the ENGLAND roll ups are
+    the same as create_reason_absence_breakdowns.
+
+    Inputs:
+        df_cube: the dataframe returned by agg_org_staff_reasons, or the data table itself
+        geography: one of cube_geographies
+        staff_group_type: one of cube_staff_groups
+        by_reason: whether to break down by absence reason, otherwise all reasons are summed
+        cols_to_aggregate: the columns used in the calculation of the sickness absence rate, FTE_DAYS_LOST and FTE_DAYS_AVAILABLE
+
+    Output:
+        A dataframe that contains an aggregation of data for the breakdown.
+    """
+    staff_group_col = cube_staff_groups[staff_group_type]
+    group_cols = ['TM_END_DATE'] + cube_geographies[geography]
+
+    df_filtered = df_cube
+    if staff_group_type in cube_staff_group_filters:
+        filter_col, filter_values = cube_staff_group_filters[staff_group_type]
+        df_filtered = df_filtered[df_filtered[filter_col].isin(filter_values)]
+    if staff_group_col:
+        df_filtered = df_filtered[~df_filtered[staff_group_col].isin(ignored_staff_group)]
+        group_cols = group_cols + [staff_group_col]
+    if by_reason:
+        df_filtered = df_filtered[df_filtered['ATTENDANCE_REASON'].str.contains('|'.join(absence_reasons), na=False)]
+        group_cols = group_cols + ['ATTENDANCE_REASON']
+
+    df_agg = sum_by_groups(df_filtered, group_cols, cols_to_aggregate)
+
+    df_agg['GEOGRAPHY'] = geography
+    df_agg['BREAKDOWN_TYPE'] = staff_group_type
+    df_agg['STAFF_GROUP'] = df_agg[staff_group_col].astype(object) if staff_group_col else 'All staff groups'
+    df_agg['REASON'] = df_agg['ATTENDANCE_REASON'] if by_reason else 'ALL REASONS'
+
+    return df_agg
+
+
+def create_org_reason_cube(df, month_date):
+    """
+    Creates a function summing the FTE days lost and FTE days available by organisation, staff group and reason.
+
+    Every region and organisation breakdown (by all staff groups, major and minor staff group
+    and grade, by all reasons and each reason) is rolled up from one aggregation of the data
+    at the finest grain, rather than each being a groupby of the data. The England breakdowns
+    are summed from the data itself, with the same filters, so they are the same values as
+    create_reason_absence_breakdowns to the last digit. Organisation rows with 330 or fewer
+    FTE days available are suppressed, as in the organisation CSV.
+
+    Inputs:
+        df: the data table, ESR-ABSENCE-YYYY-MM table from SQL.
+        month_date: the data month
+
+    Output:
+        A dataframe named org_reason_cube.
+    """
+    logger.info("Getting ready to calculate the organisation, staff group and reason cube")
+
+    cols_to_aggregate = {'FTE_DAYS_LOST': 'sum',
+                        'FTE_DAYS_AVAILABLE': 'sum'}
+
+    df_cube = agg_org_staff_reasons(df, cols_to_aggregate)
+
+    cols_order = ['DATE', 'GEOGRAPHY', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'ORG_NAME',
+                'BREAKDOWN_TYPE', 'STAFF_GROUP', 'REASON', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE',
+                'SICKNESS_ABSENCE_RATE_PERCENT']
+
+    logger.info("Rolling up the cube")
+    roll_ups = [roll_up_org_staff_reasons(df if geography == 'ENGLAND' else df_cube, geography, staff_group_type,
+                                          by_reason, cols_to_aggregate)
+                for geography in cube_geographies
+                for staff_group_type in cube_staff_groups
+                for by_reason in [False, True]]
+    org_reason_cube = pd.concat([df_agg.astype({col: object for col in cube_geographies['REPORTING_ORG'] if col in df_agg})
+                                for df_agg in roll_ups], axis=0, join='outer', ignore_index=True)
+
+    org_reason_cube['DATE'] = month_date
+    org_reason_cube['SICKNESS_ABSENCE_RATE_PERCENT'] = round(org_reason_cube['FTE_DAYS_LOST'] / org_reason_cube['FTE_DAYS_AVAILABLE'] * 100, 2)
+    org_reason_cube = org_reason_cube.reindex(columns=cols_order)
+
+    # suppress the organisation data
+    suppressed = (org_reason_cube['GEOGRAPHY'] == 'REPORTING_ORG') & (org_reason_cube['FTE_DAYS_AVAILABLE'] <= 330)
+    suppressed_cols = ['SICKNESS_ABSENCE_RATE_PERCENT', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']
+    org_reason_cube[suppressed_cols] = org_reason_cube[suppressed_cols].astype(object)
+    org_reason_cube.loc[suppressed, suppressed_cols] = ''
+
+    return org_reason_cube
@@ -0,0 +1,194 @@
+"""
+Reference data shared by all of the breakdown modules.
+
+absence_rates, benchmarking_tool, covid_table and reason_and_staff all group on the same
+organisation and staff group columns. Rather than each groupby hashing the strings again,
+the base data is converted to categoricals once, against a dictionary built from the
+reference tables, so the groupbys work on integer codes.
+"""
+
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The grouping columns which are converted to categoricals
+CATEGORY_COLUMNS = ['ORG_CODE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'STAFF_GROUP_1_NAME',
+                    'MAIN_STAFF_GROUP_NAME', 'GRADE', 'CLUSTER_GROUP']
+
+
+def sql_query_category_values(database, org_master, ref_table, ref_payscale):
+    """
+    Creates a function to select every value of the grouping columns from the reference tables
+
+    Inputs:
+        database: database name as defined in config.toml file
+        org_master: Organisation ref table as defined in config.toml file
+        ref_table: Occupation code ref table as defined in config.toml file
+        ref_payscale: Payscale code ref table as defined in config.toml file
+
+    Output:
+        SQL query which returns one row per COLUMN_NAME and VALUE pair
+    """
+    logger.info("Preparing the category values SQL query")
+    query = f"""
+            select distinct 'ORG_CODE' as [COLUMN_NAME], [Reporting Org code] as [VALUE]
+            from [{database}].[dbo].[{org_master}]
+            union all
+            select distinct 'NHSE_REGION_CODE', [NHSE_Region_Code]
+            from [{database}].[dbo].[{org_master}]
+            union all
+            select distinct 'NHSE_REGION_NAME', [NHSE_Region_Name]
+            from [{database}].[dbo].[{org_master}]
+            union all
+            select distinct 'CLUSTER_GROUP', [ClusterGroup]
+            from [{database}].[dbo].[{org_master}]
+            union all
+            select distinct 'MAIN_STAFF_GROUP_NAME', [MAIN_STAFF_GROUP_NAME]
+            from [{database}].[dbo].[{ref_table}]
+            union all
+            select distinct 'STAFF_GROUP_1_NAME', [STAFF_GROUP_1_NAME]
+            from [{database}].[dbo].[{ref_table}]
+            union all
+            select distinct 'GRADE', [GRADE]
+            from [{database}].[dbo].[{ref_payscale}]
+            """
+    return query
+
+
+def build_category_dictionary(df):
+    """
+    Creates the shared dictionary of categories for each grouping column
+
+    Inputs:
+        df: dataframe derived from the sql_query_category_values query
+
+    Output:
+        A dict of column name to a sorted list of values. The values are sorted so that
+        groupbys on the categoricals return rows in the same order as groupbys on strings.
+    """
+    logger.info("Building the shared category dictionary")
+    df = df.dropna(subset=['VALUE'])
+
+    category_dictionary = {col: [] for col in CATEGORY_COLUMNS}
+    for col, values in df.groupby('COLUMN_NAME')['VALUE']:
+        category_dictionary[col] = sorted(values.unique())
+
+    return category_dictionary
+
+
+def encode_categoricals(df, category_dictionary):
+    """
+    Converts the grouping columns of a base dataframe to categoricals using the shared dictionary
+
+    Values which are not in the reference tables (e.g. GRADE in the MDS data) are added to
+    the categories rather than being lost, so the aggregations are unchanged.
+
+    Inputs:
+        df: base dataframe derived from one of the SQL Server queries
+        category_dictionary: the dict returned by build_category_dictionary
+
+    Output:
+        The dataframe with every column in CATEGORY_COLUMNS that it contains converted to a categorical
+    """
+    for col in CATEGORY_COLUMNS:
+        if col not in df.columns:
+            continue
+        categories = set(category_dictionary.get(col, []))
+        unseen = set(df[col].dropna().unique()) - categories
+        if unseen:
+            logger.info(f"{len(unseen)} values of {col} are not in the reference tables, adding them to the categories")
+        # ordered so that groupby(..., observed=True) returns the groups in sorted order, as it does for strings
+        df[col] = pd.Categorical(df[col], categories=sorted(categories | unseen), ordered=True)
+
+    return df
+
+
+def build_latest_org_lookup(df):
+    """
+    Creates the latest org details lookup used by the benchmarking tool and COVID outputs
+
+    The lookup is indexed by ORG_CODE so the hash table is built once and reused by every
+    call to add_latest_org_details. If the latest org table contains an ORG_CODE more than
+    once only the first row is kept, otherwise every joined row for that org is duplicated.
+
+    Inputs:
+        df: dataframe derived from the sql_latest_org_name query
+
+    Output:
+        A dataframe of the latest org details with a unique ORG_CODE index
+    """
+    logger.info("Building the latest org details lookup")
+
+    duplicated = df['ORG_CODE'].duplicated()
+    if duplicated.any():
+        logger.warning(f"{df.loc[duplicated, 'ORG_CODE'].nunique()} org codes appear more than once in the latest org table, "
+                       f"keeping the first row for each: {sorted(df.loc[duplicated, 'ORG_CODE'].unique())}")
+        df = df[~duplicated]
+
+    return df.set_index('ORG_CODE')
+
+
+def add_latest_org_details(df, org_lookup, cols):
+    """
+    Adds the latest org details to a dataframe of org level aggregates
+
+    This replaces df.merge(df_query, how='inner', on='ORG_CODE'). Rows are matched on
+    ORG_CODE with the lookup's index, and rows whose org is not in the lookup are dropped.
+    The rows come back in the same order as that merge, grouped by ORG_CODE in order of
+    first appearance. When ORG_CODE is categorical only the categories are looked up.
+
+    Inputs:
+        df: dataframe containing an ORG_CODE column
+        org_lookup: the lookup returned by build_latest_org_lookup
+        cols: the columns of org_lookup to add
+
+    Output:
+        The dataframe with the cols from org_lookup added
+    """
+    keys = df['ORG_CODE']
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        category_positions = org_lookup.index.get_indexer(keys.cat.categories)
+        codes = keys.cat.codes.to_numpy()
+        positions = np.where(codes >= 0, category_positions[codes], -1)
+    else:
+        positions = org_lookup.index.get_indexer(keys)
+
+    matched = positions >= 0
+    first_appearance, _ = pd.factorize(keys[matched])
+    row_order = np.flatnonzero(matched)[np.argsort(first_appearance, kind='stable')]
+
+    df_joined = df.iloc[row_order].reset_index(drop=True)
+    for col in cols:
+        df_joined[col] = org_lookup[col].to_numpy()[positions[row_order]]
+
+    return df_joined
+
+
+def classify_occupation_codes(occupation_codes):
+    """
+    Classifies each occupation code as MEDICAL, NON_MEDICAL or EXCLUDED
+
+    Non-medical codes contain a letter, medical codes are numeric and codes starting with Z
+    (or missing) are excluded, as in sql_query_benchmark_data. The codes are factorised
+    first so the classification is only worked out once per distinct code rather than
+    once per row.
+
+    Inputs:
+        occupation_codes: Series of OCCUPATION_CODE values
+
+    Output:
+        A categorical Series of the classification, with the same index as occupation_codes
+    """
+    classes = ['MEDICAL', 'NON_MEDICAL', 'EXCLUDED']
+
+    codes, uniques = pd.factorize(occupation_codes)
+    uniques = pd.Series(uniques, dtype=object)
+    class_of_code = np.where(uniques.str.startswith('Z').fillna(True), 2,
+                        np.where(uniques.str.contains('[A-Z]').fillna(False), 1, 0))
+
+    # missing codes (-1) are excluded
+    class_codes = np.append(class_of_code, 2)[codes]
+    return pd.Series(pd.Categorical.from_codes(class_codes, categories=classes),
+                    index=occupation_codes.index, name='OCCUPATION_CLASS')
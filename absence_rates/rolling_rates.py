@@ -0,0 +1,166 @@
+"""
+Rolling 12 month sickness absence rates, kept up to date from the history store.
+
+Rather than summing the last 12 months of FTE days again every month, the rolling sums
+for each breakdown are stored in the history store and updated incrementally: the new
+month is added and the month dropping out of the window is taken away. The monthly and
+rolling sums are stored rounded to ROLLING_DECIMALS, so float error does not build up from
+month to month.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from aggregation import sum_by_groups
+from history_store import write_to_history_store, read_history, PARTITION_COLUMN
+
+logger = logging.getLogger(__name__)
+
+ROLLING_MONTHS = 12
+
+# Decimal places the monthly and rolling sums are stored to. Adding and taking away months
+# every month would otherwise build up float error in the last digits. As every stored sum is
+# a sum of values with this many decimals, rounding drops the error again each month, so the
+# incremental sums stay equal to rebuilding them from the monthly sums
+ROLLING_DECIMALS = 6
+
+# The breakdowns with rolling rates: the group keys, and descriptive columns carried from the latest month
+rolling_breakdowns = {
+    'csv_absence_excel_production': {'keys': ['BREAKDOWN_TYPE', 'BREAKDOWN_VALUE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME'],
+                                    'attributes': []},
+    'csv_absence_rates': {'keys': ['ORG_CODE'],
+                        'attributes': ['NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_NAME', 'ORG_TYPE']}
+}
+
+rolling_cols = {'FTE_DAYS_LOST': 'sum',
+                'FTE_DAYS_AVAILABLE': 'sum',
+                'MONTHS_IN_WINDOW': 'sum'}
+
+
+def shift_month(month, months):
+    """
+    Creates a function to move a month end date (as in start_date) by a number of months
+
+    Inputs:
+        month: month end date as a yyyy-mm-dd string
+        months: number of months to move by, negative to go back
+
+    Output:
+        The month end date as a yyyy-mm-dd string
+    """
+    return (pd.Timestamp(month) + pd.offsets.MonthEnd(months)).strftime('%Y-%m-%d')
+
+
+def read_month(history_dir, output_name, month):
+    """
+    Creates a function to read one month of an output from the history store
+
+    Output:
+        The dataframe for that month, or None if the month is not in the store
+    """
+    if not (Path(history_dir) / output_name / f"{PARTITION_COLUMN}={month}").exists():
+        return None
+
+    return read_history(history_dir, output_name, start_month=month, end_month=month).drop(columns=PARTITION_COLUMN)
+
+
+def sum_rolling_frames(frames, keys):
+    """
+    Creates a function to add together monthly sums and rolling sums on the breakdown keys
+
+    The FTE sums are rounded to ROLLING_DECIMALS. Groups with no months left in the window are dropped.
+    """
+    df = pd.concat([df[keys + list(rolling_cols)].astype({key: object for key in keys}) for df in frames],
+                    ignore_index=True)
+    df_agg = sum_by_groups(df, keys, rolling_cols, dropna=False)
+    df_agg[['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']] = df_agg[['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']].round(ROLLING_DECIMALS)
+    df_agg['MONTHS_IN_WINDOW'] = df_agg['MONTHS_IN_WINDOW'].round().astype(int)
+
+    return df_agg[df_agg['MONTHS_IN_WINDOW'] > 0].reset_index(drop=True)
+
+
+def update_rolling_sums(df, history_dir, output_name, month):
+    """
+    Creates a function to update the rolling 12 month sums of a breakdown for a new month
+
+    This month's sums are added to the store. If last month's rolling sums are in the store
+    they are updated as last month + this month - the month 12 months ago, otherwise (on the
+    first run, or after a gap) they are rebuilt from the monthly sums in the store.
+
+    Inputs:
+        df: this month's unsuppressed breakdown, containing the keys in rolling_breakdowns
+            and FTE_DAYS_LOST and FTE_DAYS_AVAILABLE
+        history_dir: history_dir as defined in config.toml file
+        output_name: one of the rolling_breakdowns
+        month: start_date as defined in config.toml file
+
+    Output:
+        A dataframe of the rolling FTE days lost and available and the number of months
+        of data in the window, for each group in the breakdown
+    """
+    logger.info(f"Updating the rolling {ROLLING_MONTHS} month sums of {output_name}")
+    keys = rolling_breakdowns[output_name]['keys']
+    attributes = rolling_breakdowns[output_name]['attributes']
+    monthly_name = f"{output_name}_monthly_sums"
+    rolling_name = f"{output_name}_rolling_sums"
+
+    monthly = df[keys + attributes + ['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']].copy()
+    monthly[['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']] = monthly[['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']].round(ROLLING_DECIMALS)
+    monthly['MONTHS_IN_WINDOW'] = 1
+    write_to_history_store(monthly, history_dir, monthly_name, month)
+
+    previous = read_month(history_dir, rolling_name, shift_month(month, -1))
+    if previous is not None:
+        # last month's window only contains months in the store, so if the month dropping out
+        # is not in the store there is nothing to take away
+        frames = [previous, monthly]
+        dropping_out = read_month(history_dir, monthly_name, shift_month(month, -ROLLING_MONTHS))
+        if dropping_out is not None:
+            dropping_out[list(rolling_cols)] = -dropping_out[list(rolling_cols)]
+            frames.append(dropping_out)
+    else:
+        first_month = shift_month(month, -(ROLLING_MONTHS - 1))
+        logger.info(f"No rolling sums for the previous month, rebuilding them from the monthly sums from {first_month}")
+        # latest month first, so the latest descriptive details are kept below
+        frames = [read_history(history_dir, monthly_name, start_month=first_month, end_month=month).iloc[::-1]]
+    df_rolling = sum_rolling_frames(frames, keys)
+
+    if attributes:
+        # the latest descriptive details for each group, from this month if it is there
+        df_attributes = pd.concat([monthly, frames[0]], ignore_index=True)[keys + attributes].drop_duplicates(subset=keys)
+        df_rolling = df_rolling.merge(df_attributes.astype({key: object for key in keys}), how='left', on=keys)
+
+    write_to_history_store(df_rolling, history_dir, rolling_name, month)
+
+    return df_rolling[keys + attributes + list(rolling_cols)]
+
+
+def create_rolling_absence_rates(df_rolling, month_date, suppress=False):
+    """
+    Creates a function that produces the rolling 12 month absence rates output from the rolling sums
+
+    Inputs:
+        df_rolling: dataframe returned by update_rolling_sums
+        month_date: month_date as defined in config.toml file
+        suppress: whether to suppress groups with 330 or fewer rolling FTE days available, as
+            the organisation CSV does
+
+    Output:
+        A dataframe of the rolling FTE days lost and available, the rolling sickness absence
+        rate and the number of months in the window
+    """
+    df = df_rolling.rename(columns={'FTE_DAYS_LOST': 'ROLLING_FTE_DAYS_LOST',
+                                    'FTE_DAYS_AVAILABLE': 'ROLLING_FTE_DAYS_AVAILABLE'})
+    df['ROLLING_SICKNESS_ABSENCE_RATE_PERCENT'] = round(
+        df['ROLLING_FTE_DAYS_LOST'] / df['ROLLING_FTE_DAYS_AVAILABLE'].replace(0, np.nan) * 100, 2)
+    df.insert(0, 'DATE', month_date)
+    df = df[[col for col in df.columns if col != 'MONTHS_IN_WINDOW'] + ['MONTHS_IN_WINDOW']]
+
+    if suppress:
+        suppressed = df['ROLLING_FTE_DAYS_AVAILABLE'] <= 330
+        df[['ROLLING_SICKNESS_ABSENCE_RATE_PERCENT', 'ROLLING_FTE_DAYS_LOST', 'ROLLING_FTE_DAYS_AVAILABLE']] = (
+            df[['ROLLING_SICKNESS_ABSENCE_RATE_PERCENT', 'ROLLING_FTE_DAYS_LOST', 'ROLLING_FTE_DAYS_AVAILABLE']].astype(object))
+        df.loc[suppressed, ['ROLLING_SICKNESS_ABSENCE_RATE_PERCENT', 'ROLLING_FTE_DAYS_LOST', 'ROLLING_FTE_DAYS_AVAILABLE']] = ''
+
+    return df
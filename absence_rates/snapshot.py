@@ -0,0 +1,358 @@
+"""
+Takes a snapshot of the month's ESR tables and reference tables.
+
+Each table the data quality checks and the publication use is read from SQL Server once
+and saved as Parquet in snapshot_dir/<start_date>/. When the snapshot exists, both
+data_quality_checks.py and make_publication.py run their queries against it with DuckDB
+instead of the warehouse, so the ESR tables are only scanned once a month.
+
+The snapshot is taken in two stages, because the occupation code updates change the ESR
+absence table the publication reads after the data quality checks have been run:
+    - data_quality: the raw ESR absence table, MDS, staff in post and the reference tables,
+      none of which are changed by the updates. Run this script first, before data_quality_checks.py.
+    - publication: the ESR absence table the publication reads. Run this script with
+      --publication after the occupation code updates, before make_publication.py.
+Each script only uses the snapshot once its stage has been taken, and queries SQL Server otherwise.
+"""
+
+import re
+import json
+import time
+import timeit
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+from functools import partial
+from data_connections import get_df_from_sql
+from helpers import get_config, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# The config.toml keys of the tables that are put in the snapshot at each stage, in the order the stages are taken
+SNAPSHOT_STAGES = {
+    'data_quality': ['staff_table_raw', 'mds_table', 'staff_in_post', 'org_master', 'ref_table',
+                     'ref_payscale', 'latest_org_name'],
+    'publication': ['staff_table'],
+}
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def get_snapshot_dir(config):
+    """
+    Creates a function to find the snapshot folder for the month in config.toml
+
+    Output:
+        The path of the snapshot folder, or None if snapshot_dir is not set in config.toml
+    """
+    if not config.get('snapshot_dir'):
+        return None
+
+    return Path(config['snapshot_dir']) / config['start_date']
+
+
+def write_manifest(snapshot_dir, manifest):
+    """
+    Creates a function to write the manifest of a snapshot, replacing the old one in one step
+    """
+    manifest_path = Path(snapshot_dir) / MANIFEST_FILE
+    temp_path = manifest_path.with_name(f".{MANIFEST_FILE}.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    temp_path.replace(manifest_path)
+
+
+def create_snapshot(config, stage='data_quality'):
+    """
+    Creates a function to copy one stage's tables from SQL Server into the snapshot folder
+
+    Taking a stage again drops the later stages from the snapshot, because they were taken
+    after the earlier tables as they were before.
+
+    Inputs:
+        config: the dict from config.toml
+        stage: one of SNAPSHOT_STAGES. The earlier stages must already be in the snapshot
+
+    Output:
+        The path of the snapshot folder
+    """
+    from data_connections import with_retries
+
+    stages = list(SNAPSHOT_STAGES)
+    if stage not in stages:
+        raise ValueError(f"Unknown snapshot stage '{stage}', use one of {stages}")
+    earlier_stages = stages[:stages.index(stage)]
+
+    database = config['database']
+    snapshot_dir = get_snapshot_dir(config)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    run_query = with_retries(get_df_from_sql, config.get('query_retries', 3), config.get('query_backoff_seconds', 30))
+
+    manifest = {'database': database, 'start_date': config['start_date'], 'stages': {}, 'tables': {}}
+    if earlier_stages:
+        if (snapshot_dir / MANIFEST_FILE).exists():
+            manifest = read_manifest(snapshot_dir)
+        missing_stages = [earlier_stage for earlier_stage in earlier_stages if earlier_stage not in manifest['stages']]
+        if missing_stages:
+            raise ValueError(f"Take the {missing_stages[0]} snapshot before the {stage} snapshot")
+
+    # this stage and the later ones are taken out of the manifest until the tables have been copied
+    manifest['stages'] = {name: created for name, created in manifest['stages'].items() if name in earlier_stages}
+    manifest['tables'] = {table: details for table, details in manifest['tables'].items()
+                          if details['stage'] in earlier_stages}
+    if earlier_stages:
+        write_manifest(snapshot_dir, manifest)
+    else:
+        (snapshot_dir / MANIFEST_FILE).unlink(missing_ok=True)
+
+    for table_key in SNAPSHOT_STAGES[stage]:
+        table = config[table_key]
+        logger.info(f"Adding {table} to the snapshot")
+        df = run_query(database, f"select * from [{database}].[dbo].[{table}]")
+        df.to_parquet(snapshot_dir / f"{table}.parquet", index=False)
+        manifest['tables'][table] = {'rows': len(df), 'file': f"{table}.parquet", 'stage': stage}
+
+    # the stage is added to the manifest last, so a stage missing from it is incomplete
+    manifest['stages'][stage] = datetime.now().isoformat(timespec='seconds')
+    write_manifest(snapshot_dir, manifest)
+    logger.info(f"{stage} snapshot written to {snapshot_dir}")
+
+    return snapshot_dir
+
+
+def translate_query(query, database):
+    """
+    Creates a function to convert one of the pipeline's SQL Server queries to DuckDB SQL
+
+    Only the T-SQL used by the pipeline is converted:
+        - [database].[dbo].[table] becomes the table name, which is a view of the snapshot
+        - [bracketed] names become "quoted" names
+        - like '[5Q]%' character classes become regexp_matches(column, '^[5Q]')
+
+    Inputs:
+        query: string containing a SQL Server query
+        database: database name as defined in config.toml file
+
+    Output:
+        The query as DuckDB SQL
+    """
+    query = query.replace(f"[{database}].[dbo].", "")
+
+    # split out the string literals, so brackets inside them are left alone
+    parts = re.split(r"('(?:[^']|'')*')", query)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\[([^\]]+)\]", r'"\1"', parts[i])
+    query = ''.join(parts)
+
+    def like_to_regexp(match):
+        column, negate, characters = match.group(1), match.group(2), match.group(3)
+        return f"{'not ' if negate else ''}regexp_matches({column}, '^[{characters}]')"
+
+    return re.sub(r"((?:\w+\.)?(?:\"[^\"]+\"|\w+))\s+(not\s+)?like\s+'\[([^\]]+)\]%'", like_to_regexp, query, flags=re.IGNORECASE)
+
+
+def read_manifest(snapshot_dir):
+    """
+    Creates a function to read the manifest of a snapshot
+
+    Output:
+        dict of the snapshot's database, start_date, stages (with the time each was taken) and tables
+    """
+    with open(Path(snapshot_dir) / MANIFEST_FILE) as f:
+        return json.load(f)
+
+
+def connect_to_snapshot(snapshot_dir):
+    """
+    Creates a function to open a DuckDB connection with a view of each table in the snapshot
+
+    Output:
+        duckdb connection
+    """
+    import duckdb
+
+    conn = duckdb.connect()
+    for table, details in read_manifest(snapshot_dir)['tables'].items():
+        parquet_path = (Path(snapshot_dir) / details['file']).as_posix().replace("'", "''")
+        conn.execute(f"""create view "{table}" as select * from read_parquet('{parquet_path}')""")
+
+    return conn
+
+
+def estimate_snapshot_query(snapshot_dir, database, query, sample_rows=10_000):
+    """
+    Estimates the size of the dataframe one of the pipeline's queries returns from the snapshot
+
+    The rows are counted by DuckDB without fetching them, and the memory per row is measured
+    on the first sample_rows rows.
+
+    Inputs:
+        snapshot_dir: path of the snapshot folder
+        database: database name as defined in config.toml file
+        query: string containing a SQL Server query
+        sample_rows: number of rows fetched to measure the memory per row
+
+    Output:
+        dict of the number of ROWS and COLUMNS and the estimated BYTES of the dataframe
+    """
+    conn = connect_to_snapshot(snapshot_dir)
+    translated_query = translate_query(query, database)
+    rows = conn.execute(f"select count(*) from ({translated_query}) q").fetchone()[0]
+    sample = conn.execute(f"select * from ({translated_query}) q limit {sample_rows}").df()
+    conn.close()
+
+    bytes_per_row = sample.memory_usage(index=False, deep=True).sum() / len(sample) if len(sample) else 0
+    return {'ROWS': rows, 'COLUMNS': len(sample.columns), 'BYTES': int(bytes_per_row * rows)}
+
+
+def get_df_from_snapshot(snapshot_dir, database, query):
+    """
+    Runs one of the pipeline's SQL Server queries against the snapshot with DuckDB
+
+    Takes the same database and query as data_connections.get_df_from_sql, so it can be
+    used in its place.
+
+    Inputs:
+        snapshot_dir: path of the snapshot folder
+        database: database name as defined in config.toml file
+        query: string containing a SQL Server query
+
+    Output:
+        pandas Dataframe
+    """
+    from extraction_report import record_query
+
+    conn = connect_to_snapshot(snapshot_dir)
+
+    logger.info(f"Getting dataframe from the snapshot in {snapshot_dir}")
+    logger.debug("Running query:\n\n %s", query)
+    start_time = time.perf_counter()
+    result = conn.execute(translate_query(query, database))
+    execute_time = time.perf_counter()
+    # DuckDB fetches the rows straight into the dataframe
+    df = result.df()
+    fetch_time = time.perf_counter()
+    conn.close()
+
+    record_query('snapshot', database, query, df, execute_time - start_time, fetch_time - execute_time)
+    return df
+
+
+def find_snapshot(config, stage):
+    """
+    Creates a function to find this month's snapshot, if the stage a script needs has been taken
+
+    Inputs:
+        config: the dict from config.toml
+        stage: one of SNAPSHOT_STAGES
+
+    Output:
+        The path of the snapshot folder, or None if there is no snapshot with that stage
+    """
+    snapshot_dir = get_snapshot_dir(config)
+    if snapshot_dir is None:
+        return None
+
+    if not (snapshot_dir / MANIFEST_FILE).exists():
+        logger.warning(f"No snapshot in {snapshot_dir}, running the queries against SQL Server. Run snapshot.py first to take one.")
+        return None
+
+    if stage not in read_manifest(snapshot_dir)['stages']:
+        option = ' --publication' if stage == 'publication' else ''
+        logger.warning(f"The snapshot in {snapshot_dir} has no {stage} stage, running the queries against SQL Server. "
+                       f"Run snapshot.py{option} to take it.")
+        return None
+
+    return snapshot_dir
+
+
+def get_query_runner(config, stage='data_quality'):
+    """
+    Creates a function to choose where the pipeline's queries are run
+
+    Inputs:
+        config: the dict from config.toml
+        stage: the snapshot stage with the tables the script reads, 'data_quality' or 'publication'
+
+    Output:
+        get_df_from_snapshot for this month's snapshot if the stage has been taken, otherwise
+        data_connections.get_df_from_sql, which sends a query again after a transient error
+        (query_retries and query_backoff_seconds in config.toml) and records SQL Server's statistics
+        if query_statistics is set. Either is called as run_query(database, query).
+    """
+    from data_connections import with_retries
+
+    snapshot_dir = find_snapshot(config, stage)
+    if snapshot_dir is not None:
+        logger.info(f"Running the queries against the snapshot in {snapshot_dir}")
+        return partial(get_df_from_snapshot, snapshot_dir)
+
+    run_sql = partial(get_df_from_sql, statistics=config.get('query_statistics', False))
+    return with_retries(run_sql, config.get('query_retries', 3), config.get('query_backoff_seconds', 30))
+
+
+def get_query_estimator(config, stage='data_quality'):
+    """
+    Creates a function to choose where the dry run estimates the size of the pipeline's queries
+
+    Output:
+        estimate_snapshot_query for this month's snapshot if the stage has been taken, otherwise
+        data_connections.get_estimated_plan. Either is called as estimate_query(database, query).
+    """
+    from data_connections import get_estimated_plan
+
+    snapshot_dir = find_snapshot(config, stage)
+    if snapshot_dir is not None:
+        return partial(estimate_snapshot_query, snapshot_dir)
+
+    return get_estimated_plan
+
+
+def find_missing_tables(config, tables, stage='data_quality'):
+    """
+    Creates a function to find which of the pipeline's tables are not where the queries will look for them
+
+    Inputs:
+        config: the dict from config.toml
+        tables: list of table names
+        stage: the snapshot stage with the tables the script reads, 'data_quality' or 'publication'
+
+    Output:
+        list of the tables that are not in this month's snapshot, if the stage has been taken, otherwise not in SQL Server
+    """
+    from data_connections import find_missing_sql_tables
+
+    snapshot_dir = find_snapshot(config, stage)
+    if snapshot_dir is not None:
+        snapshot_tables = read_manifest(snapshot_dir)['tables']
+        return [table for table in tables if table not in snapshot_tables]
+
+    return find_missing_sql_tables(config['database'], tables)
+
+
+def main(stage='data_quality'):
+    """
+    Function to take one stage of the snapshot of the month set in config.toml
+
+    Inputs:
+        stage: one of SNAPSHOT_STAGES. Set to 'publication' from the --publication command line option.
+    """
+    config = get_config()
+    configure_logging(Path(config['log_dir']), config.get('log_level', 'INFO'))
+
+    if get_snapshot_dir(config) is None:
+        raise ValueError("Set snapshot_dir in config.toml to take a snapshot")
+
+    create_snapshot(config, stage)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Take the snapshot of the month's ESR and reference tables")
+    parser.add_argument('--publication', action='store_true',
+                        help="take the publication stage, after the occupation code updates have been made")
+    stage = 'publication' if parser.parse_args().publication else 'data_quality'
+    print(f"Taking the {stage} snapshot of the ESR and reference tables")
+    start_time = timeit.default_timer()
+    main(stage)
+    total_time = timeit.default_timer() - start_time
+    print(f"Running time: {int(total_time / 60)} minutes and {round(total_time%60)} seconds.")
@@ -150,7 +150,7 @@ def prepare_table_2_1(df):
     """
     logger.info(f"Preparing data for excel tag table 2_1")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[["ALL_ENGLAND"]]
 
     return df
@@ -170,7 +170,7 @@ def prepare_table_2_2(df):
     """
     logger.info(f"Preparing data for excel tag table 2_2")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[['Professionally qualified clinical staff']]
 
     return df
@@ -190,7 +190,7 @@ def prepare_table_2_3(df):
     """
     logger.info(f"Preparing data for excel tag table 2_3")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[['HCHS Doctors', 'Consultant',
         'Associate Specialist',
         'Specialty Doctor',
@@ -219,7 +219,7 @@ def prepare_table_2_4(df):
     """
     logger.info(f"Preparing data for excel tag table 2_4")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[['Nurses & health visitors',
         'Midwives',
         'Ambulance staff',
@@ -243,7 +243,7 @@ def prepare_table_2_5(df):
     """
     logger.info(f"Preparing data for excel tag table 2_5")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[['Support to clinical staff',
         'Support to doctors, nurses & midwives',
         'Support to ambulance staff',
@@ -267,7 +267,7 @@ def prepare_table_2_6(df):
     """
     logger.info(f"Preparing data for excel tag table 2_6")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[['NHS infrastructure support',
         'Central functions',
         'Hotel, property & estates',
@@ -293,7 +293,7 @@ def prepare_table_2_7(df):
     """
     logger.info(f"Preparing data for excel tag table 2_7")
 
-    logger.info(f"Reading df:\n{df}")
+    logger.debug("Reading df:\n%s", df)
     df = df[["Other staff or those with unknown classification"]]
 
     return df
@@ -1,11 +1,19 @@
 import pandas as pd
 import logging
+from functools import lru_cache
 from helpers import get_config
 
 logger = logging.getLogger(__name__)
 
-config = get_config()
-month_date = config['month_date']
+
+@lru_cache(maxsize=None)
+def get_month_date():
+    """
+    Creates a function to read month_date from config.toml the first time a table needs it,
+    rather than when this module is imported
+    """
+    return get_config()['month_date']
+
 
 # Creating a variable of sickness absence reasons
 absence_reasons = (
@@ -79,14 +87,13 @@ def prepare_reason_table_1_1(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_1")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
+    logger.debug("Reading df:\n%s", df.head(1))
 
     # Get all of the values in a row with the corresponding DATE, BREAKDOWN_TYPE and STAFF_GROUP
     # Returning the row as a Series using loc:
     # This means that we are accessing a group of columns by the index labels inputted and returning the particular row of data we want
     # Get more information about loc: https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.loc.html
-    df_table_1_1 = df.loc[[(month_date, 'All staff groups')], :]
-    df_table_1_1.to_csv('df.csv')
+    df_table_1_1 = df.loc[[(get_month_date(), 'All staff groups')], :]
     return df_table_1_1
 
 def prepare_reason_table_1_2(df):
@@ -103,8 +110,8 @@ def prepare_reason_table_1_2(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_2")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_2 = df.loc[[(month_date, 'Professionally qualified clinical staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_2 = df.loc[[(get_month_date(), 'Professionally qualified clinical staff')], :]
 
     return df_table_1_2
 
@@ -123,8 +130,8 @@ def prepare_reason_table_1_3_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_a = df.loc[[(month_date, 'HCHS Doctors')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_a = df.loc[[(get_month_date(), 'HCHS Doctors')], :]
 
     return df_table_1_3_a
 
@@ -142,8 +149,8 @@ def prepare_reason_table_1_3_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_b = df.loc[[(month_date, 'Consultant')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_b = df.loc[[(get_month_date(), 'Consultant')], :]
 
     return df_table_1_3_b
 
@@ -161,8 +168,8 @@ def prepare_reason_table_1_3_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_c = df.loc[[(month_date, 'Associate Specialist')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_c = df.loc[[(get_month_date(), 'Associate Specialist')], :]
 
     return df_table_1_3_c
 
@@ -180,8 +187,8 @@ def prepare_reason_table_1_3_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_d = df.loc[[(month_date, 'Specialty Doctor')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_d = df.loc[[(get_month_date(), 'Specialty Doctor')], :]
 
     return df_table_1_3_d
 
@@ -199,8 +206,8 @@ def prepare_reason_table_1_3_e(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_e")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_e = df.loc[[(month_date, 'Staff Grade')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_e = df.loc[[(get_month_date(), 'Staff Grade')], :]
 
     return df_table_1_3_e
 
@@ -218,8 +225,8 @@ def prepare_reason_table_1_3_f(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_f")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_f = df.loc[[(month_date, 'Specialty Registrar')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_f = df.loc[[(get_month_date(), 'Specialty Registrar')], :]
 
     return df_table_1_3_f
 
@@ -237,8 +244,8 @@ def prepare_reason_table_1_3_g(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_g")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_g = df.loc[[(month_date, 'Core Training')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_g = df.loc[[(get_month_date(), 'Core Training')], :]
 
     return df_table_1_3_g
 
@@ -256,8 +263,8 @@ def prepare_reason_table_1_3_h(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_h")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_h = df.loc[[(month_date, 'Foundation Doctor Year 2')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_h = df.loc[[(get_month_date(), 'Foundation Doctor Year 2')], :]
 
     return df_table_1_3_h
 
@@ -275,8 +282,8 @@ def prepare_reason_table_1_3_i(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_i")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_i = df.loc[[(month_date, 'Foundation Doctor Year 1')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_i = df.loc[[(get_month_date(), 'Foundation Doctor Year 1')], :]
 
     return df_table_1_3_i
 
@@ -294,8 +301,8 @@ def prepare_reason_table_1_3_j(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_j")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_j = df.loc[[(month_date, 'Hospital Practitioner / Clinical Assistant')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_j = df.loc[[(get_month_date(), 'Hospital Practitioner / Clinical Assistant')], :]
 
     return df_table_1_3_j
 
@@ -313,8 +320,8 @@ def prepare_reason_table_1_3_k(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_3_k")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_3_k = df.loc[[(month_date, 'Other and Local HCHS Doctor Grades')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_3_k = df.loc[[(get_month_date(), 'Other and Local HCHS Doctor Grades')], :]
 
     return df_table_1_3_k
 
@@ -332,8 +339,8 @@ def prepare_reason_table_1_4_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_4_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_4_a = df.loc[[(month_date, 'Nurses & health visitors')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_4_a = df.loc[[(get_month_date(), 'Nurses & health visitors')], :]
 
     return df_table_1_4_a
 
@@ -351,8 +358,8 @@ def prepare_reason_table_1_4_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_4_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_4_b = df.loc[[(month_date, 'Midwives')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_4_b = df.loc[[(get_month_date(), 'Midwives')], :]
 
     return df_table_1_4_b
 
@@ -370,8 +377,8 @@ def prepare_reason_table_1_4_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_4_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_4_c = df.loc[[(month_date, 'Ambulance staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_4_c = df.loc[[(get_month_date(), 'Ambulance staff')], :]
 
     return df_table_1_4_c
 
@@ -389,8 +396,8 @@ def prepare_reason_table_1_4_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_4_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_4_d = df.loc[[(month_date, 'Scientific, therapeutic & technical staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_4_d = df.loc[[(get_month_date(), 'Scientific, therapeutic & technical staff')], :]
 
     return df_table_1_4_d
 
@@ -408,8 +415,8 @@ def prepare_reason_table_1_5_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_5_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_5_a = df.loc[[(month_date, 'Support to clinical staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_5_a = df.loc[[(get_month_date(), 'Support to clinical staff')], :]
 
     return df_table_1_5_a
 
@@ -427,8 +434,8 @@ def prepare_reason_table_1_5_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_5_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_5_b = df.loc[[(month_date, 'Support to doctors, nurses & midwives')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_5_b = df.loc[[(get_month_date(), 'Support to doctors, nurses & midwives')], :]
 
     return df_table_1_5_b
 
@@ -446,8 +453,8 @@ def prepare_reason_table_1_5_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_5_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_5_c = df.loc[[(month_date, 'Support to ambulance staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_5_c = df.loc[[(get_month_date(), 'Support to ambulance staff')], :]
 
     return df_table_1_5_c
 
@@ -465,8 +472,8 @@ def prepare_reason_table_1_5_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_5_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_5_d = df.loc[[(month_date, 'Support to ST&T staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_5_d = df.loc[[(get_month_date(), 'Support to ST&T staff')], :]
 
     return df_table_1_5_d
 
@@ -484,8 +491,8 @@ def prepare_reason_table_1_6_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_6_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_6_a = df.loc[[(month_date, 'NHS infrastructure support')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_6_a = df.loc[[(get_month_date(), 'NHS infrastructure support')], :]
 
     return df_table_1_6_a
 
@@ -503,8 +510,8 @@ def prepare_reason_table_1_6_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_6_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_6_b = df.loc[[(month_date, 'Central functions')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_6_b = df.loc[[(get_month_date(), 'Central functions')], :]
 
     return df_table_1_6_b
 
@@ -522,8 +529,8 @@ def prepare_reason_table_1_6_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_6_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_6_c = df.loc[[(month_date, 'Hotel, property & estates')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_6_c = df.loc[[(get_month_date(), 'Hotel, property & estates')], :]
 
     return df_table_1_6_c
 
@@ -541,8 +548,8 @@ def prepare_reason_table_1_6_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_6_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_6_d = df.loc[[(month_date, 'Senior managers')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_6_d = df.loc[[(get_month_date(), 'Senior managers')], :]
 
     return df_table_1_6_d
 
@@ -560,8 +567,8 @@ def prepare_reason_table_1_6_e(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_6_e")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_6_e = df.loc[[(month_date, 'Managers')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_6_e = df.loc[[(get_month_date(), 'Managers')], :]
 
     return df_table_1_6_e
 
@@ -579,8 +586,8 @@ def prepare_reason_table_1_7(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 1_7")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_1_7 = df.loc[[(month_date, 'Other staff or those with unknown classification')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_1_7 = df.loc[[(get_month_date(), 'Other staff or those with unknown classification')], :]
 
     return df_table_1_7
 
@@ -649,10 +656,10 @@ def prepare_reason_table_2_1(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_1")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
+    logger.debug("Reading df:\n%s", df.head(1))
 
     # Get all of the values for the row containing the correct start date, All staff groups and All staff groups
-    df_table_2_1 = df.loc[[(month_date, 'All staff groups')], :]
+    df_table_2_1 = df.loc[[(get_month_date(), 'All staff groups')], :]
 
     return df_table_2_1
 
@@ -670,8 +677,8 @@ def prepare_reason_table_2_2(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_2")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_2 = df.loc[[(month_date, 'Professionally qualified clinical staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_2 = df.loc[[(get_month_date(), 'Professionally qualified clinical staff')], :]
 
     return df_table_2_2
 
@@ -689,8 +696,8 @@ def prepare_reason_table_2_3_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_a = df.loc[[(month_date, 'HCHS Doctors')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_a = df.loc[[(get_month_date(), 'HCHS Doctors')], :]
 
     return df_table_2_3_a
 
@@ -708,8 +715,8 @@ def prepare_reason_table_2_3_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_b = df.loc[[(month_date, 'Consultant')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_b = df.loc[[(get_month_date(), 'Consultant')], :]
 
     return df_table_2_3_b
 
@@ -727,8 +734,8 @@ def prepare_reason_table_2_3_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_c = df.loc[[(month_date, 'Associate Specialist')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_c = df.loc[[(get_month_date(), 'Associate Specialist')], :]
 
     return df_table_2_3_c
 
@@ -746,8 +753,8 @@ def prepare_reason_table_2_3_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_d = df.loc[[(month_date, 'Specialty Doctor')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_d = df.loc[[(get_month_date(), 'Specialty Doctor')], :]
 
     return df_table_2_3_d
 
@@ -765,8 +772,8 @@ def prepare_reason_table_2_3_e(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_e")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_e = df.loc[[(month_date, 'Staff Grade')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_e = df.loc[[(get_month_date(), 'Staff Grade')], :]
 
     return df_table_2_3_e
 
@@ -784,8 +791,8 @@ def prepare_reason_table_2_3_f(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_f")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_f = df.loc[[(month_date, 'Specialty Registrar')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_f = df.loc[[(get_month_date(), 'Specialty Registrar')], :]
 
     return df_table_2_3_f
 
@@ -803,8 +810,8 @@ def prepare_reason_table_2_3_g(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_g")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_g = df.loc[[(month_date, 'Core Training')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_g = df.loc[[(get_month_date(), 'Core Training')], :]
 
     return df_table_2_3_g
 
@@ -822,8 +829,8 @@ def prepare_reason_table_2_3_h(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_h")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_h = df.loc[[(month_date, 'Foundation Doctor Year 2')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_h = df.loc[[(get_month_date(), 'Foundation Doctor Year 2')], :]
 
     return df_table_2_3_h
 
@@ -841,8 +848,8 @@ def prepare_reason_table_2_3_i(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_i")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_i = df.loc[[(month_date, 'Foundation Doctor Year 1')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_i = df.loc[[(get_month_date(), 'Foundation Doctor Year 1')], :]
 
     return df_table_2_3_i
 
@@ -860,8 +867,8 @@ def prepare_reason_table_2_3_j(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_j")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_j = df.loc[[(month_date, 'Hospital Practitioner / Clinical Assistant')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_j = df.loc[[(get_month_date(), 'Hospital Practitioner / Clinical Assistant')], :]
 
     return df_table_2_3_j
 
@@ -879,8 +886,8 @@ def prepare_reason_table_2_3_k(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_3_k")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_3_k = df.loc[[(month_date, 'Other and Local HCHS Doctor Grades')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_3_k = df.loc[[(get_month_date(), 'Other and Local HCHS Doctor Grades')], :]
 
     return df_table_2_3_k
 
@@ -898,8 +905,8 @@ def prepare_reason_table_2_4_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_4_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_4_a = df.loc[[(month_date, 'Nurses & health visitors')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_4_a = df.loc[[(get_month_date(), 'Nurses & health visitors')], :]
 
     return df_table_2_4_a
 
@@ -917,8 +924,8 @@ def prepare_reason_table_2_4_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_4_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_4_b = df.loc[[(month_date, 'Midwives')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_4_b = df.loc[[(get_month_date(), 'Midwives')], :]
 
     return df_table_2_4_b
 
@@ -936,8 +943,8 @@ def prepare_reason_table_2_4_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_4_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_4_c = df.loc[[(month_date, 'Ambulance staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_4_c = df.loc[[(get_month_date(), 'Ambulance staff')], :]
 
     return df_table_2_4_c
 
@@ -955,8 +962,8 @@ def prepare_reason_table_2_4_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_4_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_4_d = df.loc[[(month_date, 'Scientific, therapeutic & technical staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_4_d = df.loc[[(get_month_date(), 'Scientific, therapeutic & technical staff')], :]
 
     return df_table_2_4_d
 
@@ -974,8 +981,8 @@ def prepare_reason_table_2_5_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_5_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_5_a = df.loc[[(month_date, 'Support to clinical staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_5_a = df.loc[[(get_month_date(), 'Support to clinical staff')], :]
 
     return df_table_2_5_a
 
@@ -993,8 +1000,8 @@ def prepare_reason_table_2_5_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_5_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_5_b = df.loc[[(month_date, 'Support to doctors, nurses & midwives')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_5_b = df.loc[[(get_month_date(), 'Support to doctors, nurses & midwives')], :]
 
     return df_table_2_5_b
 
@@ -1013,8 +1020,8 @@ def prepare_reason_table_2_5_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_5_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_5_c = df.loc[[(month_date, 'Support to ambulance staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_5_c = df.loc[[(get_month_date(), 'Support to ambulance staff')], :]
 
     return df_table_2_5_c
 
@@ -1033,8 +1040,8 @@ def prepare_reason_table_2_5_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_5_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_5_d = df.loc[[(month_date, 'Support to ST&T staff')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_5_d = df.loc[[(get_month_date(), 'Support to ST&T staff')], :]
 
     return df_table_2_5_d
 
@@ -1054,8 +1061,8 @@ def prepare_reason_table_2_6_a(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_6_a")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_6_a = df.loc[[(month_date, 'NHS infrastructure support')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_6_a = df.loc[[(get_month_date(), 'NHS infrastructure support')], :]
 
     return df_table_2_6_a
 
@@ -1073,8 +1080,8 @@ def prepare_reason_table_2_6_b(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_6_b")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_6_b = df.loc[[(month_date, 'Central functions')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_6_b = df.loc[[(get_month_date(), 'Central functions')], :]
 
     return df_table_2_6_b
 
@@ -1092,8 +1099,8 @@ def prepare_reason_table_2_6_c(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_6_c")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_6_c = df.loc[[(month_date, 'Hotel, property & estates')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_6_c = df.loc[[(get_month_date(), 'Hotel, property & estates')], :]
 
     return df_table_2_6_c
 
@@ -1111,8 +1118,8 @@ def prepare_reason_table_2_6_d(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_6_d")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_6_d = df.loc[[(month_date, 'Senior managers')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_6_d = df.loc[[(get_month_date(), 'Senior managers')], :]
 
     return df_table_2_6_d
 
@@ -1130,8 +1137,8 @@ def prepare_reason_table_2_6_e(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_6_e")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_6_e = df.loc[[(month_date, 'Managers')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_6_e = df.loc[[(get_month_date(), 'Managers')], :]
 
     return df_table_2_6_e
 
@@ -1149,7 +1156,7 @@ def prepare_reason_table_2_7(df):
     """
     logger.info(f"Preparing data for excel tag in the reason and staff table 2_7")
 
-    logger.info(f"Reading df:\n{df.head(1)}")
-    df_table_2_7 = df.loc[[(month_date, 'Other staff or those with unknown classification')], :]
+    logger.debug("Reading df:\n%s", df.head(1))
+    df_table_2_7 = df.loc[[(get_month_date(), 'Other staff or those with unknown classification')], :]
 
     return df_table_2_7
@@ -2,6 +2,7 @@
 bt_params = {
     'OUTPUT_DIR': r'xxx',
     'GROUND_TRUTH_DIR': r'xxx',
+    'DATE': 'dd/mm/yyyy',
     'files_to_compare': [
                             # Benchmarking
                             ('benchmarking_csv_yyyy-mm-dd.csv', 'xxx.csv'),
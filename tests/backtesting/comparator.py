@@ -0,0 +1,415 @@
+"""
+Compares the pipeline's CSV outputs with the ground truth CSVs.
+
+The ground truth files hold every month. They are read in chunks (or from a Parquet copy,
+see convert_ground_truth_to_parquet) and filtered to the month being tested as they are
+read, so only one month of the ground truth is ever in memory.
+
+Each pair of files is compared in its own process. Rows are matched on the key columns of
+the output (a hash join, so the row order does not matter), and every value column is
+compared at once with a tolerance, so the report lists every difference rather than
+stopping at the first failing column.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# The columns which identify a row in each output, by the start of the output's filename
+key_columns = {
+    'benchmarking_csv': ['ORG_CODE', 'STAFF_GROUP'],
+    'csv_absence_rates': ['ORG_CODE'],
+    'covid': ['NHSE_REGION_CODE', 'ORG_CODE', 'STAFF_GROUP'],
+    'reason_absence': ['STAFF_GROUP', 'REASON'],
+}
+
+# Number of rows listed for each column in the worst offenders of the report
+WORST_OFFENDERS = 10
+
+# Rows read at a time when fingerprinting a file or reading the ground truth
+FINGERPRINT_CHUNKSIZE = 100_000
+
+# Bytes of the CSV pyarrow reads at a time when converting the ground truth to Parquet
+CONVERT_BLOCK_SIZE = 1 << 20
+
+
+def get_key_columns(filename, df):
+    """
+    Creates a function to find the key columns for an output from its filename
+
+    If the output is not in key_columns every non-numeric column is used as a key.
+    """
+    for prefix, keys in key_columns.items():
+        if Path(filename).name.startswith(prefix):
+            return [key for key in keys if key in df.columns]
+
+    return [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])]
+
+
+def compare_frames(target_df, gtruth_df, key_cols, rtol=0.0, atol=0.005):
+    """
+    Creates a function to compare an output with its ground truth
+
+    Rows are joined on key_cols. Numeric columns are equal if they are within
+    atol + rtol * |ground truth| of each other (the default allows for rounding to 2 decimal
+    places), or are both missing. Other columns must match exactly.
+
+    Inputs:
+        target_df: dataframe of the pipeline output
+        gtruth_df: dataframe of the ground truth
+        key_cols: list of columns which identify a row
+        rtol: relative tolerance for numeric columns
+        atol: absolute tolerance for numeric columns
+
+    Output:
+        A dict report of the comparison, with 'passed' True if there were no differences
+    """
+    report = {
+        'target_shape': target_df.shape,
+        'gtruth_shape': gtruth_df.shape,
+        'missing_columns': [col for col in gtruth_df.columns if col not in target_df.columns],
+        'extra_columns': [col for col in target_df.columns if col not in gtruth_df.columns],
+        'columns_in_same_order': target_df.columns.tolist() == gtruth_df.columns.tolist(),
+        'key_columns': key_cols,
+    }
+
+    report['duplicate_keys'] = {
+        'target': int(target_df.duplicated(subset=key_cols).sum()),
+        'gtruth': int(gtruth_df.duplicated(subset=key_cols).sum())
+    }
+
+    # keys are compared as strings, so e.g. a region code read as a number still matches
+    target_keyed = target_df.astype({key: str for key in key_cols})
+    gtruth_keyed = gtruth_df.astype({key: str for key in key_cols})
+    joined = target_keyed.merge(gtruth_keyed, how='outer', on=key_cols, suffixes=('_TARGET', '_GTRUTH'), indicator=True)
+    report['rows_only_in_target'] = joined.loc[joined['_merge'] == 'left_only', key_cols].reset_index(drop=True)
+    report['rows_only_in_gtruth'] = joined.loc[joined['_merge'] == 'right_only', key_cols].reset_index(drop=True)
+    joined = joined[joined['_merge'] == 'both'].reset_index(drop=True)
+    report['matched_rows'] = len(joined)
+
+    value_cols = [col for col in gtruth_df.columns if col in target_df.columns and col not in key_cols]
+    numeric_cols = [col for col in value_cols
+                    if pd.api.types.is_numeric_dtype(target_df[col]) and pd.api.types.is_numeric_dtype(gtruth_df[col])]
+    other_cols = [col for col in value_cols if col not in numeric_cols]
+
+    column_differences = {}
+    if numeric_cols:
+        # every numeric column in one pass over a 2D array
+        target_values = joined[[f"{col}_TARGET" for col in numeric_cols]].to_numpy(dtype=np.float64)
+        gtruth_values = joined[[f"{col}_GTRUTH" for col in numeric_cols]].to_numpy(dtype=np.float64)
+        abs_diff = np.abs(target_values - gtruth_values)
+        both_missing = np.isnan(target_values) & np.isnan(gtruth_values)
+        different = ~both_missing & ~(abs_diff <= atol + rtol * np.abs(gtruth_values))
+
+        for i, col in enumerate(numeric_cols):
+            rows = np.flatnonzero(different[:, i])
+            if len(rows) == 0:
+                continue
+            # missing on one side only counts as the largest difference
+            col_diff = np.where(np.isnan(abs_diff[rows, i]), np.inf, abs_diff[rows, i])
+            worst = rows[np.argsort(-col_diff, kind='stable')[:WORST_OFFENDERS]]
+            column_differences[col] = {
+                'count': len(rows),
+                'max_abs_diff': float(col_diff.max()),
+                'worst_offenders': pd.DataFrame({**{key: joined[key].to_numpy()[worst] for key in key_cols},
+                                                'TARGET': target_values[worst, i],
+                                                'GTRUTH': gtruth_values[worst, i],
+                                                'ABS_DIFF': abs_diff[worst, i]})
+            }
+
+    for col in other_cols:
+        target_values = joined[f"{col}_TARGET"]
+        gtruth_values = joined[f"{col}_GTRUTH"]
+        different = ~((target_values == gtruth_values) | (target_values.isna() & gtruth_values.isna())).to_numpy()
+        rows = np.flatnonzero(different)
+        if len(rows) == 0:
+            continue
+        column_differences[col] = {
+            'count': len(rows),
+            'max_abs_diff': None,
+            'worst_offenders': pd.DataFrame({**{key: joined[key].to_numpy()[rows[:WORST_OFFENDERS]] for key in key_cols},
+                                            'TARGET': target_values.to_numpy()[rows[:WORST_OFFENDERS]],
+                                            'GTRUTH': gtruth_values.to_numpy()[rows[:WORST_OFFENDERS]]})
+        }
+
+    report['column_differences'] = column_differences
+    report['passed'] = (not report['missing_columns'] and not report['extra_columns']
+                        and report['columns_in_same_order']
+                        and not any(report['duplicate_keys'].values())
+                        and report['rows_only_in_target'].empty and report['rows_only_in_gtruth'].empty
+                        and not column_differences)
+
+    return report
+
+
+def prepare_for_comparison(df, date=None, fill_blanks=False):
+    """
+    Creates a function to apply the backtesting normalisation to an output or ground truth
+
+    Rows are filtered to the month being tested and the DATE column is dropped. If
+    fill_blanks is True blanks (suppressed values) in numeric columns are replaced with zero,
+    as is done for the pipeline output.
+    """
+    if 'DATE' in df.columns:
+        if date is not None:
+            df = df[df['DATE'].isin([date])]
+        df = df.drop(columns=['DATE'])
+
+    if fill_blanks:
+        numeric_cols = df.select_dtypes('number').columns
+        df[numeric_cols] = df[numeric_cols].fillna(0)
+
+    return df
+
+
+def iter_chunks(path, date=None):
+    """
+    Creates a function to read a CSV or Parquet file in chunks, keeping only one month
+
+    CSVs are read FINGERPRINT_CHUNKSIZE rows at a time and each chunk is filtered to the
+    date. For Parquet files the date filter is pushed down to pyarrow, so row groups for
+    other months are not read at all.
+
+    Inputs:
+        path: path of a .csv or .parquet file
+        date: the DATE to keep, e.g. '30/11/2021'. None to keep every row
+
+    Output:
+        A generator of dataframes
+    """
+    if Path(path).suffix == '.parquet':
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(path, format='parquet')
+        date_filter = ds.field('DATE') == date if date is not None and 'DATE' in dataset.schema.names else None
+        for batch in dataset.to_batches(filter=date_filter, batch_size=FINGERPRINT_CHUNKSIZE):
+            yield batch.to_pandas()
+    else:
+        with pd.read_csv(path, chunksize=FINGERPRINT_CHUNKSIZE) as chunks:
+            for chunk in chunks:
+                if date is not None and 'DATE' in chunk.columns:
+                    chunk = chunk[chunk['DATE'].isin([date])]
+                yield chunk
+
+
+def read_ground_truth(path, date=None):
+    """
+    Creates a function to read one month of a ground truth file, without loading the other months
+
+    Inputs:
+        path: path of the ground truth .csv or .parquet file
+        date: the DATE of the month being tested. None to read every row
+
+    Output:
+        A dataframe of the month
+    """
+    return pd.concat(iter_chunks(path, date), ignore_index=True)
+
+
+def get_ground_truth_schema(csv_path):
+    """
+    Creates a function to find the type of each column of a ground truth CSV from every row
+
+    pyarrow works out the column types from the first block of the CSV only. The ground truth
+    files hold every historical month, so a column can be blank or numeric in the older rows
+    and something else later. The types are instead taken from a pass over the whole file
+    with pandas: columns that pandas reads as numbers (or blanks) in every chunk are float64,
+    everything else is a string.
+
+    Output:
+        pyarrow schema of the CSV's columns
+    """
+    import pyarrow as pa
+
+    numeric = {}
+    for chunk in iter_chunks(csv_path):
+        for col in chunk.columns:
+            numeric[col] = numeric.get(col, True) and chunk[col].dtype.kind in 'iuf'
+
+    return pa.schema([(col, pa.float64() if is_numeric else pa.string()) for col, is_numeric in numeric.items()])
+
+
+def convert_ground_truth_to_parquet(csv_path, parquet_path=None):
+    """
+    Creates a function to make a Parquet copy of a ground truth CSV, for faster backtesting
+
+    The CSV is streamed through pyarrow a block at a time, so the file never has to fit in
+    memory. Each block becomes a row group with DATE statistics, and the ground truth CSVs
+    are added to a month at a time, so reading one DATE skips the row groups of other months.
+    The column types come from get_ground_truth_schema rather than the first block.
+
+    Inputs:
+        csv_path: path of the ground truth CSV
+        parquet_path: path of the Parquet file to write. Defaults to the CSV path with a .parquet suffix
+
+    Output:
+        The path of the Parquet file
+    """
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+
+    parquet_path = Path(parquet_path) if parquet_path is not None else Path(csv_path).with_suffix('.parquet')
+    schema = get_ground_truth_schema(csv_path)
+    # blanks are read as nulls, as they are by pandas
+    reader = pv.open_csv(csv_path, read_options=pv.ReadOptions(block_size=CONVERT_BLOCK_SIZE),
+                         convert_options=pv.ConvertOptions(column_types=schema, strings_can_be_null=True))
+    with pq.ParquetWriter(parquet_path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+    return parquet_path
+
+
+def file_fingerprint(path, date=None, fill_blanks=False, decimals=2):
+    """
+    Creates a function to fingerprint a CSV or Parquet file without loading all of it
+
+    The file is read in chunks by iter_chunks. Each chunk is normalised as
+    for the comparison, numeric columns are rounded to decimals and each row is hashed.
+    The row hashes are added together (wrapping at 2**64), so the fingerprint does not
+    depend on the order of the rows but does count duplicated rows.
+
+    Inputs:
+        path: path of the .csv or .parquet file
+        date: the DATE to keep, None to keep every row
+        fill_blanks: passed to prepare_for_comparison
+        decimals: number of decimal places numeric values are rounded to
+
+    Output:
+        A tuple of the column names, the number of rows and two sums of the row hashes
+    """
+    columns = None
+    n_rows = 0
+    hash_sum = np.uint64(0)
+    mixed_hash_sum = np.uint64(0)
+
+    for chunk in iter_chunks(path, date):
+        chunk = prepare_for_comparison(chunk, fill_blanks=fill_blanks)
+        # a column can be read as int in one chunk and float in another, so use float for every number
+        numeric_cols = chunk.select_dtypes('number').columns
+        chunk = chunk.astype({col: np.float64 for col in numeric_cols})
+        chunk[numeric_cols] = chunk[numeric_cols].round(decimals)
+        # None (Parquet) and NaN (CSV) are both missing strings
+        chunk = chunk.where(chunk.notna(), np.nan)
+
+        columns = tuple(chunk.columns)
+        row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        with np.errstate(over='ignore'):
+            hash_sum += row_hashes.sum(dtype=np.uint64)
+            # a second sum of mixed hashes, so two different sets of rows don't just have to add up the same
+            mixed_hash_sum += ((row_hashes ^ (row_hashes >> np.uint64(31))) * np.uint64(0x9E3779B97F4A7C15)).sum(dtype=np.uint64)
+        n_rows += len(chunk)
+
+    return columns, n_rows, int(hash_sum), int(mixed_hash_sum)
+
+
+def compare_files(target_path, gtruth_path, date=None, rtol=0.0, atol=0.005, use_fingerprint=True):
+    """
+    Creates a function to read a pair of CSVs and compare them
+
+    As in the original backtesting, the ground truth is filtered to the month being tested
+    and the DATE column is dropped from both files, and blanks (suppressed values) in the
+    output are compared as zero.
+
+    Inputs:
+        target_path: path of the pipeline output CSV
+        gtruth_path: path of the ground truth CSV, or a Parquet copy of it
+        date: the DATE of the month being tested, e.g. '30/11/2021'. None to use every row
+        rtol: relative tolerance for numeric columns
+        atol: absolute tolerance for numeric columns
+        use_fingerprint: whether to check the file fingerprints first. If they match, the files
+            are the same once rounded to 2 decimal places (as in the original backtesting) and
+            the detailed comparison is skipped.
+
+    Output:
+        The dict report from compare_frames, with the file names added
+    """
+    if use_fingerprint:
+        target_fingerprint = file_fingerprint(target_path, fill_blanks=True)
+        if target_fingerprint == file_fingerprint(gtruth_path, date=date):
+            columns, n_rows = list(target_fingerprint[0]), target_fingerprint[1]
+            return {
+                'target_file': Path(target_path).name,
+                'gtruth_file': Path(gtruth_path).name,
+                'fingerprints_match': True,
+                'target_shape': (n_rows, len(columns)),
+                'gtruth_shape': (n_rows, len(columns)),
+                'missing_columns': [],
+                'extra_columns': [],
+                'columns_in_same_order': True,
+                'key_columns': get_key_columns(target_path, pd.DataFrame(columns=columns)),
+                'duplicate_keys': {'target': 0, 'gtruth': 0},
+                'rows_only_in_target': pd.DataFrame(),
+                'rows_only_in_gtruth': pd.DataFrame(),
+                'matched_rows': n_rows,
+                'column_differences': {},
+                'passed': True
+            }
+
+    target_df = prepare_for_comparison(pd.read_csv(target_path), fill_blanks=True)
+    gtruth_df = prepare_for_comparison(read_ground_truth(gtruth_path, date), date=date)
+
+    report = compare_frames(target_df, gtruth_df, get_key_columns(target_path, target_df), rtol=rtol, atol=atol)
+    report['target_file'] = Path(target_path).name
+    report['gtruth_file'] = Path(gtruth_path).name
+    report['fingerprints_match'] = False
+
+    return report
+
+
+def compare_all_files(output_dir, gtruth_dir, files_to_compare, date=None, rtol=0.0, atol=0.005, use_fingerprint=True,
+                    max_workers=None):
+    """
+    Creates a function to compare every pair of files in a process pool
+
+    Inputs:
+        output_dir: folder of the pipeline outputs
+        gtruth_dir: folder of the ground truth CSVs
+        files_to_compare: list of (output filename, ground truth filename) pairs
+        date, rtol, atol, use_fingerprint: passed to compare_files
+        max_workers: number of processes, defaults to one per pair up to the number of CPUs
+
+    Output:
+        A list of reports in the same order as files_to_compare
+    """
+    target_paths = [Path(output_dir) / target for target, _ in files_to_compare]
+    gtruth_paths = [Path(gtruth_dir) / gtruth for _, gtruth in files_to_compare]
+    n = len(files_to_compare)
+
+    with ProcessPoolExecutor(max_workers=max_workers or max(1, min(n, 8))) as executor:
+        return list(executor.map(compare_files, target_paths, gtruth_paths,
+                                [date] * n, [rtol] * n, [atol] * n, [use_fingerprint] * n))
+
+
+def format_report(report):
+    """
+    Creates a function to write a report out as text for the test output
+
+    Output:
+        The report as a string
+    """
+    name = f"{report.get('target_file', 'output')} against {report.get('gtruth_file', 'ground truth')}"
+    lines = [f"Comparing {name}: {'PASS' if report['passed'] else 'FAILED'}"
+            f"{' (the file fingerprints match)' if report.get('fingerprints_match') else ''}",
+            f"Rows, cols: {report['target_shape']} in the output, {report['gtruth_shape']} in the ground truth. "
+            f"{report['matched_rows']} rows matched on {report['key_columns']}."]
+
+    if report['missing_columns']:
+        lines.append(f"Columns missing from the output: {report['missing_columns']}")
+    if report['extra_columns']:
+        lines.append(f"Columns not in the ground truth: {report['extra_columns']}")
+    if not report['columns_in_same_order']:
+        lines.append("The columns are in a different order")
+    if any(report['duplicate_keys'].values()):
+        lines.append(f"Rows with duplicated keys: {report['duplicate_keys']}")
+    for side in ['target', 'gtruth']:
+        rows = report[f'rows_only_in_{side}']
+        if not rows.empty:
+            lines.append(f"{len(rows)} rows only in the {'output' if side == 'target' else 'ground truth'}:\n"
+                        f"{rows.head(WORST_OFFENDERS).to_string(index=False)}")
+    for col, differences in report['column_differences'].items():
+        max_diff = '' if differences['max_abs_diff'] is None else f", max difference {differences['max_abs_diff']}"
+        lines.append(f"{col}: {differences['count']} rows differ{max_diff}. Worst offenders:\n"
+                    f"{differences['worst_offenders'].to_string(index=False)}")
+
+    return '\n'.join(lines)
@@ -0,0 +1,153 @@
+"""
+Tests of the backtesting comparator on small made up outputs.
+"""
+
+import numpy as np
+import pandas as pd
+import comparator
+from comparator import (compare_frames, compare_all_files, compare_files, file_fingerprint, format_report,
+                        read_ground_truth, convert_ground_truth_to_parquet)
+
+
+def make_output():
+    return pd.DataFrame({'ORG_CODE': ['R01', 'R01', 'R02', 'R02'],
+                        'STAFF_GROUP': ['All staff groups', 'HCHS Doctors'] * 2,
+                        'FTE_DAYS_LOST': [10.0, 2.0, 20.0, 4.0],
+                        'FTE_DAYS_AVAILABLE': [100.0, 50.0, 200.0, np.nan]})
+
+
+def test_row_order_does_not_matter():
+    gtruth_df = make_output()
+    target_df = gtruth_df.iloc[::-1].reset_index(drop=True)
+
+    report = compare_frames(target_df, gtruth_df, ['ORG_CODE', 'STAFF_GROUP'])
+
+    assert report['passed'], format_report(report)
+    assert report['matched_rows'] == 4
+
+
+def test_differences_within_tolerance_pass():
+    gtruth_df = make_output()
+    target_df = gtruth_df.copy()
+    target_df['FTE_DAYS_LOST'] += 0.004
+
+    assert compare_frames(target_df, gtruth_df, ['ORG_CODE', 'STAFF_GROUP'])['passed']
+    assert not compare_frames(target_df, gtruth_df, ['ORG_CODE', 'STAFF_GROUP'], atol=0.001)['passed']
+
+
+def test_every_differing_column_is_reported():
+    gtruth_df = make_output()
+    target_df = gtruth_df.copy()
+    target_df.loc[1, 'FTE_DAYS_LOST'] = 3.0
+    target_df.loc[2, 'FTE_DAYS_LOST'] = 25.0
+    target_df.loc[0, 'FTE_DAYS_AVAILABLE'] = 101.0
+
+    report = compare_frames(target_df, gtruth_df, ['ORG_CODE', 'STAFF_GROUP'])
+
+    assert not report['passed']
+    assert set(report['column_differences']) == {'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE'}
+    assert report['column_differences']['FTE_DAYS_LOST']['count'] == 2
+    assert report['column_differences']['FTE_DAYS_LOST']['max_abs_diff'] == 5.0
+    # the worst offender is listed first
+    assert report['column_differences']['FTE_DAYS_LOST']['worst_offenders']['ORG_CODE'].tolist() == ['R02', 'R01']
+
+
+def test_missing_and_extra_rows_are_reported():
+    gtruth_df = make_output()
+    target_df = pd.concat([gtruth_df.iloc[1:], pd.DataFrame({'ORG_CODE': ['R03'], 'STAFF_GROUP': ['All staff groups'],
+                                                            'FTE_DAYS_LOST': [1.0], 'FTE_DAYS_AVAILABLE': [10.0]})])
+
+    report = compare_frames(target_df, gtruth_df, ['ORG_CODE', 'STAFF_GROUP'])
+
+    assert not report['passed']
+    assert report['rows_only_in_target']['ORG_CODE'].tolist() == ['R03']
+    assert report['rows_only_in_gtruth'][['ORG_CODE', 'STAFF_GROUP']].values.tolist() == [['R01', 'All staff groups']]
+    assert report['matched_rows'] == 3
+
+
+def test_compare_all_files(tmp_path):
+    output_dir = tmp_path / 'outputs'
+    gtruth_dir = tmp_path / 'ground_truth'
+    output_dir.mkdir()
+    gtruth_dir.mkdir()
+
+    gtruth_df = make_output()
+    gtruth_df.insert(0, 'DATE', '30/11/2021')
+    pd.concat([gtruth_df, gtruth_df.assign(DATE='31/10/2021', FTE_DAYS_LOST=0.0)]).to_csv(gtruth_dir / 'gtruth.csv', index=False)
+    gtruth_df.to_csv(output_dir / 'benchmarking_csv_2021-11-30.csv', index=False)
+    gtruth_df.assign(FTE_DAYS_LOST=1.0).to_csv(output_dir / 'benchmarking_csv_changed.csv', index=False)
+
+    reports = compare_all_files(output_dir, gtruth_dir, [('benchmarking_csv_2021-11-30.csv', 'gtruth.csv'),
+                                                        ('benchmarking_csv_changed.csv', 'gtruth.csv')],
+                                date='30/11/2021', max_workers=2)
+
+    # blank FTE_DAYS_AVAILABLE in the output is compared as zero, as in the original backtesting
+    assert list(reports[0]['column_differences']) == ['FTE_DAYS_AVAILABLE']
+    assert reports[0]['column_differences']['FTE_DAYS_AVAILABLE']['count'] == 1
+    assert reports[1]['column_differences']['FTE_DAYS_LOST']['count'] == 4
+    assert 'benchmarking_csv_changed.csv against gtruth.csv: FAILED' in format_report(reports[1])
+
+
+def test_fingerprint_ignores_row_order_and_chunks(tmp_path, monkeypatch):
+    df = make_output().fillna(0)
+    df.to_csv(tmp_path / 'a.csv', index=False)
+    df.iloc[::-1].assign(FTE_DAYS_LOST=df['FTE_DAYS_LOST'].iloc[::-1] + 0.001).to_csv(tmp_path / 'b.csv', index=False)
+    df.assign(FTE_DAYS_LOST=df['FTE_DAYS_LOST'] + 1).to_csv(tmp_path / 'c.csv', index=False)
+
+    monkeypatch.setattr(comparator, 'FINGERPRINT_CHUNKSIZE', 3)
+
+    assert file_fingerprint(tmp_path / 'a.csv') == file_fingerprint(tmp_path / 'b.csv')
+    assert file_fingerprint(tmp_path / 'a.csv') != file_fingerprint(tmp_path / 'c.csv')
+
+
+def test_matching_fingerprints_skip_the_comparison(tmp_path):
+    gtruth_df = make_output().fillna(0)
+    gtruth_df.insert(0, 'DATE', '30/11/2021')
+    pd.concat([gtruth_df.assign(DATE='31/10/2021'), gtruth_df]).to_csv(tmp_path / 'gtruth.csv', index=False)
+    gtruth_df.iloc[::-1].to_csv(tmp_path / 'benchmarking_csv_2021-11-30.csv', index=False)
+
+    report = compare_files(tmp_path / 'benchmarking_csv_2021-11-30.csv', tmp_path / 'gtruth.csv', date='30/11/2021')
+
+    assert report['passed'] and report['fingerprints_match']
+    assert report['matched_rows'] == 4
+    assert not compare_files(tmp_path / 'benchmarking_csv_2021-11-30.csv', tmp_path / 'gtruth.csv',
+                            date='30/11/2021', use_fingerprint=False)['fingerprints_match']
+
+
+def test_ground_truth_is_read_one_month_at_a_time(tmp_path, monkeypatch):
+    month_df = make_output()
+    month_df.insert(0, 'DATE', '30/11/2021')
+    history_df = pd.concat([month_df.assign(DATE='31/10/2021'), month_df, month_df.assign(DATE='31/12/2021')])
+    history_df.to_csv(tmp_path / 'gtruth.csv', index=False)
+    parquet_path = convert_ground_truth_to_parquet(tmp_path / 'gtruth.csv')
+
+    monkeypatch.setattr(comparator, 'FINGERPRINT_CHUNKSIZE', 3)
+
+    for path in [tmp_path / 'gtruth.csv', parquet_path]:
+        pd.testing.assert_frame_equal(read_ground_truth(path, '30/11/2021'), month_df.reset_index(drop=True))
+    assert file_fingerprint(parquet_path, date='30/11/2021') == file_fingerprint(tmp_path / 'gtruth.csv', date='30/11/2021')
+
+    month_df.to_csv(tmp_path / 'benchmarking_csv_2021-11-30.csv', index=False)
+    report = compare_files(tmp_path / 'benchmarking_csv_2021-11-30.csv', parquet_path, date='30/11/2021', use_fingerprint=False)
+    # only the blank FTE_DAYS_AVAILABLE, which is compared as zero in the output, differs
+    assert list(report['column_differences']) == ['FTE_DAYS_AVAILABLE']
+    assert report['matched_rows'] == 4
+
+
+def test_ground_truth_types_come_from_every_row(tmp_path, monkeypatch):
+    # the older months have no rates and RATE_NOTE is numeric, so the first blocks alone would type them wrong
+    old_months = pd.DataFrame({'DATE': '31/10/2021', 'ORG_CODE': [f"R{i:03d}" for i in range(2000)],
+                               'RATE': np.nan, 'RATE_NOTE': 1.0, 'HEADCOUNT': 5})
+    latest_month = pd.DataFrame({'DATE': '30/11/2021', 'ORG_CODE': ['R001', 'R002'],
+                                 'RATE': [1.5, np.nan], 'RATE_NOTE': ['suppressed', np.nan], 'HEADCOUNT': [6, 7]})
+    pd.concat([old_months, latest_month]).to_csv(tmp_path / 'gtruth.csv', index=False)
+
+    monkeypatch.setattr(comparator, 'CONVERT_BLOCK_SIZE', 4096)
+    parquet_path = convert_ground_truth_to_parquet(tmp_path / 'gtruth.csv')
+
+    df = read_ground_truth(parquet_path, '30/11/2021')
+    assert df.dtypes.astype(str).to_dict() == {'DATE': 'object', 'ORG_CODE': 'object', 'RATE': 'float64',
+                                               'RATE_NOTE': 'object', 'HEADCOUNT': 'float64'}
+    assert df['RATE'].tolist()[0] == 1.5
+    assert df['RATE_NOTE'].tolist() == ['suppressed', None]
+    assert file_fingerprint(parquet_path, date='30/11/2021') == file_fingerprint(tmp_path / 'gtruth.csv', date='30/11/2021')
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The pipeline and the backtesting modules import each other by module name, as they do when run as scripts
+for folder in [Path(__file__).parents[1] / 'absence_rates', Path(__file__).parent / 'backtesting']:
+    if str(folder) not in sys.path:
+        sys.path.insert(0, str(folder))
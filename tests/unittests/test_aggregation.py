@@ -0,0 +1,51 @@
+"""
+Checks that sum_by_groups returns exactly the frame that DataFrame.groupby().agg() does,
+including the last digits of the float sums, and keeps missing categorical keys with dropna=False.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import sum_by_groups
+
+COLS_TO_AGGREGATE = {'FTE_DAYS_LOST': 'sum', 'FTE_DAYS_AVAILABLE': 'sum', 'HEADCOUNT': 'sum'}
+
+
+@pytest.fixture
+def absence_data():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    df = pd.DataFrame({
+        'ORG_CODE': rng.choice(['RAA', 'RBB', 'RCC', 'RDD', None], n),
+        # sorted and ordered, as reference_data.encode_categoricals makes them, with an unused category
+        'STAFF_GROUP': pd.Categorical(rng.choice(['Doctors', 'Nurses', 'Support', np.nan], n),
+                                      categories=['Doctors', 'Nurses', 'Support', 'Unused'], ordered=True),
+        'MONTH': rng.integers(1, 13, n),
+        # values with many digits, so the order and method of adding them up shows in the sums
+        'FTE_DAYS_LOST': rng.random(n) * 10 / 3,
+        'FTE_DAYS_AVAILABLE': rng.random(n) * 1e6 / 7,
+        'HEADCOUNT': rng.integers(0, 50, n),
+    })
+    df.loc[df.sample(frac=0.05, random_state=0).index, 'FTE_DAYS_LOST'] = np.nan
+    return df
+
+
+def groupby_sums(df, group_cols, dropna):
+    if dropna:
+        return df.groupby(group_cols, as_index=False, observed=True, dropna=dropna).agg(COLS_TO_AGGREGATE)
+
+    # pandas 1.5 drops missing categorical keys even with dropna=False, so the expected
+    # frame is grouped on the keys as strings and the categories put back
+    category_cols = {col: df[col].dtype for col in group_cols if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    expected = (df.astype({col: object for col in category_cols})
+                .groupby(group_cols, as_index=False, dropna=False).agg(COLS_TO_AGGREGATE))
+    return expected.astype(category_cols)
+
+
+@pytest.mark.parametrize('dropna', [True, False])
+@pytest.mark.parametrize('group_cols', [['ORG_CODE'], ['STAFF_GROUP'], ['ORG_CODE', 'STAFF_GROUP', 'MONTH']])
+def test_sum_by_groups_matches_groupby(absence_data, group_cols, dropna):
+    result = sum_by_groups(absence_data, group_cols, COLS_TO_AGGREGATE, dropna=dropna)
+
+    pd.testing.assert_frame_equal(result, groupby_sums(absence_data, group_cols, dropna), check_exact=True)
@@ -0,0 +1,69 @@
+"""
+Checks the benchmarking orgs aggregations, and the benchmark group comparators: the ranks and
+percentiles of tied rates, leaving out suppressed rates and orgs without a benchmark group,
+and the case where no rates are left.
+"""
+
+import pandas as pd
+
+from benchmarking_tool import agg_benchmarking_orgs, create_benchmark_group_comparators
+
+
+def test_agg_benchmarking_orgs():
+    df = pd.DataFrame({
+        'ORG_CODE': ['RAA', 'RAA', 'RAA', 'RAA', 'RBB'],
+        'STAFF_GROUP_1_NAME': ['HCHS Doctors', 'Nurses', 'Nurses', 'Central functions', 'Nurses'],
+        # the Z code and the missing code are only in the all staff groups sums
+        'OCCUPATION_CODE': ['012', 'N6A', 'Z99', None, 'N6B'],
+        'FTE_DAYS_LOST': [1.0, 2.0, 4.0, 8.0, 3.0],
+        'FTE_DAYS_AVAILABLE': [10.0, 20.0, 40.0, 80.0, 30.0],
+    })
+    df_input = df.copy()
+    df_agg = agg_benchmarking_orgs(df)
+
+    # the caller's dataframe is not changed
+    pd.testing.assert_frame_equal(df, df_input)
+    assert df_agg[['ORG_CODE', 'STAFF_GROUP', 'FTE_DAYS_LOST']].values.tolist() == [
+        ['RAA', 'All staff groups', 15.0],
+        ['RBB', 'All staff groups', 3.0],
+        ['RAA', 'HCHS Doctors', 1.0],
+        ['RAA', 'Nurses', 2.0],
+        ['RBB', 'Nurses', 3.0],
+    ]
+    assert df_agg['SICKNESS_ABSENCE_RATE_PERCENT'].tolist() == [10.0] * 5
+
+
+def benchmarking_tool_output(rates, benchmark_groups):
+    return pd.DataFrame({
+        'DATE': '30/11/2021',
+        'BENCHMARK_GROUP': benchmark_groups,
+        'STAFF_GROUP': 'Nurses',
+        'ORG_CODE': [f"R{i}" for i in range(len(rates))],
+        'ORG_NAME': [f"Trust {i}" for i in range(len(rates))],
+        # suppressed rates are blank strings
+        'SICKNESS_ABSENCE_RATE_PERCENT': rates,
+    })
+
+
+def test_ties_and_suppressed_rates():
+    df = benchmarking_tool_output([5.0, 3.0, 2.0, 3.0, '', 1.0], ['Acute'] * 5 + [None])
+    df_comparators = create_benchmark_group_comparators(df)
+
+    # the suppressed rate and the org without a benchmark group are left out
+    assert df_comparators['ORG_CODE'].tolist() == ['R2', 'R1', 'R3', 'R0']
+    # tied rates share the lowest rank, and the percentile of the orgs with the same or a lower rate
+    assert df_comparators['GROUP_RANK'].tolist() == [1, 2, 2, 4]
+    assert df_comparators['GROUP_PERCENTILE'].tolist() == [25.0, 75.0, 75.0, 100.0]
+    assert (df_comparators['GROUP_ORGS'] == 4).all()
+    assert df_comparators.loc[0, ['GROUP_P10', 'GROUP_P25', 'GROUP_MEDIAN', 'GROUP_P75', 'GROUP_P90']].tolist() == [
+        2.3, 2.75, 3.0, 3.5, 4.4]
+
+
+def test_no_rates_left():
+    df = benchmarking_tool_output(['', '', 4.0], ['Acute', 'Acute', None])
+    df_comparators = create_benchmark_group_comparators(df)
+
+    assert df_comparators.empty
+    assert df_comparators.columns.tolist() == [
+        'DATE', 'BENCHMARK_GROUP', 'STAFF_GROUP', 'ORG_CODE', 'ORG_NAME', 'SICKNESS_ABSENCE_RATE_PERCENT',
+        'GROUP_RANK', 'GROUP_ORGS', 'GROUP_PERCENTILE', 'GROUP_P10', 'GROUP_P25', 'GROUP_MEDIAN', 'GROUP_P75', 'GROUP_P90']
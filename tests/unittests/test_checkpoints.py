@@ -0,0 +1,70 @@
+"""
+Checks that queries are sent again after transient errors, and that a resumed run reads the
+queries that finished from their checkpoints rather than running them again.
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from checkpoints import with_checkpoints
+from data_connections import with_retries, is_transient_error
+
+
+class OdbcError(Exception):
+    """Stands in for a pyodbc error, whose first arg is the SQLSTATE"""
+
+
+def failing_query(errors):
+    calls = []
+    def run_query(database, query):
+        calls.append(query)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return pd.DataFrame({'ORG_CODE': ['RAA', 'RBB'], 'FTE_DAYS_LOST': [1.5, None]})
+    return run_query, calls
+
+
+def test_is_transient_error():
+    assert is_transient_error(OdbcError('08S01', '[08S01] Communication link failure'))
+    assert is_transient_error(OdbcError('HYT00', '[HYT00] Query timeout expired'))
+    assert not is_transient_error(OdbcError('42S02', "[42S02] Invalid object name 'ESR-ABSENCE-yyyy-mm'"))
+    assert not is_transient_error(ValueError('not a database error'))
+
+
+def test_with_retries():
+    run_query, calls = failing_query([OdbcError('08S01'), OdbcError('HYT00')])
+    df = with_retries(run_query, retries=2, backoff_seconds=0)('absence_db', 'select 1')
+    assert len(calls) == 3
+    assert len(df) == 2
+
+    run_query, calls = failing_query([OdbcError('08S01')] * 3)
+    with pytest.raises(OdbcError):
+        with_retries(run_query, retries=2, backoff_seconds=0)('absence_db', 'select 1')
+    assert len(calls) == 3
+
+    # an error in the query itself is not retried
+    run_query, calls = failing_query([OdbcError('42S02')])
+    with pytest.raises(OdbcError):
+        with_retries(run_query, retries=2, backoff_seconds=0)('absence_db', 'select 1')
+    assert len(calls) == 1
+
+
+def test_resume_from_checkpoints(tmp_path):
+    run_query, calls = failing_query([])
+    first_run = with_checkpoints(run_query, tmp_path)
+    df = first_run('absence_db', 'select 1', 'base_absence_data')
+    # a run that is not resumed always runs its queries
+    first_run('absence_db', 'select 1', 'base_absence_data')
+    assert len(calls) == 2
+
+    resumed_run = with_checkpoints(run_query, tmp_path, resume=True)
+    pd.testing.assert_frame_equal(resumed_run('absence_db', 'select 1', 'base_absence_data'), df)
+    assert len(calls) == 2
+
+    # a query that has changed since its checkpoint is run again
+    resumed_run('absence_db', 'select 2', 'base_absence_data')
+    assert calls[-1] == 'select 2'
+
+    with pytest.raises(ValueError):
+        with_checkpoints(run_query, None, resume=True)
@@ -0,0 +1,130 @@
+"""
+Checks that every COVID breakdown has the same sums as grouping the base data directly, as the
+baseline did, and that the DuckDB engine gives the same breakdowns as the pandas functions to
+within the rounding of the float sums (see create_covid_breakdowns_duckdb).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import covid_table
+from covid_table import (agg_covid_staff_cuts, create_covid_breakdowns, create_covid_orgs_breakdowns,
+                         create_covid_breakdowns_duckdb, get_aggregation_engine)
+from reference_data import encode_categoricals
+
+FTE_COLS = ['FTE_DAYS_AVAILABLE', 'FTE_DAYS_LOST', 'FTE_DAYS_LOST_COVID']
+COLS_TO_AGGREGATE = {col: 'sum' for col in ['FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE', 'FTE_DAYS_LOST_COVID']}
+
+# Each England and region breakdown with its staff cut and the keys the baseline grouped the base data on
+ENGLAND_AND_REGION_BREAKDOWNS = [
+    (covid_table.agg_all_england_all_staff, 'ALL_STAFF', ['TM_END_DATE']),
+    (covid_table.agg_all_england_major_staff_groups, 'MAIN_STAFF_GROUP_NAME', ['TM_END_DATE', 'MAIN_STAFF_GROUP_NAME']),
+    (covid_table.agg_all_england_minor_staff_groups, 'STAFF_GROUP_1_NAME', ['TM_END_DATE', 'STAFF_GROUP_1_NAME']),
+    (covid_table.agg_all_england_medical_staff_grades, 'GRADE', ['TM_END_DATE', 'GRADE']),
+    (covid_table.agg_regions_all_staff, 'ALL_STAFF', ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME']),
+    (covid_table.agg_regions_major_staff_groups, 'MAIN_STAFF_GROUP_NAME',
+     ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'MAIN_STAFF_GROUP_NAME']),
+    (covid_table.agg_regions_minor_staff_groups, 'STAFF_GROUP_1_NAME',
+     ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'STAFF_GROUP_1_NAME']),
+    (covid_table.agg_regions_medical_staff_grades, 'GRADE', ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'GRADE']),
+]
+
+# The org breakdowns, which are taken from the org level aggregates of agg_covid_staff_cuts
+ORG_BREAKDOWNS = [
+    (covid_table.agg_orgs_all_staff, 'ALL_STAFF', ['TM_END_DATE', 'NHSE_REGION_CODE', 'ORG_CODE', 'NHSE_REGION_NAME']),
+    (covid_table.agg_orgs_major_staff_groups, 'MAIN_STAFF_GROUP_NAME',
+     ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'MAIN_STAFF_GROUP_NAME']),
+    (covid_table.agg_orgs_minor_staff_groups, 'STAFF_GROUP_1_NAME',
+     ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'STAFF_GROUP_1_NAME']),
+    (covid_table.agg_orgs_medical_staff_grades, 'GRADE', ['TM_END_DATE', 'NHSE_REGION_CODE', 'NHSE_REGION_NAME', 'ORG_CODE', 'GRADE']),
+]
+
+
+@pytest.fixture
+def covid_base_data():
+    rng = np.random.default_rng(0)
+    n = 50_000
+    orgs = [f"R{i:02d}" for i in range(40)]
+    staff_groups = {'HCHS Doctors': 'Professionally qualified clinical staff',
+                    'Nurses & health visitors': 'Professionally qualified clinical staff',
+                    'Central functions': 'NHS infrastructure support',
+                    'Unknown': 'NHS infrastructure support',
+                    'General payments': 'NHS infrastructure support'}
+    org = rng.choice(orgs, n)
+    staff_group = rng.choice(list(staff_groups), n)
+    df = pd.DataFrame({
+        'TM_END_DATE': '2021-11-30',
+        'NHSE_REGION_CODE': [f"Y{int(o[1:]) % 7}" for o in org],
+        'NHSE_REGION_NAME': [f"Region {int(o[1:]) % 7}" for o in org],
+        'ORG_CODE': org,
+        'MAIN_STAFF_GROUP_NAME': [staff_groups[s] for s in staff_group],
+        'STAFF_GROUP_1_NAME': staff_group,
+        'BREED': rng.choice(['Med', 'Non'], n),
+        'GRADE': rng.choice(['Consultant', 'Core Training', 'Specialty Doctor', None], n),
+        # values with many digits, so the order the sums are added up in shows
+        'FTE_DAYS_LOST': rng.random(n) * 10 / 3,
+        'FTE_DAYS_AVAILABLE': rng.random(n) * 1e4 / 7,
+    })
+    df['FTE_DAYS_LOST_COVID'] = df['FTE_DAYS_LOST'] * rng.integers(0, 2, n)
+    df.loc[::97, 'STAFF_GROUP_1_NAME'] = None
+    df.loc[::101, ['NHSE_REGION_CODE', 'NHSE_REGION_NAME']] = None
+    return df
+
+
+def staff_cut_rows(df, staff_cut):
+    # the rows the baseline functions filtered to for each staff cut
+    if staff_cut == 'STAFF_GROUP_1_NAME':
+        return df[~df['STAFF_GROUP_1_NAME'].isin(['General payments', 'Unknown', 'Non-funded staff'])]
+    if staff_cut == 'GRADE':
+        return df[df['BREED'].isin(['Med'])]
+    return df
+
+
+def assert_sums_match_baseline(df_agg, df_rows, keys):
+    expected = df_rows.groupby(keys, as_index=False).agg(COLS_TO_AGGREGATE)
+    pd.testing.assert_frame_equal(df_agg[FTE_COLS].reset_index(drop=True), expected[FTE_COLS], check_exact=True)
+
+
+@pytest.mark.parametrize('agg_function, staff_cut, keys', ENGLAND_AND_REGION_BREAKDOWNS)
+def test_england_and_region_sums_match_baseline(covid_base_data, agg_function, staff_cut, keys):
+    # summed from the base data, so the published values are the same to the last digit
+    assert_sums_match_baseline(agg_function(covid_base_data, COLS_TO_AGGREGATE), staff_cut_rows(covid_base_data, staff_cut), keys)
+
+
+@pytest.mark.parametrize('agg_function, staff_cut, keys', ORG_BREAKDOWNS)
+def test_org_sums_match_baseline(covid_base_data, agg_function, staff_cut, keys):
+    staff_cut_aggregates = agg_covid_staff_cuts(covid_base_data)
+    assert_sums_match_baseline(agg_function(staff_cut_aggregates[staff_cut], COLS_TO_AGGREGATE),
+                               staff_cut_rows(covid_base_data, staff_cut), keys)
+
+
+def assert_breakdowns_match(pandas_breakdowns, duckdb_breakdowns):
+    pandas_breakdowns = pandas_breakdowns.reset_index(drop=True)
+    duckdb_breakdowns = duckdb_breakdowns.reset_index(drop=True)
+    key_cols = [col for col in pandas_breakdowns.columns if col not in FTE_COLS]
+
+    pd.testing.assert_frame_equal(pandas_breakdowns[key_cols].astype(object), duckdb_breakdowns[key_cols].astype(object))
+    pd.testing.assert_frame_equal(pandas_breakdowns[FTE_COLS], duckdb_breakdowns[FTE_COLS],
+                                  check_exact=False, rtol=covid_table.DUCKDB_RTOL)
+
+
+@pytest.mark.parametrize('categorical', [False, True])
+def test_duckdb_matches_pandas(covid_base_data, categorical):
+    pytest.importorskip('duckdb')
+    if categorical:
+        category_dictionary = {col: sorted(covid_base_data[col].dropna().unique())
+                               for col in ['NHSE_REGION_CODE', 'ORG_CODE', 'MAIN_STAFF_GROUP_NAME', 'STAFF_GROUP_1_NAME']}
+        covid_base_data = encode_categoricals(covid_base_data, category_dictionary)
+
+    covid_data, covid_org_data = create_covid_breakdowns_duckdb(covid_base_data)
+
+    assert_breakdowns_match(create_covid_breakdowns(covid_base_data), covid_data)
+    assert_breakdowns_match(create_covid_orgs_breakdowns(covid_base_data), covid_org_data)
+
+
+def test_get_aggregation_engine():
+    assert get_aggregation_engine({}) == 'pandas'
+    assert get_aggregation_engine({'aggregation_engine': 'duckdb'}) == 'duckdb'
+    with pytest.raises(ValueError):
+        get_aggregation_engine({'aggregation_engine': 'DuckDB'})
@@ -0,0 +1,177 @@
+"""
+Checks that the single query for the unexpected occupation codes finds the same codes as the
+two queries and the pandas comparison. The queries are run against a small SQLite database
+in place of SQL Server, and against a snapshot of the same tables (see snapshot.py).
+"""
+
+import json
+import sqlite3
+import pandas as pd
+import pytest
+from functools import partial
+
+pytest.importorskip('sqlalchemy')
+import data_quality_checks
+import snapshot
+
+DATABASE = 'absence_db'
+START_DATE = '2021-11-30'
+END_DATE = '2021-11-30'
+
+
+@pytest.fixture(params=['sqlite', 'snapshot'])
+def sqlite_database(request, monkeypatch, tmp_path):
+    conn = sqlite3.connect(':memory:')
+
+    pd.DataFrame({
+        'Tm Year Month': ['2021-11'] * 8 + ['2021-10'] * 2,
+        'Occupation Code': ['A01', 'A01', 'B02', 'C03', 'D04', 'E05', None, 'A01', 'C03', 'F06'],
+        'ODS code': ['RAA', 'RBB', 'RAA', 'RAA', 'RWL', 'RAA', 'RAA', 'RCC', 'RAA', 'RBB'],
+        'Wte Days Sick This Month': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+        'Wte Days Available': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 100.0],
+    }).to_sql('staff_raw', conn, index=False)
+
+    pd.DataFrame({
+        # C03 is no longer in the publication, D04 is only used by a Welsh org, E05 and F06 are not in the ref table
+        'occ_code': ['A01', 'B02', 'C03', 'D04'],
+        'MAIN_STAFF_GROUP_NAME': ['Doctors', 'Nurses', 'Nurses', 'Support'],
+        'STAFF_GROUP_1_NAME': ['Doctors', 'Nurses', 'Nurses', 'Support'],
+        'START_DATE_PUBLICATION': ['2009-01-01', '2009-01-01', '2009-01-01', '2009-01-01'],
+        'END_DATE_PUBLICATION': [None, None, '2020-12-31', None],
+    }).to_sql('ref_occ', conn, index=False)
+
+    pd.DataFrame({
+        'Current Org code': ['RAA', 'RBB', 'RCC', 'RWL'],
+        'Reporting Org code': ['RAA', 'RBB', 'RCC', 'RWL'],
+        'Start Date': ['2000-01-01', '2000-01-01', '2000-01-01', '2000-01-01'],
+        'End Date': [None, None, None, None],
+        'EnglandWales': ['E', 'E', 'E', 'W'],
+    }).to_sql('org_master', conn, index=False)
+
+    def get_df_from_sqlite(database, query):
+        # SQLite has no database or schema in the table names
+        return pd.read_sql_query(query.replace(f"[{database}].[dbo].", ""), conn)
+
+    if request.param == 'sqlite':
+        monkeypatch.setattr(data_quality_checks, 'get_df_from_sql', get_df_from_sqlite)
+    else:
+        pytest.importorskip('duckdb')
+        tables = {}
+        for table in ['staff_raw', 'ref_occ', 'org_master']:
+            pd.read_sql_query(f"select * from [{table}]", conn).to_parquet(tmp_path / f"{table}.parquet", index=False)
+            tables[table] = {'file': f"{table}.parquet"}
+        with open(tmp_path / snapshot.MANIFEST_FILE, 'w') as f:
+            json.dump({'tables': tables}, f)
+        monkeypatch.setattr(data_quality_checks, 'get_df_from_sql', partial(snapshot.get_df_from_snapshot, tmp_path))
+    yield conn
+    conn.close()
+
+
+def test_single_query_matches_pandas_path(sqlite_database):
+    occ_codes_absence = data_quality_checks.query_occ_codes_from_absence_data(DATABASE, 'staff_raw')
+    occ_codes_ref = data_quality_checks.query_occ_codes_from_ref_data(DATABASE, 'staff_raw', 'ref_occ', 'org_master',
+                                                                    START_DATE, END_DATE)
+    pandas_codes = data_quality_checks.get_unexpected_occ_codes(occ_codes_absence, occ_codes_ref)
+
+    sql_codes = data_quality_checks.query_unexpected_occ_codes(DATABASE, 'staff_raw', 'ref_occ', 'org_master',
+                                                            START_DATE, END_DATE)
+
+    def code_set(df):
+        return set(df[['TM_YEAR_MONTH', 'OCCUPATION_CODE']].fillna('').itertuples(index=False, name=None))
+
+    assert code_set(sql_codes) == code_set(pandas_codes)
+    assert code_set(sql_codes) == {('2021-11', 'C03'), ('2021-10', 'C03'), ('2021-11', 'D04'),
+                                ('2021-11', 'E05'), ('2021-10', 'F06'), ('2021-11', '')}
+
+
+def test_single_query_returns_impact(sqlite_database):
+    sql_codes = data_quality_checks.query_unexpected_occ_codes(DATABASE, 'staff_raw', 'ref_occ', 'org_master',
+                                                            START_DATE, END_DATE)
+
+    c03 = sql_codes[sql_codes['OCCUPATION_CODE'] == 'C03'].set_index('TM_YEAR_MONTH')
+    assert c03.loc['2021-11', 'ROW_COUNT'] == 1
+    assert c03.loc['2021-10', 'FTE_DAYS_LOST'] == 9.0
+    assert c03.loc['2021-10', 'FTE_DAYS_AVAILABLE'] == 90.0
+
+
+def test_translate_query():
+    query = """select a.[Occupation Code] as [OCCUPATION_CODE], '[not a name]' as [TEXT]
+        from [absence_db].[dbo].[ESR-ABSENCE-2021-11] a
+        where b.[Reporting Org code] not like '[5Q]%' and a.[Occupation Code] like '[Z]%'
+        and [Related Reason] like 'Coronavirus (COVID-19)%'"""
+
+    assert snapshot.translate_query(query, DATABASE) == """select a."Occupation Code" as "OCCUPATION_CODE", '[not a name]' as "TEXT"
+        from "ESR-ABSENCE-2021-11" a
+        where not regexp_matches(b."Reporting Org code", '^[5Q]') and regexp_matches(a."Occupation Code", '^[Z]')
+        and "Related Reason" like 'Coronavirus (COVID-19)%'"""
+
+
+def test_occ_code_totals(sqlite_database):
+    totals = data_quality_checks.query_occ_code_totals(DATABASE, 'staff_raw', 'ref_occ', 'org_master', START_DATE, END_DATE)
+    totals = totals.set_index(totals['OCCUPATION_CODE'].fillna(''))
+
+    # the Welsh org's rows (D04) are not in the publication
+    assert sorted(totals.index) == ['', 'A01', 'B02', 'C03', 'E05', 'F06']
+    assert totals.loc['A01', ['STAFF_GROUP_1_NAME', 'ROW_COUNT', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']].tolist() == ['Doctors', 3, 11.0, 110.0]
+    # C03 is no longer in the ref table for the publication
+    assert pd.isna(totals.loc['C03', 'STAFF_GROUP_1_NAME'])
+    assert totals.loc['C03', 'FTE_DAYS_AVAILABLE'] == 130.0
+
+
+def test_simulate_occ_code_updates():
+    occ_code_totals = pd.DataFrame({
+        'OCCUPATION_CODE': ['A01', 'B02', 'X99', 'Y98'],
+        'MAIN_STAFF_GROUP_NAME': ['Doctors', 'Nurses', None, None],
+        'STAFF_GROUP_1_NAME': ['Doctors', 'Nurses', None, None],
+        'ROW_COUNT': [10, 20, 5, 1],
+        'FTE_DAYS_LOST': [5.0, 30.0, 20.0, 1.0],
+        'FTE_DAYS_AVAILABLE': [100.0, 300.0, 100.0, 10.0],
+    })
+    valid_occ_codes = occ_code_totals.loc[:1, ['OCCUPATION_CODE', 'MAIN_STAFF_GROUP_NAME', 'STAFF_GROUP_1_NAME']]
+
+    impact = data_quality_checks.simulate_occ_code_updates(occ_code_totals, valid_occ_codes,
+                                                        {'X99': 'A01', 'A01': 'B02', 'Y98': 'Z00'})
+    impact = impact.set_index('OLD_VALUE')
+
+    # England is 35 / 400 days before any update
+    assert impact['ENGLAND_RATE_BEFORE'].tolist() == [8.75] * 3
+    # an invalid code updated to a valid one adds its days to England and the new staff group
+    assert impact.loc['X99', 'ENGLAND_RATE_AFTER'] == 11.0
+    assert impact.loc['X99', ['NEW_STAFF_GROUP_RATE_BEFORE', 'NEW_STAFF_GROUP_RATE_AFTER']].tolist() == [5.0, 12.5]
+    assert pd.isna(impact.loc['X99', 'OLD_STAFF_GROUP_RATE_CHANGE'])
+    # a valid code moved to another staff group leaves England as it is
+    assert impact.loc['A01', 'ENGLAND_RATE_CHANGE'] == 0
+    assert impact.loc['A01', 'NEW_STAFF_GROUP_RATE_AFTER'] == 8.75
+    # an update to a code which is not in the ref table changes nothing
+    assert impact.loc['Y98', 'ENGLAND_RATE_CHANGE'] == 0
+    assert impact.loc['Y98', ['OLD_STAFF_GROUP_RATE_CHANGE', 'NEW_STAFF_GROUP_RATE_CHANGE']].isna().all()
+    # the largest change in a staff group rate comes first
+    assert impact.index.tolist() == ['X99', 'A01', 'Y98']
+
+
+def test_simulate_occ_code_update_between_staff_groups():
+    occ_code_totals = pd.DataFrame({
+        'OCCUPATION_CODE': ['A01', 'A02', 'B02', 'B03'],
+        'MAIN_STAFF_GROUP_NAME': ['Doctors', 'Doctors', 'Nurses', 'Nurses'],
+        'STAFF_GROUP_1_NAME': ['Doctors', 'Doctors', 'Nurses', 'Nurses'],
+        'ROW_COUNT': [10, 10, 30, 1],
+        'FTE_DAYS_LOST': [5.0, 15.0, 30.0, 1.0],
+        'FTE_DAYS_AVAILABLE': [100.0, 100.0, 300.0, 10.0],
+    })
+    valid_occ_codes = occ_code_totals[['OCCUPATION_CODE', 'MAIN_STAFF_GROUP_NAME', 'STAFF_GROUP_1_NAME']]
+
+    impact = data_quality_checks.simulate_occ_code_updates(occ_code_totals, valid_occ_codes,
+                                                        {'B03': 'B02', 'A02': 'B02'})
+    impact = impact.set_index('OLD_VALUE')
+
+    # A02 moves from Doctors (20 / 200 days) to Nurses (31 / 310 days), and England stays at 51 / 510 days
+    assert impact.loc['A02', ['ENGLAND_RATE_BEFORE', 'ENGLAND_RATE_CHANGE']].tolist() == [10.0, 0]
+    assert impact.loc['A02', ['OLD_STAFF_GROUP_1_NAME', 'NEW_STAFF_GROUP_1_NAME']].tolist() == ['Doctors', 'Nurses']
+    assert impact.loc['A02', ['OLD_STAFF_GROUP_RATE_BEFORE', 'OLD_STAFF_GROUP_RATE_AFTER',
+                              'OLD_STAFF_GROUP_RATE_CHANGE']].tolist() == [10.0, 5.0, -5.0]
+    assert impact.loc['A02', ['NEW_STAFF_GROUP_RATE_BEFORE', 'NEW_STAFF_GROUP_RATE_AFTER',
+                              'NEW_STAFF_GROUP_RATE_CHANGE']].tolist() == [10.0, 11.22, 1.22]
+    # an update within a staff group changes neither group
+    assert impact.loc['B03', ['OLD_STAFF_GROUP_RATE_CHANGE', 'NEW_STAFF_GROUP_RATE_CHANGE']].tolist() == [0, 0]
+    # the fall in the old staff group's rate is the largest change
+    assert impact.index.tolist() == ['A02', 'B03']
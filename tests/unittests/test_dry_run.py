@@ -0,0 +1,110 @@
+"""
+Checks that the dry run catches a config.toml that has not been filled in for the month, and
+estimates the data quality queries against a small snapshot.
+"""
+
+import json
+import toml
+import pandas as pd
+import pytest
+
+pytest.importorskip('sqlalchemy')
+import dry_run
+import data_quality_checks
+import snapshot
+from helpers import get_project_root
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        'database': 'absence_db',
+        'staff_table_raw': 'ESR-ABSENCE-2021-11_RAW',
+        'staff_table': 'ESR-ABSENCE-2021-11',
+        'mds_table': 'MDS_Absence_202111',
+        'ref_table': 'REF_CORP_WKFC_OCCUPATION_V01',
+        'org_master': 'REF_ORG_MASTER',
+        'month_date': '30/11/2021',
+        'start_date': '2021-11-30',
+        'end_date': '2021-11-30',
+        'unexpected_occ_codes_engine': 'sql',
+        'snapshot_dir': str(tmp_path / 'snapshots'),
+        'output_dir': str(tmp_path),
+        'log_dir': str(tmp_path),
+    }
+
+
+def test_template_config_fails():
+    template = toml.load(get_project_root() / 'config.toml')
+    problems = dry_run.validate_config(template, data_quality_checks.REQUIRED_CONFIG)
+
+    assert "staff_table_raw = 'ESR-ABSENCE-yyyy-mm_RAW' has not been filled in" in problems
+    assert "start_date = 'yyyy-mm-dd' has not been filled in" in problems
+    # the optional folders are commented out in the template, so each feature is only used once it is set
+    assert [key for key in ['snapshot_dir', 'history_dir', 'intermediate_dir', 'checkpoint_dir'] if key in template] == []
+
+
+def test_validate_config(config):
+    assert dry_run.validate_config(config, data_quality_checks.REQUIRED_CONFIG) == []
+
+    assert dry_run.validate_config({**config, 'mds_table': 'MDS_Absence_202110', 'end_date': '2021-11-29'},
+                                   data_quality_checks.REQUIRED_CONFIG) == [
+        "end_date = '2021-11-29' is not the same as start_date",
+        "mds_table = 'MDS_Absence_202110' is not the table for 2021-11"]
+    assert dry_run.validate_config({**config, 'start_date': '2021-11-29', 'end_date': '2021-11-29'},
+                                   data_quality_checks.REQUIRED_CONFIG) == [
+        "start_date = '2021-11-29' is not the last day of the month",
+        "month_date = '30/11/2021' is not start_date as dd/mm/yyyy"]
+    assert dry_run.validate_config({**config, 'csv_writer': 'polars'}, data_quality_checks.REQUIRED_CONFIG) == [
+        "Unknown csv_writer 'polars' in config.toml, use one of ['pandas', 'arrow']"]
+    assert dry_run.validate_config({**config, 'aggregation_engine': 'DuckDB', 'log_level': 'debug'},
+                                   data_quality_checks.REQUIRED_CONFIG) == [
+        "Unknown aggregation_engine 'DuckDB' in config.toml, use one of ['pandas', 'duckdb']"]
+
+
+def test_dry_run_against_snapshot(config, caplog):
+    pytest.importorskip('duckdb')
+    snapshot_dir = snapshot.get_snapshot_dir(config)
+    snapshot_dir.mkdir(parents=True)
+    tables = {
+        config['staff_table_raw']: pd.DataFrame({
+            'Tm Year Month': ['2021-11'] * 3,
+            'Occupation Code': ['A01', 'B02', 'Z99'],
+            'ODS code': ['RAA', 'RAA', 'RBB'],
+            'Wte Days Sick This Month': [1.0, 2.0, 3.0],
+            'Wte Days Available': [10.0, 20.0, 30.0]}),
+        config['ref_table']: pd.DataFrame({
+            'occ_code': ['A01', 'B02'],
+            'MAIN_STAFF_GROUP_NAME': ['Doctors', 'Nurses'],
+            'STAFF_GROUP_1_NAME': ['Doctors', 'Nurses'],
+            'START_DATE_PUBLICATION': ['2009-01-01'] * 2,
+            'END_DATE_PUBLICATION': [None, None]}),
+    }
+    for table, df in tables.items():
+        df.to_parquet(snapshot_dir / f"{table}.parquet", index=False)
+    manifest = {'stages': {'data_quality': '2021-12-01T09:00:00'},
+                'tables': {table: {'file': f"{table}.parquet"} for table in tables}}
+    with open(snapshot_dir / snapshot.MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f)
+
+    # the organisation table has not been added to the snapshot
+    assert not dry_run.run_dry_run(config, data_quality_checks.REQUIRED_CONFIG, data_quality_checks.get_data_quality_queries)
+    assert "REF_ORG_MASTER does not exist" in caplog.text
+
+    pd.DataFrame({
+        'Current Org code': ['RAA', 'RBB'],
+        'Reporting Org code': ['RAA', 'RBB'],
+        'Start Date': ['2000-01-01'] * 2,
+        'End Date': [None, None],
+        'EnglandWales': ['E', 'E']}).to_parquet(snapshot_dir / 'REF_ORG_MASTER.parquet', index=False)
+    manifest['tables']['REF_ORG_MASTER'] = {'file': 'REF_ORG_MASTER.parquet'}
+    with open(snapshot_dir / snapshot.MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f)
+
+    queries = data_quality_checks.get_data_quality_queries(config)
+    assert list(queries) == ['unexpected_occ_codes']
+    estimate = snapshot.estimate_snapshot_query(snapshot_dir, config['database'], queries['unexpected_occ_codes'])
+    assert estimate['ROWS'] == len(data_quality_checks.query_unexpected_occ_codes(
+        config['database'], config['staff_table_raw'], config['ref_table'], config['org_master'],
+        config['start_date'], config['end_date'], snapshot.get_query_runner(config)))
+    assert dry_run.run_dry_run(config, data_quality_checks.REQUIRED_CONFIG, data_quality_checks.get_data_quality_queries)
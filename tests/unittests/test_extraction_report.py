@@ -0,0 +1,56 @@
+"""
+Checks that the queries run against the snapshot are added to the extraction report, and that
+SQL Server's STATISTICS IO, TIME messages are totalled.
+"""
+
+import json
+import pandas as pd
+import pytest
+
+import extraction_report
+from extraction_report import get_extraction_report, parse_statistics_messages
+
+DATABASE = 'absence_db'
+
+# As SQL Server sends them, with the ODBC driver's prefix
+STATISTICS_MESSAGES = [
+    "[Microsoft][ODBC Driver 17 for SQL Server][SQL Server]SQL Server parse and compile time: \n   CPU time = 16 ms, elapsed time = 21 ms.",
+    "[Microsoft][ODBC Driver 17 for SQL Server][SQL Server]Table 'ESR-ABSENCE-2021-11'. Scan count 5, logical reads 1200, physical reads 3, "
+    "page server reads 0, read-ahead reads 1100, page server read-ahead reads 0, lob logical reads 7, lob physical reads 0, "
+    "lob page server reads 0, lob read-ahead reads 0, lob page server read-ahead reads 0.",
+    "[Microsoft][ODBC Driver 17 for SQL Server][SQL Server]Table 'REF_ORG_MASTER'. Scan count 1, logical reads 20, physical reads 1, "
+    "page server reads 0, read-ahead reads 18, page server read-ahead reads 0, lob logical reads 0, lob physical reads 0, "
+    "lob page server reads 0, lob read-ahead reads 0, lob page server read-ahead reads 0.",
+    "[Microsoft][ODBC Driver 17 for SQL Server][SQL Server]\n SQL Server Execution Times:\n   CPU time = 390 ms,  elapsed time = 1250 ms.",
+]
+
+
+def test_parse_statistics_messages():
+    assert parse_statistics_messages(STATISTICS_MESSAGES) == {
+        'LOGICAL_READS': 1220, 'PHYSICAL_READS': 4, 'READ_AHEAD_READS': 1118,
+        'SERVER_CPU_MS': 390, 'SERVER_ELAPSED_MS': 1250}
+
+
+def test_snapshot_queries_are_reported(monkeypatch, tmp_path):
+    pytest.importorskip('duckdb')
+    import snapshot
+
+    monkeypatch.setattr(extraction_report, '_query_statistics', [])
+    pd.DataFrame({'Reporting Org code': ['RAA', 'RBB', 'RCC'],
+                  'Org Name': ['Trust A', 'Trust B', 'Trust C']}).to_parquet(tmp_path / 'REF_ORG_MASTER.parquet', index=False)
+    with open(tmp_path / snapshot.MANIFEST_FILE, 'w') as f:
+        json.dump({'tables': {'REF_ORG_MASTER': {'file': 'REF_ORG_MASTER.parquet'}}}, f)
+
+    df = snapshot.get_df_from_snapshot(tmp_path, DATABASE, f"select * from [{DATABASE}].[dbo].[REF_ORG_MASTER]")
+    report = get_extraction_report()
+
+    assert len(report) == 1
+    assert report.loc[0, 'SOURCE'] == 'snapshot'
+    assert report.loc[0, 'TABLES'] == 'REF_ORG_MASTER'
+    assert report.loc[0, ['ROWS', 'COLUMNS']].tolist() == [3, 2]
+    assert report.loc[0, 'ESTIMATED_MB'] == round(df.memory_usage(index=False, deep=True).sum() / 2**20, 1)
+    assert report.loc[0, ['EXECUTE_SECONDS', 'FETCH_SECONDS']].ge(0).all()
+    assert report['LOGICAL_READS'].isna().all()
+
+    path = extraction_report.write_extraction_report(tmp_path)
+    pd.testing.assert_frame_equal(pd.read_csv(path), report, check_dtype=False)
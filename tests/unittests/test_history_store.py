@@ -0,0 +1,73 @@
+"""
+Checks that months written to the history store are read back, that re-running a month
+replaces its partition, and that read_history only returns the months asked for.
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from history_store import write_to_history_store, read_history
+
+OUTPUT_NAME = 'benchmarking_csv'
+MONTHS = ['2021-09-30', '2021-10-31', '2021-11-30']
+
+
+def month_of_output(month, rate=1.5):
+    return pd.DataFrame({
+        'ORG_CODE': ['RAA', 'RBB', 'RCC'],
+        'STAFF_GROUP': pd.Categorical(['Nurses', 'Nurses', 'Doctors']),
+        'FTE_DAYS_LOST': [10.0, 20.0, ''],
+        # suppressed values are blank strings
+        'SICKNESS_ABSENCE_RATE_PERCENT': [rate, 2.5, ''],
+        'TM_END_DATE': month,
+    })
+
+
+def test_write_and_read(tmp_path):
+    for month in MONTHS:
+        partition_dir = write_to_history_store(month_of_output(month), tmp_path, OUTPUT_NAME, month)
+        assert partition_dir == tmp_path / OUTPUT_NAME / f"MONTH={month}"
+
+    df = read_history(tmp_path, OUTPUT_NAME)
+    assert df['MONTH'].tolist() == [month for month in MONTHS for _ in range(3)]
+    assert (df['MONTH'] == df['TM_END_DATE']).all()
+    assert df['SICKNESS_ABSENCE_RATE_PERCENT'].isna().tolist() == [False, False, True] * 3
+    assert df['STAFF_GROUP'].tolist() == ['Nurses', 'Nurses', 'Doctors'] * 3
+
+
+def test_rerun_month_replaces_partition(tmp_path, caplog):
+    for month in MONTHS:
+        write_to_history_store(month_of_output(month), tmp_path, OUTPUT_NAME, month)
+    write_to_history_store(month_of_output(MONTHS[1], rate=9.5), tmp_path, OUTPUT_NAME, MONTHS[1])
+
+    assert f"Replacing the {MONTHS[1]} partition" in caplog.text
+    # no temporary or old partitions are left behind
+    assert sorted(path.name for path in (tmp_path / OUTPUT_NAME).iterdir()) == [f"MONTH={month}" for month in MONTHS]
+    df = read_history(tmp_path, OUTPUT_NAME, columns=['ORG_CODE', 'SICKNESS_ABSENCE_RATE_PERCENT'])
+    assert len(df) == 9
+    assert df.loc[df['ORG_CODE'] == 'RAA', 'SICKNESS_ABSENCE_RATE_PERCENT'].tolist() == [1.5, 9.5, 1.5]
+
+
+def test_rerun_after_stopped_swap(tmp_path):
+    # a run that stopped after renaming the old partition aside leaves only the .old directory
+    partition_dir = write_to_history_store(month_of_output(MONTHS[0]), tmp_path, OUTPUT_NAME, MONTHS[0])
+    partition_dir.rename(partition_dir.with_name(f".{partition_dir.name}.old"))
+    assert read_history(tmp_path, OUTPUT_NAME).empty
+
+    write_to_history_store(month_of_output(MONTHS[0], rate=9.5), tmp_path, OUTPUT_NAME, MONTHS[0])
+    assert [path.name for path in (tmp_path / OUTPUT_NAME).iterdir()] == [partition_dir.name]
+    assert read_history(tmp_path, OUTPUT_NAME)['SICKNESS_ABSENCE_RATE_PERCENT'].tolist()[0] == 9.5
+
+
+def test_read_history_month_filtering(tmp_path):
+    for month in MONTHS:
+        write_to_history_store(month_of_output(month), tmp_path, OUTPUT_NAME, month)
+
+    assert read_history(tmp_path, OUTPUT_NAME, start_month=MONTHS[1])['MONTH'].unique().tolist() == MONTHS[1:]
+    assert read_history(tmp_path, OUTPUT_NAME, end_month=MONTHS[1])['MONTH'].unique().tolist() == MONTHS[:2]
+    df = read_history(tmp_path, OUTPUT_NAME, columns=['ORG_CODE'], filters={'ORG_CODE': ['RAA', 'RCC']},
+                      start_month=MONTHS[1], end_month=MONTHS[1])
+    assert df.columns.tolist() == ['MONTH', 'ORG_CODE']
+    assert df['ORG_CODE'].tolist() == ['RAA', 'RCC']
+    assert df['MONTH'].tolist() == [MONTHS[1]] * 2
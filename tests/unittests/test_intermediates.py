@@ -0,0 +1,28 @@
+"""
+Checks that the intermediate dataframes come back from their Arrow IPC files unchanged.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+from intermediates import write_intermediate, read_intermediate
+
+
+def test_round_trip(tmp_path):
+    df = pd.DataFrame({
+        'ORG_CODE': pd.Categorical(['RAA', 'RBB', 'RAA'], categories=['RAA', 'RBB', 'RCC'], ordered=True),
+        'STAFF_GROUP': ['Nurses', 'Doctors', None],
+        'FTE_DAYS_LOST': [1.5, np.nan, 3.0],
+        'FTE_DAYS_AVAILABLE': [10.0, 20.0, 30.0],
+    })
+    write_intermediate(df, tmp_path, 'benchmarking_inter_data')
+
+    pd.testing.assert_frame_equal(read_intermediate(tmp_path, 'benchmarking_inter_data'), df)
+
+    # the table is mapped from the file, not read into memory
+    allocated = pa.total_allocated_bytes()
+    table = read_intermediate(tmp_path, 'benchmarking_inter_data', as_table=True)
+    assert pa.total_allocated_bytes() == allocated
+    assert table.column('FTE_DAYS_AVAILABLE').to_pylist() == [10.0, 20.0, 30.0]
@@ -0,0 +1,76 @@
+"""
+Checks that the outputs are written the same way in each output format.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from output_writer import get_output_formats, write_output, write_csv_arrow, format_csv_column
+
+
+@pytest.fixture
+def output():
+    # rates are suppressed with blanks, as in the organisation CSV
+    return pd.DataFrame({
+        'DATE': ['30/11/2021'] * 3,
+        'ORG_CODE': ['RAA', 'RBB', 'RCC'],
+        'STAFF_GROUP': pd.Categorical(['Nurses', 'Doctors', 'Nurses']),
+        'FTE_DAYS_LOST': [10.5, 3.0, 2.25],
+        'SICKNESS_ABSENCE_RATE_PERCENT': [4.2, '', 1.13],
+    })
+
+
+def test_get_output_formats():
+    assert get_output_formats({}) == ['csv']
+    assert get_output_formats({'output_formats': ['parquet', 'csv.gz', 'parquet']}) == ['csv', 'parquet', 'csv.gz']
+    with pytest.raises(ValueError):
+        get_output_formats({'output_formats': ['xlsx']})
+
+
+def test_write_output(output, tmp_path):
+    paths = write_output(output, tmp_path / 'covid_2021-11-30.csv', ['csv', 'csv.gz', 'parquet'])
+
+    assert paths['csv.gz'] == tmp_path / 'covid_2021-11-30.csv.gz'
+    plain = paths['csv'].read_bytes()
+    assert pd.read_csv(paths['csv.gz']).equals(pd.read_csv(paths['csv']))
+    # the gzip file does not change between runs
+    assert write_output(output, tmp_path / 'covid_2021-11-30.csv', ['csv.gz'])['csv.gz'].read_bytes() == paths['csv.gz'].read_bytes()
+    assert paths['csv'].read_bytes() == plain
+
+    df = pd.read_parquet(paths['parquet'])
+    assert isinstance(df['ORG_CODE'].dtype, pd.CategoricalDtype)
+    assert df['SICKNESS_ABSENCE_RATE_PERCENT'].dtype == float
+    assert df['SICKNESS_ABSENCE_RATE_PERCENT'].isna().tolist() == [False, True, False]
+    pd.testing.assert_frame_equal(df.astype({'ORG_CODE': object, 'DATE': object, 'STAFF_GROUP': object}),
+                                  output.astype({'STAFF_GROUP': object}).replace('', float('nan')).astype({'SICKNESS_ABSENCE_RATE_PERCENT': float}))
+
+
+def test_write_csv_arrow(output, tmp_path):
+    df = pd.concat([output] * 4, ignore_index=True)
+    df['ORG_NAME'] = ['Trust, The', 'A "quoted" trust', None, 'Trust'] * 3
+    df['FTE_DAYS_AVAILABLE'] = [0.0, -0.0, 1e16, 1e-05, 123456789012.5, np.nan, 2.0, 0.1 + 0.2, 7.5e22, 1.0, 3.25, 4.0]
+    df['HEADCOUNT'] = np.arange(12)
+    df['SUPPRESSED'] = pd.Series([12, '', 3] * 4, dtype=object)
+    df['REPORTING'] = df['HEADCOUNT'] > 5
+
+    df.to_csv(tmp_path / 'pandas.csv', index=False)
+    write_csv_arrow(df, tmp_path / 'arrow.csv')
+    assert (tmp_path / 'arrow.csv').read_bytes() == (tmp_path / 'pandas.csv').read_bytes()
+
+
+def test_write_csv_arrow_falls_back_to_pandas(output, tmp_path):
+    string_dtype = output.astype({'ORG_CODE': 'string'})
+    string_dtype.loc[1, 'ORG_CODE'] = pd.NA
+    float32_values = output.assign(SICKNESS_ABSENCE_RATE_PERCENT=pd.Series([np.float32(0.1), '', np.float32(1.13)], dtype=object))
+
+    for df in [string_dtype, float32_values]:
+        df.to_csv(tmp_path / 'pandas.csv', index=False)
+        write_csv_arrow(df, tmp_path / 'arrow.csv')
+        assert (tmp_path / 'arrow.csv').read_bytes() == (tmp_path / 'pandas.csv').read_bytes()
+
+    assert format_csv_column(string_dtype['ORG_CODE']) is None
+    assert format_csv_column(float32_values['SICKNESS_ABSENCE_RATE_PERCENT']) is None
+    # written as str(np.float32(0.1)), not as the float64 0.10000000149011612
+    assert (tmp_path / 'arrow.csv').read_text().splitlines()[1].endswith(',0.1')
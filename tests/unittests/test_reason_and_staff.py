@@ -0,0 +1,70 @@
+"""
+Checks that the England roll ups of the organisation by staff group by reason cube, including
+the medical grades, are the same as the national reason and staff group breakdowns.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from reason_and_staff import create_org_reason_cube, create_reason_absence_breakdowns
+
+MONTH_DATE = '30/11/2021'
+
+
+@pytest.fixture
+def reason_staff_data():
+    rng = np.random.default_rng(0)
+    n = 2000
+    orgs = rng.choice(['RAA', 'RBB', 'RCC'], n)
+    staff_groups = rng.choice(['HCHS Doctors', 'Nurses & health visitors', 'Unknown', None], n)
+    # only the medical staff are in the grade breakdowns
+    breeds = np.where(staff_groups == 'HCHS Doctors', 'Med', 'Non')
+    return pd.DataFrame({
+        'ABSENCE_CATEGORY': 'Sickness',
+        'ATTENDANCE_REASON': rng.choice(['S11 Back Problems', 'S13 Cold Cough Flu - Influenza', 'Annual Leave'], n),
+        'FTE_DAYS_AVAILABLE': rng.random(n) * 20,
+        'FTE_DAYS_LOST': rng.random(n),
+        'TM_END_DATE': '2021-11-30',
+        'BREED': breeds,
+        'GRADE': np.where(breeds == 'Med', rng.choice(['Consultant', 'Specialty Registrar', 'Unknown', None], n),
+                          rng.choice(['Band 5', 'Band 6'], n)),
+        'MAIN_STAFF_GROUP_NAME': np.where(staff_groups == 'Unknown', 'Unknown', 'Professionally qualified clinical staff'),
+        'STAFF_GROUP_1_NAME': staff_groups,
+        # RCC is small, so its breakdowns are suppressed
+        'ORG_CODE': orgs,
+        'ORG_NAME': [f"Org {org}" for org in orgs],
+        'NHSE_REGION_CODE': np.where(orgs == 'RAA', 'Y1', 'Y2'),
+        'NHSE_REGION_NAME': np.where(orgs == 'RAA', 'Region 1', 'Region 2'),
+    }).assign(FTE_DAYS_AVAILABLE=lambda df: np.where(df['ORG_CODE'] == 'RCC', df['FTE_DAYS_AVAILABLE'] / 100, df['FTE_DAYS_AVAILABLE']))
+
+
+def test_england_roll_ups(reason_staff_data):
+    cube = create_org_reason_cube(reason_staff_data, MONTH_DATE)
+    national = create_reason_absence_breakdowns(reason_staff_data, MONTH_DATE)
+
+    england = cube[cube['GEOGRAPHY'] == 'ENGLAND']
+    assert england['BREAKDOWN_TYPE'].unique().tolist() == [
+        'All staff groups', 'MAJOR STAFF GROUP', 'MINOR STAFF GROUP', 'MINOR STAFF GRADES']
+    assert sorted(england.loc[england['BREAKDOWN_TYPE'] == 'MINOR STAFF GRADES', 'STAFF_GROUP'].unique()) == [
+        'Consultant', 'Specialty Registrar']
+    merged = england.merge(national, on=['STAFF_GROUP', 'REASON'], how='outer', indicator=True, validate='one_to_one')
+    assert (merged['_merge'] == 'both').all()
+    # the England rows are summed from the same rows as the national breakdowns, so they match exactly
+    assert (merged['FTE_DAYS_LOST_x'].astype(float) == merged['FTE_DAYS_LOST_y']).all()
+    assert (merged['FTE_DAYS_AVAILABLE_x'].astype(float) == merged['FTE_DAYS_AVAILABLE_y']).all()
+
+
+def test_org_suppression(reason_staff_data):
+    cube = create_org_reason_cube(reason_staff_data, MONTH_DATE)
+
+    orgs = cube[cube['GEOGRAPHY'] == 'REPORTING_ORG']
+    assert (orgs.loc[orgs['ORG_CODE'] == 'RCC', 'SICKNESS_ABSENCE_RATE_PERCENT'] == '').all()
+    # the other orgs are large enough to publish, apart from some of their small grade breakdowns
+    all_staff_groups = orgs['BREAKDOWN_TYPE'] == 'All staff groups'
+    assert (orgs.loc[(orgs['ORG_CODE'] != 'RCC') & all_staff_groups, 'SICKNESS_ABSENCE_RATE_PERCENT'] != '').all()
+
+    # the region and England totals still include the suppressed organisation
+    all_reasons = cube[(cube['BREAKDOWN_TYPE'] == 'All staff groups') & (cube['REASON'] == 'ALL REASONS')]
+    region_2 = all_reasons[(all_reasons['GEOGRAPHY'] == 'REGION') & (all_reasons['NHSE_REGION_CODE'] == 'Y2')]
+    expected = reason_staff_data.loc[reason_staff_data['NHSE_REGION_CODE'] == 'Y2', 'FTE_DAYS_AVAILABLE'].sum()
+    assert region_2['FTE_DAYS_AVAILABLE'].iloc[0] == pytest.approx(expected)
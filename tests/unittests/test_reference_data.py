@@ -0,0 +1,117 @@
+"""
+Checks the shared category dictionary and the categoricals built from it, and the latest
+org details lookup and the occupation code classes.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+
+from reference_data import (CATEGORY_COLUMNS, build_category_dictionary, encode_categoricals,
+                            build_latest_org_lookup, add_latest_org_details, classify_occupation_codes)
+
+
+@pytest.fixture
+def category_values():
+    # as returned by sql_query_category_values: unsorted, with duplicates and nulls
+    return pd.DataFrame({
+        'COLUMN_NAME': ['ORG_CODE', 'ORG_CODE', 'ORG_CODE', 'ORG_CODE', 'STAFF_GROUP_1_NAME', 'STAFF_GROUP_1_NAME', 'GRADE'],
+        'VALUE': ['RCC', 'RAA', None, 'RAA', 'Nurses', 'Doctors', 'Band 5'],
+    })
+
+
+@pytest.fixture
+def base_data():
+    rng = np.random.default_rng(0)
+    n = 1000
+    return pd.DataFrame({
+        # RZZ and the MDS grade are not in the reference tables
+        'ORG_CODE': rng.choice(['RCC', 'RAA', 'RZZ', None], n),
+        'STAFF_GROUP_1_NAME': rng.choice(['Nurses', 'Doctors', None], n),
+        'GRADE': rng.choice(['Band 5', 'Consultant', None], n),
+        'FTE_DAYS_LOST': rng.random(n) * 10 / 3,
+        'FTE_DAYS_AVAILABLE': rng.random(n) * 1e4 / 7,
+    })
+
+
+def test_build_category_dictionary(category_values):
+    category_dictionary = build_category_dictionary(category_values)
+
+    assert list(category_dictionary) == CATEGORY_COLUMNS
+    assert category_dictionary['ORG_CODE'] == ['RAA', 'RCC']
+    assert category_dictionary['STAFF_GROUP_1_NAME'] == ['Doctors', 'Nurses']
+    # columns with no values in the reference tables have no categories
+    assert category_dictionary['CLUSTER_GROUP'] == []
+
+
+def test_values_missing_from_reference_tables(category_values, base_data, caplog):
+    caplog.set_level(logging.INFO)
+    df = encode_categoricals(base_data.copy(), build_category_dictionary(category_values))
+
+    assert "1 values of ORG_CODE are not in the reference tables" in caplog.text
+    assert df['ORG_CODE'].cat.categories.tolist() == ['RAA', 'RCC', 'RZZ']
+    assert df['GRADE'].cat.categories.tolist() == ['Band 5', 'Consultant']
+    # every value keeps its own category, and missing values stay missing
+    for col in ['ORG_CODE', 'STAFF_GROUP_1_NAME', 'GRADE']:
+        assert df[col].cat.ordered
+        assert df[col].cat.categories.is_monotonic_increasing
+        pd.testing.assert_series_equal(df[col].astype(object).fillna('missing'), base_data[col].fillna('missing'))
+
+
+@pytest.mark.parametrize('group_cols', [['ORG_CODE'], ['GRADE', 'STAFF_GROUP_1_NAME'], ['ORG_CODE', 'STAFF_GROUP_1_NAME', 'GRADE']])
+def test_observed_groupby_matches_object_keys(category_values, base_data, group_cols):
+    df = encode_categoricals(base_data.copy(), build_category_dictionary(category_values))
+    cols_to_aggregate = {'FTE_DAYS_LOST': 'sum', 'FTE_DAYS_AVAILABLE': 'sum'}
+
+    result = df.groupby(group_cols, as_index=False, observed=True).agg(cols_to_aggregate)
+    expected = base_data.groupby(group_cols, as_index=False).agg(cols_to_aggregate)
+
+    pd.testing.assert_frame_equal(result.astype({col: object for col in group_cols}), expected, check_exact=True)
+
+
+@pytest.fixture
+def latest_orgs():
+    # as returned by sql_latest_org_name, with RBB in the table twice
+    return pd.DataFrame({
+        'ORG_CODE': ['RCC', 'RBB', 'RAA', 'RBB'],
+        'ORG_NAME': ['Trust C', 'Trust B', 'Trust A', 'Trust B (old name)'],
+        'NHSE_REGION_CODE': ['Y56', 'Y58', 'Y56', 'Y59'],
+    })
+
+
+def test_duplicate_org_codes_keep_first(latest_orgs, caplog):
+    org_lookup = build_latest_org_lookup(latest_orgs)
+
+    assert "1 org codes appear more than once in the latest org table" in caplog.text
+    assert "['RBB']" in caplog.text
+    assert org_lookup.index.tolist() == ['RCC', 'RBB', 'RAA']
+    assert org_lookup.loc['RBB', 'ORG_NAME'] == 'Trust B'
+
+
+@pytest.mark.parametrize('categorical', [False, True])
+def test_add_latest_org_details_matches_merge(latest_orgs, categorical):
+    rng = np.random.default_rng(0)
+    # RZZ is not in the latest org table
+    df = pd.DataFrame({'ORG_CODE': rng.choice(['RBB', 'RZZ', 'RAA', 'RCC', None], 200),
+                       'FTE_DAYS_LOST': rng.random(200)})
+    expected = df.merge(latest_orgs.drop_duplicates('ORG_CODE'), how='inner', on='ORG_CODE')
+    if categorical:
+        df = encode_categoricals(df, {'ORG_CODE': ['RAA', 'RBB', 'RCC', 'RZZ']})
+
+    df_joined = add_latest_org_details(df, build_latest_org_lookup(latest_orgs), ['ORG_NAME', 'NHSE_REGION_CODE'])
+
+    # the orgs missing from the latest table are dropped, and the rows are in the merge's order
+    assert 'RZZ' not in df_joined['ORG_CODE'].tolist()
+    pd.testing.assert_frame_equal(df_joined.astype({'ORG_CODE': object}), expected)
+
+
+def test_classify_occupation_codes():
+    occupation_codes = pd.Series(['012', 'N6A', None, 'Z99', '012', 'ZA1', np.nan, 'S1B'], index=range(10, 18))
+    occupation_classes = classify_occupation_codes(occupation_codes)
+
+    # codes starting with Z, and missing codes, are excluded
+    assert occupation_classes.tolist() == ['MEDICAL', 'NON_MEDICAL', 'EXCLUDED', 'EXCLUDED',
+                                           'MEDICAL', 'EXCLUDED', 'EXCLUDED', 'NON_MEDICAL']
+    assert occupation_classes.index.equals(occupation_codes.index)
+    assert occupation_classes.cat.categories.tolist() == ['MEDICAL', 'NON_MEDICAL', 'EXCLUDED']
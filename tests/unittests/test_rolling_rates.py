@@ -0,0 +1,80 @@
+"""
+Checks that the rolling 12 month sums updated incrementally each month are the same as
+rebuilding them from the monthly sums, on the first run, after a gap and after more than
+12 months of updates.
+"""
+
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from rolling_rates import update_rolling_sums, shift_month, ROLLING_MONTHS
+
+OUTPUT_NAME = 'csv_absence_rates'
+FIRST_MONTH = '2021-01-31'
+
+
+def month_of_data(i):
+    # RDD only has data in some months, so it drops out of and comes back into the window
+    rng = np.random.default_rng(i)
+    orgs = ['RAA', 'RBB', 'RCC'] + (['RDD'] if i % 5 == 0 else [])
+    return pd.DataFrame({
+        'ORG_CODE': orgs,
+        'NHSE_REGION_CODE': 'Y56',
+        'NHSE_REGION_NAME': 'London',
+        'ORG_NAME': [f"{org} trust (month {i})" for org in orgs],
+        'ORG_TYPE': 'Acute',
+        # many digits, so float error would show in the sums
+        'FTE_DAYS_LOST': rng.random(len(orgs)) * 1000 / 7,
+        'FTE_DAYS_AVAILABLE': rng.random(len(orgs)) * 1e5 / 3,
+    })
+
+
+def rebuild(history_dir, tmp_path, i):
+    # copy just the monthly sums, so update_rolling_sums has no previous rolling sums and rebuilds them
+    month = shift_month(FIRST_MONTH, i)
+    rebuild_dir = tmp_path / f"rebuild_{month}"
+    shutil.copytree(history_dir / f"{OUTPUT_NAME}_monthly_sums", rebuild_dir / f"{OUTPUT_NAME}_monthly_sums")
+    return update_rolling_sums(month_of_data(i), rebuild_dir, OUTPUT_NAME, month)
+
+
+def test_first_run(tmp_path):
+    data = month_of_data(0)
+    df_rolling = update_rolling_sums(data, tmp_path, OUTPUT_NAME, FIRST_MONTH)
+
+    assert df_rolling['MONTHS_IN_WINDOW'].tolist() == [1] * len(data)
+    pd.testing.assert_frame_equal(df_rolling[['ORG_CODE', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']],
+                                  data[['ORG_CODE', 'FTE_DAYS_LOST', 'FTE_DAYS_AVAILABLE']].round(6))
+
+
+def test_gap_month(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    for i in [0, 1, 2, 4]:
+        df_rolling = update_rolling_sums(month_of_data(i), tmp_path, OUTPUT_NAME, shift_month(FIRST_MONTH, i))
+
+    # the month after the gap has no previous rolling sums, so they are rebuilt from the months in the store
+    assert "rebuilding them from the monthly sums" in caplog.text
+    assert df_rolling.set_index('ORG_CODE')['MONTHS_IN_WINDOW'].to_dict() == {'RAA': 4, 'RBB': 4, 'RCC': 4, 'RDD': 1}
+    expected = pd.concat([month_of_data(i).round(6) for i in [0, 1, 2, 4]]).groupby('ORG_CODE')['FTE_DAYS_LOST'].sum().round(6)
+    pd.testing.assert_series_equal(df_rolling.set_index('ORG_CODE')['FTE_DAYS_LOST'], expected)
+    # the latest name of each org, from the last month it had data
+    assert df_rolling['ORG_NAME'].str[-9:].tolist() == ['(month 4)'] * 3 + ['(month 0)']
+
+    # and the month after that is updated incrementally again
+    caplog.clear()
+    df_rolling = update_rolling_sums(month_of_data(5), tmp_path, OUTPUT_NAME, shift_month(FIRST_MONTH, 5))
+    assert "rebuilding" not in caplog.text
+    pd.testing.assert_frame_equal(df_rolling, rebuild(tmp_path, tmp_path, 5))
+
+
+def test_incremental_matches_rebuild(tmp_path):
+    history_dir = tmp_path / 'history'
+    n_months = 2 * ROLLING_MONTHS + 3
+    for i in range(n_months):
+        df_rolling = update_rolling_sums(month_of_data(i), history_dir, OUTPUT_NAME, shift_month(FIRST_MONTH, i))
+
+    assert df_rolling['MONTHS_IN_WINDOW'].max() == ROLLING_MONTHS
+    pd.testing.assert_frame_equal(df_rolling, rebuild(history_dir, tmp_path, n_months - 1), check_exact=True)
@@ -0,0 +1,91 @@
+"""
+Checks that the snapshot is taken in stages, so the publication never reads an ESR absence
+table copied before the occupation code updates, and that each script only uses the snapshot
+once the stage it reads has been taken.
+"""
+
+import pandas as pd
+import pytest
+from functools import partial
+
+pytest.importorskip('duckdb')
+import snapshot
+
+DATABASE = 'absence_db'
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        'database': DATABASE,
+        'staff_table_raw': 'ESR-ABSENCE-2021-11_RAW',
+        'staff_table': 'ESR-ABSENCE-2021-11',
+        'mds_table': 'MDS_Absence_202111',
+        'staff_in_post': 'Final_StaffInPost_202111_NEW_BASE_PROCESS',
+        'org_master': 'REF_ORG_MASTER',
+        'ref_table': 'REF_CORP_WKFC_OCCUPATION_V01',
+        'ref_payscale': 'REF_Payscale',
+        'latest_org_name': 'REF_ORG_MASTER_LATEST_ORG_NAME_202111',
+        'start_date': '2021-11-30',
+        'snapshot_dir': str(tmp_path / 'snapshots'),
+    }
+
+
+@pytest.fixture
+def warehouse(config, monkeypatch):
+    # every table has the invalid code Z99 until the occupation code updates are made
+    tables = {config[key]: pd.DataFrame({'Occupation Code': ['A01', 'Z99']})
+              for keys in snapshot.SNAPSHOT_STAGES.values() for key in keys}
+
+    def get_df_from_warehouse(database, query):
+        return tables[query.split('[dbo].[')[1].rstrip(']')].copy()
+
+    monkeypatch.setattr(snapshot, 'get_df_from_sql', get_df_from_warehouse)
+    return tables
+
+
+def occupation_codes(run_query, table):
+    return run_query(DATABASE, f"select * from [{DATABASE}].[dbo].[{table}]")['Occupation Code'].tolist()
+
+
+def test_publication_reads_the_updated_table(config, warehouse, caplog):
+    snapshot.create_snapshot(config, 'data_quality')
+    manifest = snapshot.read_manifest(snapshot.get_snapshot_dir(config))
+    assert list(manifest['stages']) == ['data_quality']
+    assert config['staff_table'] not in manifest['tables']
+
+    # the data quality checks use the snapshot, the publication waits for its own stage
+    run_query = snapshot.get_query_runner(config, 'data_quality')
+    assert run_query.func is snapshot.get_df_from_snapshot
+    assert occupation_codes(run_query, config['staff_table_raw']) == ['A01', 'Z99']
+    assert not isinstance(snapshot.get_query_runner(config, 'publication'), partial)
+    assert "has no publication stage" in caplog.text
+    assert snapshot.find_missing_tables(config, [config['staff_table']], 'data_quality') == [config['staff_table']]
+
+    # the occupation code updates
+    warehouse[config['staff_table']]['Occupation Code'] = ['A01', 'B02']
+    snapshot.create_snapshot(config, 'publication')
+
+    run_query = snapshot.get_query_runner(config, 'publication')
+    assert run_query.func is snapshot.get_df_from_snapshot
+    assert occupation_codes(run_query, config['staff_table']) == ['A01', 'B02']
+    manifest = snapshot.read_manifest(snapshot.get_snapshot_dir(config))
+    assert list(manifest['stages']) == ['data_quality', 'publication']
+    assert manifest['tables'][config['staff_table']] == {
+        'rows': 2, 'file': f"{config['staff_table']}.parquet", 'stage': 'publication'}
+
+
+def test_publication_stage_needs_data_quality_stage(config, warehouse):
+    with pytest.raises(ValueError, match="Take the data_quality snapshot before the publication snapshot"):
+        snapshot.create_snapshot(config, 'publication')
+
+
+def test_retaking_data_quality_stage_drops_publication_stage(config, warehouse):
+    snapshot.create_snapshot(config, 'data_quality')
+    snapshot.create_snapshot(config, 'publication')
+    snapshot.create_snapshot(config, 'data_quality')
+
+    manifest = snapshot.read_manifest(snapshot.get_snapshot_dir(config))
+    assert list(manifest['stages']) == ['data_quality']
+    assert config['staff_table'] not in manifest['tables']
+    assert snapshot.find_snapshot(config, 'publication') is None
@@ -0,0 +1,59 @@
+"""
+Checks that the entry points start quickly: importing them must not read config.toml or
+import the heavy packages, which are imported by the stages that use them.
+
+The import times are measured with python -X importtime, and printed (run with -s to see them).
+"""
+
+import sys
+import subprocess
+import importlib
+from pathlib import Path
+import pytest
+
+ABSENCE_RATES_DIR = Path(__file__).resolve().parents[2] / 'absence_rates'
+
+# packages that are only needed by some stages. pyarrow is left out, as pandas imports it when it is installed
+HEAVY_PACKAGES = ['sqlalchemy', 'openpyxl', 'duckdb']
+
+
+def get_import_times(module):
+    """
+    Imports a module in a new interpreter with -X importtime
+
+    Output:
+        dict of each imported module to its cumulative import time in microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=ABSENCE_RATES_DIR, capture_output=True, text=True, check=True)
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        import_times[name.strip()] = int(cumulative)
+
+    return import_times
+
+
+@pytest.mark.parametrize('module', ['make_publication', 'data_quality_checks', 'snapshot'])
+def test_entry_point_imports(module):
+    import_times = get_import_times(module)
+    print(f"\nimport {module}: {import_times[module] / 1000:.0f} ms")
+
+    imported_packages = {name.split('.')[0] for name in import_times}
+    assert not imported_packages & set(HEAVY_PACKAGES)
+    if module == 'make_publication':
+        assert not imported_packages & {'pandas', 'numpy', 'pyarrow'}
+
+
+def test_config_not_read_on_import(monkeypatch):
+    import helpers
+
+    def get_config():
+        raise AssertionError("config.toml was read when the module was imported")
+
+    monkeypatch.setattr(helpers, 'get_config', get_config)
+    sys.modules.pop('write_reason_absence_excel', None)
+    importlib.import_module('write_reason_absence_excel')
+    sys.modules.pop('write_reason_absence_excel', None)